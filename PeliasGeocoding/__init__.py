@@ -38,12 +38,44 @@ def classFactory(iface):  # pylint: disable=invalid-name
     return PeliasTools(iface)
 
 
+def _get_data_dir(base_dir):
+    """
+    Returns the directory for the cache, rate limit budgets and checkpoints.
+    It's in the QGIS profile, since the plugin directory is replaced on
+    every upgrade and may be read-only for system-wide installations.
+
+    :param base_dir: Plugin directory, used outside of QGIS.
+    :type base_dir: str
+
+    :rtype: str
+    """
+    try:
+        from qgis.core import QgsApplication
+        settings_dir = QgsApplication.qgisSettingsDirPath()
+    except ImportError:
+        settings_dir = None
+    if not settings_dir:
+        return base_dir
+
+    data_dir = os.path.join(settings_dir, 'pelias_geocoding')
+    try:
+        os.makedirs(data_dir, exist_ok=True)
+    except OSError:
+        return base_dir
+
+    return data_dir
+
+
 # Define plugin wide constants
 PLUGIN_NAME = 'Pelias Geocoding'
 DEFAULT_COLOR = '#a8b1f5'
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 RESOURCE_PREFIX = ":plugins/PeliasTools/gui/img/"
 PROVIDERS = os.path.join(BASE_DIR, 'providers.yml')
+DATA_DIR = _get_data_dir(BASE_DIR)
+CACHE = os.path.join(DATA_DIR, 'cache.sqlite')
+RATE_LIMITS = os.path.join(DATA_DIR, 'ratelimits.json')
+CHECKPOINTS = os.path.join(DATA_DIR, 'checkpoints')
 
 # Read config.ini
 CONFIG = configparser.ConfigParser()
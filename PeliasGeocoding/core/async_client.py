@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import asyncio
+from concurrent.futures import Future
+from datetime import datetime
+import queue
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.structures import CaseInsensitiveDict
+
+from PeliasGeocoding.core import batch
+from PeliasGeocoding.core.client import _USER_AGENT
+from PeliasGeocoding.core.transport import Response
+from PeliasGeocoding.utils import exceptions, logger
+
+# Seconds to wait for a finished request before checking for cancellation again
+_POLL_INTERVAL = 0.5
+
+# Marks the end of the results of a batch
+_DONE = object()
+
+
+class ConnectionPool:
+    """Pool of keep-alive HTTP/1.1 connections to a single host."""
+
+    def __init__(self, base_url, size=10, timeout=60):
+        """
+        :param base_url: URL of the provider, only scheme, host and port are used.
+        :type base_url: str
+
+        :param size: Maximum number of open connections.
+        :type size: int
+
+        :param timeout: Timeout of a single request in seconds.
+        :type timeout: float
+        """
+        parsed = urlsplit(base_url)
+        self.host = parsed.hostname
+        self.ssl = ssl.create_default_context() if parsed.scheme == 'https' else None
+        self.port = parsed.port or (443 if self.ssl else 80)
+        self.timeout = timeout
+
+        self._host_header = parsed.netloc.rsplit('@', 1)[-1]
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def get(self, target, headers):
+        """
+        Sends a GET request on an idle connection, opening a new one if none is left.
+
+        :param target: Path and query string of the request.
+        :type target: str
+
+        :param headers: Request headers.
+        :type headers: dict
+
+        :raises asyncio.TimeoutError: when the request timed out.
+        :raises OSError: when the connection failed.
+
+        :rtype: Response
+        """
+        async with self._semaphore:
+            start = time.time()
+            while True:
+                reused = bool(self._idle)
+                reader, writer = self._idle.pop() if reused else await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+                try:
+                    response, keep_alive = await asyncio.wait_for(
+                        self._send(reader, writer, target, headers), self.timeout)
+                except asyncio.TimeoutError:
+                    writer.close()
+                    raise
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    # The server might have closed an idle connection in the meantime
+                    if reused:
+                        continue
+                    raise ConnectionError(str(e)) from e
+                except BaseException:
+                    writer.close()
+                    raise
+                break
+
+        response.elapsed = time.time() - start
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+
+        return response
+
+    def close(self):
+        """Closes all idle connections."""
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+    async def _send(self, reader, writer, target, headers):
+        lines = ["GET {} HTTP/1.1".format(target), "Host: {}".format(self._host_header)]
+        lines.extend("{}: {}".format(name, value) for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        version, status_code = status_line.decode('latin-1').split(None, 2)[:2]
+
+        response_headers = CaseInsensitiveDict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and response_headers.get('Connection', '').lower() != 'close'
+        if response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # skip trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b''.join(chunks)
+        elif 'Content-Length' in response_headers:
+            content = await reader.readexactly(int(response_headers['Content-Length']))
+        else:
+            content = await reader.read()
+            keep_alive = False
+
+        return Response(int(status_code), response_headers, content), keep_alive
+
+
+class AsyncClient:
+    """
+    asyncio counterpart of Client, keeping many requests in flight on a
+    small pool of keep-alive connections from a single thread.
+
+    Rate limit, retry policy, response cache and statistics are shared with
+    the wrapped Client, so both can be used for the same provider at once.
+    """
+
+    def __init__(self, clnt, connections=10):
+        """
+        :param clnt: Client of the provider.
+        :type clnt: PeliasGeocoding.core.client.Client
+
+        :param connections: Maximum number of open connections to the provider.
+        :type connections: int
+        """
+        self.clnt = clnt
+        self.connections = connections
+        self.headers = {
+            "User-Agent": _USER_AGENT,
+            "Accept": "application/json",
+            "Connection": "keep-alive"
+        }
+
+    async def request(self, pool, url, params, use_cache=True):
+        """
+        Performs a HTTP GET request with credentials, returning the body as JSON.
+
+        :param pool: Connections to the provider.
+        :type pool: ConnectionPool
+
+        :param url: URL extension for request. Should begin with a slash.
+        :type url: string
+
+        :param params: HTTP GET parameters.
+        :type params: dict or list of key/value tuples
+
+        :param use_cache: Whether to answer from the response cache.
+        :type use_cache: bool
+
+        :raises PeliasGeocoding.utils.exceptions.ApiError: when the API returns an error.
+        :raises PeliasGeocoding.utils.exceptions.Timeout: when the request timed out
+            or retry_timeout passed before it succeeded.
+        :raises PeliasGeocoding.utils.exceptions.NetworkError: when the connection failed
+            on the last retry.
+
+        :returns: Pelias response body
+        :rtype: dict
+        """
+        clnt = self.clnt
+        first_request_time = datetime.now()
+
+        cache_key, result = clnt._get_cached(url, params, use_cache)
+        if result is not None:
+            return result
+
+        # base_url might contain a path, e.g. /v1
+        target = urlsplit(clnt.base_url).path.rstrip('/') + clnt._generate_auth_url(url, params)
+        logger.log("url: {}".format(clnt.base_url + clnt._generate_auth_url(url, params)), 0)
+
+        attempt = 0
+        while True:
+            if datetime.now() - first_request_time > clnt.retry_timeout:
+                raise exceptions.Timeout()
+
+            # Wait for a free slot in the provider's rate limit without blocking the loop
+            await asyncio.sleep(clnt._reserve(first_request_time))
+            clnt.metrics.increment('requests')
+
+            response = None
+            try:
+                sent_at = time.time()
+                response = await pool.get(target, self.headers)
+                clnt.metrics.add_latency(response.elapsed)
+                clnt._on_response(response, sent_at)
+                result = clnt._get_body(response)
+                clnt._on_success(response.elapsed)
+                break
+
+            except asyncio.TimeoutError:
+                error = exceptions.Timeout()
+            except OSError as e:
+                error = exceptions.NetworkError(str(e))
+            except (exceptions.OverQueryLimit,
+                    exceptions.GenericServerError) as e:
+                error = e
+            except Exception as e:
+                logger.log("{}: {}".format(e.__class__.__name__, str(e)), 2)
+                raise
+
+            attempt, sleep_for = clnt._get_retry_delay(error, response, attempt, first_request_time)
+            await asyncio.sleep(sleep_for)
+
+        if cache_key is not None:
+            clnt.cache.set(cache_key, clnt.name, result)
+
+        return result
+
+    async def iter_requests(self, url, items, concurrency=100, use_cache=True, cancelled=None):
+        """
+        Async generator keeping up to concurrency requests in flight and
+        yielding their results in order of completion.
+
+        :param url: URL extension of the endpoint. Should begin with a slash.
+        :type url: str
+
+        :param items: Input ID and request parameters per request.
+        :type items: iterable of (any, dict)
+
+        :param concurrency: Maximum number of requests in flight.
+        :type concurrency: int
+
+        :param use_cache: Whether requests may be answered from the response cache.
+        :type use_cache: bool
+
+        :param cancelled: Set to stop sending requests.
+        :type cancelled: threading.Event
+
+        :returns: yields the input ID and the response body, or the exception
+            raised by its request.
+        :rtype: tuple of (any, dict or Exception)
+        """
+        pool = ConnectionPool(self.clnt.base_url, self.connections, self.clnt.requests_kwargs['timeout'])
+        items = iter(items)
+        pending = dict()
+        exhausted = False
+
+        try:
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    break
+                while not exhausted and len(pending) < batch.max_in_flight(self.clnt, concurrency):
+                    try:
+                        in_id, params = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    task = asyncio.ensure_future(self.request(pool, url, params, use_cache))
+                    pending[task] = in_id
+
+                if not pending:
+                    if exhausted:
+                        break
+                    # Paused while the provider's circuit breaker is open
+                    await asyncio.sleep(_POLL_INTERVAL)
+                    continue
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield pending.pop(task), task.exception() or task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+            pool.close()
+
+
+class AsyncBatchRequester:
+    """Drives an AsyncClient from a worker thread for batch jobs, see BatchRequester."""
+
+    def __init__(self, clnt, url, concurrency=100, use_cache=True, connections=10):
+        """
+        :param clnt: Client to perform the requests with.
+        :type clnt: PeliasGeocoding.core.client.Client
+
+        :param url: URL extension of the endpoint. Should begin with a slash.
+        :type url: str
+
+        :param concurrency: Maximum number of requests in flight.
+        :type concurrency: int
+
+        :param use_cache: Whether requests may be answered from the response cache.
+        :type use_cache: bool
+
+        :param connections: Maximum number of open connections to the provider.
+        :type connections: int
+        """
+        self.async_client = AsyncClient(clnt, connections)
+        self.url = url
+        self.concurrency = concurrency
+        self.use_cache = use_cache
+
+    def run(self, items, feedback):
+        """
+        Generator which runs the requests on an event loop in a worker thread
+        and yields their results in order of completion.
+
+        The items are read in the calling thread before any request is sent,
+        the results are yielded in the calling thread.
+
+        :param items: Input ID and request parameters per request.
+        :type items: iterable of (any, dict)
+
+        :param feedback: Processing feedback to check for cancellation.
+        :type feedback: QgsProcessingFeedback
+
+        :returns: yields the input ID and the finished future of its request
+        :rtype: tuple of (any, concurrent.futures.Future)
+        """
+        items = list(items)
+        results = queue.Queue()
+        cancelled = threading.Event()
+
+        async def main():
+            async for result in self.async_client.iter_requests(self.url, items, self.concurrency, self.use_cache,
+                                                                cancelled):
+                results.put(result)
+
+        loop = asyncio.new_event_loop()
+        main_task = loop.create_task(main())
+
+        def worker():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(main_task)
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                results.put((_DONE, e))
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+                results.put((_DONE, None))
+
+        thread = threading.Thread(target=worker, name='pelias-async', daemon=True)
+        thread.start()
+
+        paused = False
+        try:
+            while True:
+                paused = batch.check_provider(self.async_client.clnt, feedback, paused)
+                try:
+                    in_id, response = results.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    if feedback.isCanceled():
+                        break
+                    continue
+
+                if in_id is _DONE:
+                    if response is not None:
+                        raise response
+                    break
+
+                future = Future()
+                if isinstance(response, Exception):
+                    future.set_exception(response)
+                else:
+                    future.set_result(response)
+                yield in_id, future
+
+                if feedback.isCanceled():
+                    break
+        finally:
+            # Requests still in flight are dropped
+            cancelled.set()
+            try:
+                loop.call_soon_threadsafe(main_task.cancel)
+            except RuntimeError:
+                # the loop finished already
+                pass
+            thread.join()
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from PeliasGeocoding.core.circuitbreaker import CLOSED, HALF_OPEN, OPEN
+from PeliasGeocoding.core.ratelimiter import UNITS, get_limits
+from PeliasGeocoding.utils import exceptions
+
+# Seconds to wait for a finished request before checking for cancellation again
+_POLL_INTERVAL = 0.5
+
+
+def get_concurrency(provider):
+    """
+    Returns the number of requests to keep in flight for a provider.
+
+    The configured concurrency is capped by the provider's per second or per
+    minute limits, since more parallel requests than allowed per second would
+    only cause 429s. Longer windows are budgets, which don't cap it.
+
+    :param provider: A provider from providers.yml
+    :type provider: dict
+
+    :returns: number of concurrent requests
+    :rtype: int
+    """
+    concurrency = max(1, provider.get('concurrency') or 1)
+
+    for limit, unit in get_limits(provider):
+        if UNITS[unit] <= UNITS['minute']:
+            concurrency = min(concurrency, max(1, int(math.ceil(limit / UNITS[unit]))))
+
+    return concurrency
+
+
+def max_in_flight(clnt, concurrency):
+    """
+    Returns the number of requests a batch may currently keep in flight.
+
+    :param clnt: Client performing the requests.
+    :type clnt: PeliasGeocoding.core.client.Client
+
+    :param concurrency: Maximum number of requests in flight of the batch.
+    :type concurrency: int
+
+    :rtype: int
+    """
+    # Only probe the provider while its circuit breaker isn't closed
+    state = clnt.circuit_breaker.state
+    if state == OPEN:
+        return 0
+    if state == HALF_OPEN:
+        return 1
+
+    if clnt.adaptive_concurrency is None:
+        return concurrency
+
+    return min(concurrency, clnt.adaptive_concurrency.limit)
+
+
+def check_provider(clnt, feedback, paused):
+    """
+    Reports when a batch pauses and resumes, because the provider's circuit
+    breaker opened and closed, and aborts it if the provider doesn't recover.
+
+    :param clnt: Client performing the requests.
+    :type clnt: PeliasGeocoding.core.client.Client
+
+    :param feedback: Processing feedback to report to.
+    :type feedback: QgsProcessingFeedback
+
+    :param paused: Whether the batch was paused at the last check.
+    :type paused: bool
+
+    :raises PeliasGeocoding.utils.exceptions.ProviderUnavailable: when the
+        circuit breaker is open for longer than its max_open.
+
+    :returns: whether the batch is paused
+    :rtype: bool
+    """
+    breaker = clnt.circuit_breaker
+    if breaker.state == CLOSED:
+        if paused:
+            feedback.pushInfo("{} is available again, resuming requests.".format(clnt.name))
+        return False
+
+    if breaker.unavailable_for() > breaker.max_open:
+        raise exceptions.ProviderUnavailable(
+            "{} didn't recover within {} seconds, aborting.".format(clnt.name, breaker.max_open)
+        )
+
+    if not paused:
+        feedback.reportError("{} failed repeatedly, pausing requests. Probing it again in {:.0f} seconds.".format(
+            clnt.name, breaker.retry_in()))
+    return True
+
+
+def group_requests(items):
+    """
+    Groups input features with identical request parameters, so every
+    unique request is only sent once.
+
+    :param items: Input ID and request parameters per input feature.
+    :type items: iterable of (any, dict)
+
+    :returns: Input IDs sharing the request and the request parameters, in
+        order of first occurrence.
+    :rtype: list of (list, dict)
+    """
+    groups = OrderedDict()
+    for in_id, params in items:
+        key = tuple(sorted((k, str(v)) for k, v in params.items()))
+        if key in groups:
+            groups[key][0].append(in_id)
+        else:
+            groups[key] = ([in_id], params)
+
+    return list(groups.values())
+
+
+class BatchRequester:
+    """Keeps a bounded number of requests in flight for batch jobs."""
+
+    def __init__(self, clnt, url, concurrency=1, use_cache=True):
+        """
+        :param clnt: Client to perform the requests with.
+        :type clnt: PeliasGeocoding.core.client.Client
+
+        :param url: URL extension of the endpoint. Should begin with a slash.
+        :type url: str
+
+        :param concurrency: Maximum number of requests in flight.
+        :type concurrency: int
+
+        :param use_cache: Whether requests may be answered from the response cache.
+        :type use_cache: bool
+        """
+        self.clnt = clnt
+        self.url = url
+        self.concurrency = concurrency
+        self.use_cache = use_cache
+
+    def run(self, items, feedback):
+        """
+        Generator which dispatches requests to a pool of worker threads and
+        yields their results in order of completion.
+
+        The items are consumed and the results are yielded in the calling
+        thread, so features can be safely read from the input and written
+        to the sink.
+
+        :param items: Input ID and request parameters per request.
+        :type items: iterable of (any, dict)
+
+        :param feedback: Processing feedback to check for cancellation.
+        :type feedback: QgsProcessingFeedback
+
+        :returns: yields the input ID and the finished future of its request
+        :rtype: tuple of (any, concurrent.futures.Future)
+        """
+        items = iter(items)
+        pending = dict()
+        exhausted = False
+        paused = False
+        # Stops requests waiting for the rate limits or a retry, so the workers can be joined
+        cancelled = threading.Event()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                while True:
+                    paused = check_provider(self.clnt, feedback, paused)
+                    while not exhausted and len(pending) < max_in_flight(self.clnt, self.concurrency) \
+                            and not feedback.isCanceled():
+                        try:
+                            in_id, params = next(items)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        future = executor.submit(self.clnt.request, self.url, params,
+                                                 use_cache=self.use_cache, cancelled=cancelled)
+                        pending[future] = in_id
+
+                    if not pending:
+                        if exhausted or feedback.isCanceled():
+                            break
+                        # Paused while the provider's circuit breaker is open
+                        time.sleep(_POLL_INTERVAL)
+                        continue
+
+                    done, _ = wait(pending, timeout=_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future
+
+                    if feedback.isCanceled():
+                        # Requests already sent will finish, queued ones are dropped
+                        for future in pending:
+                            future.cancel()
+                        break
+            finally:
+                cancelled.set()
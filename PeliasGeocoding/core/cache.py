@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from PeliasGeocoding import CACHE, CONFIG
+
+# Evict least recently used entries after this many insertions
+_EVICT_EVERY = 500
+
+
+class ResponseCache:
+    """Persistent SQLite cache for Pelias responses, shared by all clients."""
+
+    def __init__(self, path, max_entries=100000):
+        """
+        :param path: Path to the SQLite database file, created if it doesn't exist.
+        :type path: str
+
+        :param max_entries: Maximum number of cached responses, least recently
+            used ones are evicted first.
+        :type max_entries: int
+        """
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                key TEXT PRIMARY KEY,
+                                provider TEXT NOT NULL,
+                                body TEXT NOT NULL,
+                                empty INTEGER NOT NULL,
+                                created REAL NOT NULL,
+                                accessed REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def get(self, key, ttl, negative_ttl):
+        """
+        Returns the cached response for a request.
+
+        :param key: Cache key of the request.
+        :type key: str
+
+        :param ttl: Seconds a response with results stays valid.
+        :type ttl: float
+
+        :param negative_ttl: Seconds a response without results stays valid.
+        :type negative_ttl: float
+
+        :returns: cached response body or None if there's no valid entry.
+        :rtype: dict
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT body, empty, created FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+
+            body, empty, created = row
+            if now - created > (negative_ttl if empty else ttl):
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+
+        return json.loads(body)
+
+    def set(self, key, provider, body):
+        """
+        Caches a response. Responses without features are cached as well, but
+        expire after the provider's negative TTL.
+
+        :param key: Cache key of the request.
+        :type key: str
+
+        :param provider: Name of the provider which answered the request.
+        :type provider: str
+
+        :param body: Response body.
+        :type body: dict
+        """
+        now = time.time()
+        empty = int(not body.get('features'))
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, provider, json.dumps(body), empty, now, now))
+            self._inserts += 1
+            if self._inserts % _EVICT_EVERY == 0:
+                self._evict()
+            self._conn.commit()
+
+    def clear(self, provider=None):
+        """
+        Deletes cached responses.
+
+        :param provider: Only delete responses of this provider, all if None.
+        :type provider: str
+        """
+        with self._lock:
+            if provider is None:
+                self._conn.execute("DELETE FROM responses")
+            else:
+                self._conn.execute("DELETE FROM responses WHERE provider = ?", (provider,))
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+
+    def _evict(self):
+        """Deletes the least recently used responses exceeding max_entries."""
+        self._conn.execute("""DELETE FROM responses WHERE key IN (
+                                SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)""",
+                           (self.max_entries,))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the plugin wide response cache, opened on first use.
+
+    :rtype: ResponseCache
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(CACHE, CONFIG.getint('cache', 'max_entries', fallback=100000))
+
+    return _cache
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from PeliasGeocoding import CHECKPOINTS
+
+# Commit the journal after this many results or seconds, whatever comes first
+_COMMIT_EVERY = 100
+_COMMIT_INTERVAL = 1
+
+
+def get_path(algorithm, settings, kind='checkpoint'):
+    """
+    Returns the path of the journal of a batch job, which is the same for
+    every run with the same input and settings.
+
+    :param algorithm: Name of the processing algorithm.
+    :type algorithm: str
+
+    :param settings: Everything determining the job's requests, e.g. the input
+        layer, its fields and the request parameters, as strings.
+    :type settings: list of (str, str)
+
+    :param kind: 'checkpoint' or 'incremental', see ResultStore.
+    :type kind: str
+
+    :rtype: str
+    """
+    digest = hashlib.sha1(json.dumps(sorted(settings)).encode('utf-8')).hexdigest()
+    return os.path.join(CHECKPOINTS, "{}_{}_{}.sqlite".format(algorithm, kind, digest[:16]))
+
+
+class Checkpoint:
+    """
+    Append-only SQLite journal of the results of a batch job, so a job
+    which crashed or was cancelled can be resumed without sending the
+    completed requests again.
+
+    Only used from the thread processing the results.
+    """
+
+    # Feedback for jobs which didn't complete
+    resume_hint = ("Kept the checkpoint, run the algorithm again with 'Resume from checkpoint' to "
+                   "only request the remaining input features.")
+
+    def __init__(self, path, resume=False):
+        """
+        :param path: Path of the journal, created if it doesn't exist.
+        :type path: str
+
+        :param resume: Whether to keep the results journaled by an earlier run,
+            otherwise the journal starts empty.
+        :type resume: bool
+        """
+        self.path = path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not resume:
+            self._delete_files()
+
+        self._pending = 0
+        self._committed_at = time.time()
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                id INTEGER PRIMARY KEY,
+                                provider TEXT,
+                                body TEXT NOT NULL)""")
+        self._create_tables()
+        self._conn.commit()
+
+    def _create_tables(self):
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS completed (
+                                in_id TEXT PRIMARY KEY,
+                                response INTEGER NOT NULL)""")
+
+    def split(self, items):
+        """
+        Separates the input features completed by an earlier run from those
+        still to be requested.
+
+        :param items: Input ID and request parameters per input feature.
+        :type items: iterable of (any, dict)
+
+        :returns: items to request, and input ID and journal ID of the response
+            per completed input feature
+        :rtype: tuple of (list of (any, dict), list of (any, int))
+        """
+        completed = dict(self._conn.execute("SELECT in_id, response FROM completed"))
+        if not completed:
+            return list(items), []
+
+        pending, done = [], []
+        for in_id, params in items:
+            response_id = completed.get(repr(in_id))
+            if response_id is None:
+                pending.append((in_id, params))
+            else:
+                done.append((in_id, response_id))
+
+        return pending, done
+
+    def replay(self, done):
+        """
+        Generator of the journaled responses of completed input features.
+
+        :param done: Input ID and journal ID of the response, see split().
+        :type done: list of (any, int)
+
+        :returns: yields input ID, name of the answering provider and response
+        :rtype: tuple of (any, str, dict)
+        """
+        response_id = provider = response = None
+        for in_id, next_id in done:
+            # Input features sharing a request were journaled together
+            if next_id != response_id:
+                response_id = next_id
+                provider, body = self._conn.execute("SELECT provider, body FROM responses WHERE id = ?",
+                                                    (response_id,)).fetchone()
+                response = json.loads(body)
+            yield in_id, provider, response
+
+    def add(self, in_ids, provider, response):
+        """
+        Journals the response of a request.
+
+        :param in_ids: Input IDs of the features sharing the request.
+        :type in_ids: list
+
+        :param provider: Name of the answering provider, if requests are spread across a pool.
+        :type provider: str
+
+        :param response: Response body.
+        :type response: dict
+        """
+        cursor = self._conn.execute("INSERT INTO responses (provider, body) VALUES (?, ?)",
+                                    (provider, json.dumps(response)))
+        self._conn.executemany("INSERT OR REPLACE INTO completed VALUES (?, ?)",
+                               ((repr(in_id), cursor.lastrowid) for in_id in in_ids))
+
+        self._pending += 1
+        if self._pending >= _COMMIT_EVERY or time.time() - self._committed_at >= _COMMIT_INTERVAL:
+            self._commit()
+
+    def close(self):
+        """Commits the journal, keeping it to resume the job."""
+        self._commit()
+        self._conn.close()
+
+    def complete(self):
+        """Deletes the journal once the job is complete, after close()."""
+        self._delete_files()
+
+    def _commit(self):
+        self._conn.commit()
+        self._pending = 0
+        self._committed_at = time.time()
+
+    def _delete_files(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+class ResultStore(Checkpoint):
+    """
+    Persistent results of a batch job's earlier runs, per input ID with a
+    hash of its request, to only request new or changed input features.
+    The results of interrupted runs are kept as well.
+    """
+
+    resume_hint = "Kept the results, run the algorithm again to only request the remaining input features."
+
+    def __init__(self, path, signature):
+        """
+        :param path: Path of the store, created if it doesn't exist.
+        :type path: str
+
+        :param signature: Everything determining the requests besides the
+            per feature parameters, e.g. the provider and constant parameters.
+        :type signature: list of (str, str)
+        """
+        Checkpoint.__init__(self, path, resume=True)
+
+        self.signature = json.dumps(sorted(signature))
+        # Hash of the request per input ID to be requested in this run
+        self._hashes = dict()
+
+    def _create_tables(self):
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                                in_id TEXT PRIMARY KEY,
+                                hash TEXT NOT NULL,
+                                response INTEGER NOT NULL)""")
+
+    def split(self, items):
+        """
+        Separates the input features whose request didn't change since it was
+        answered from those still to be requested, see Checkpoint.split. The
+        results of input IDs which are gone from the input are deleted.
+        """
+        stored = {in_id: (request_hash, response_id)
+                  for in_id, request_hash, response_id in self._conn.execute("SELECT * FROM results")}
+
+        pending, done = [], []
+        for in_id, params in items:
+            key = repr(in_id)
+            request_hash = self._hash(params)
+            request_hash_stored, response_id = stored.pop(key, (None, None))
+            if request_hash == request_hash_stored:
+                done.append((in_id, response_id))
+            else:
+                self._hashes[key] = request_hash
+                pending.append((in_id, params))
+
+        # Their responses are deleted with complete()
+        if stored:
+            self._conn.executemany("DELETE FROM results WHERE in_id = ?", ((key,) for key in stored))
+            self._commit()
+
+        return pending, done
+
+    def add(self, in_ids, provider, response):
+        """Stores the response of a request, see Checkpoint.add."""
+        cursor = self._conn.execute("INSERT INTO responses (provider, body) VALUES (?, ?)",
+                                    (provider, json.dumps(response)))
+        self._conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                               ((repr(in_id), self._hashes[repr(in_id)], cursor.lastrowid) for in_id in in_ids))
+
+        self._pending += 1
+        if self._pending >= _COMMIT_EVERY or time.time() - self._committed_at >= _COMMIT_INTERVAL:
+            self._commit()
+
+    def complete(self):
+        """Deletes responses replaced by newer ones, after close()."""
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("DELETE FROM responses WHERE id NOT IN (SELECT response FROM results)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _hash(self, params):
+        request = json.dumps([self.signature, sorted((str(k), str(v)) for k, v in params.items())])
+        return hashlib.sha1(request.encode('utf-8')).hexdigest()
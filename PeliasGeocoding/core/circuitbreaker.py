@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+import time
+
+from PeliasGeocoding.utils import exceptions, logger
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker tracking the health of a provider.
+
+    After threshold consecutive connection errors, timeouts or HTTP 5xx the
+    circuit opens and requests fail fast for the cool-down. Then it's
+    half-open and single probe requests are let through, until one
+    succeeds and closes the circuit or fails and opens it again.
+    """
+
+    def __init__(self, threshold=5, cooldown=30, probe_interval=5, max_open=600):
+        """
+        :param threshold: Consecutive failures which open the circuit, 0 disables it.
+        :type threshold: int
+
+        :param cooldown: Seconds the circuit stays open before probing the provider.
+        :type cooldown: float
+
+        :param probe_interval: Seconds between probe requests while half-open.
+        :type probe_interval: float
+
+        :param max_open: Seconds batch jobs wait for the provider to recover
+            before they're aborted.
+        :type max_open: float
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self.max_open = max_open
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._outage_since = None
+        self._next_probe = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_provider(cls, provider):
+        """
+        Builds the breaker from the optional 'circuit_breaker' settings of a provider.
+
+        :param provider: A provider from providers.yml
+        :type provider: dict
+
+        :rtype: CircuitBreaker
+        """
+        return cls(**(provider.get('circuit_breaker') or {}))
+
+    @property
+    def state(self):
+        """One of CLOSED, OPEN or HALF_OPEN."""
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def allow(self):
+        """
+        :returns: whether a request may be sent now.
+        :rtype: bool
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and time.time() >= self._next_probe:
+                self._next_probe = time.time() + self.probe_interval
+                return True
+            return False
+
+    def retry_in(self):
+        """
+        :returns: seconds until the next request is let through.
+        :rtype: float
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == OPEN:
+                return self._opened_at + self.cooldown - time.time()
+            if self._state == HALF_OPEN:
+                return max(0.0, self._next_probe - time.time())
+            return 0.0
+
+    def unavailable_for(self):
+        """
+        :returns: seconds since the circuit opened, 0 while it's closed.
+        :rtype: float
+        """
+        with self._lock:
+            return 0.0 if self._outage_since is None else time.time() - self._outage_since
+
+    def on_success(self):
+        """Records a response from the provider, closing the circuit."""
+        with self._lock:
+            if self._state != CLOSED:
+                logger.log("Provider is available again, closing the circuit.", 0)
+            self._state = CLOSED
+            self._failures = 0
+            self._outage_since = None
+
+    def on_failure(self, error):
+        """
+        Records a failed request, opening the circuit if the provider seems down.
+
+        :param error: Error raised by the request.
+        :type error: Exception
+        """
+        if not self.threshold or not self.is_failure(error):
+            return
+
+        with self._lock:
+            self._update_state()
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.threshold:
+                if self._state != OPEN:
+                    logger.log("{} consecutive failures, last {}: {}. Pausing requests for {} seconds.".format(
+                        self._failures, error.__class__.__name__, str(error), self.cooldown), 1)
+                self._state = OPEN
+                self._opened_at = time.time()
+                if self._outage_since is None:
+                    self._outage_since = self._opened_at
+
+    @staticmethod
+    def is_failure(error):
+        """
+        :param error: Error raised by a request.
+        :type error: Exception
+
+        :returns: whether the error means the provider is down.
+        :rtype: bool
+        """
+        if isinstance(error, (exceptions.Timeout, exceptions.NetworkError)):
+            return True
+        if isinstance(error, exceptions.GenericServerError):
+            try:
+                return int(error.status) >= 500
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _update_state(self):
+        if self._state == OPEN and time.time() >= self._opened_at + self.cooldown:
+            self._state = HALF_OPEN
+            self._next_probe = 0
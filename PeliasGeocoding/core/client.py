@@ -21,19 +21,108 @@
  ***************************************************************************/
 """
 
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import copy
 from datetime import datetime, timedelta
 import requests
+import threading
 import time
-import collections
 from urllib.parse import urlencode
+import weakref
 
 from PyQt5.QtCore import pyqtSignal, QObject
 
 from PeliasGeocoding import __version__
-from PeliasGeocoding.utils import logger, exceptions
+from PeliasGeocoding.core import batch, cache, retry, transport
+from PeliasGeocoding.core.circuitbreaker import CircuitBreaker, CLOSED, OPEN
+from PeliasGeocoding.core.concurrency import AdaptiveConcurrency
+from PeliasGeocoding.core.hedging import HedgePolicy
+from PeliasGeocoding.core.metrics import Metrics
+from PeliasGeocoding.core.query import PreparedQuery
+from PeliasGeocoding.core.ratelimiter import RateLimiter, DEFAULT_HEADERS, get_limits, parse_rate_limit_headers
+from PeliasGeocoding.utils import configmanager, logger, exceptions
+
+try:
+    # Optional, decodes large responses considerably faster
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 _USER_AGENT = "PeliasQGISClient@v{}".format(__version__)
 
+# Seconds between checks for cancellation while waiting for a hedged pair
+_POLL_INTERVAL = 0.5
+
+
+_clients = dict()
+_clients_lock = threading.Lock()
+
+
+def get_client(provider):
+    """
+    Returns the long-lived client of a provider, so all tools share its
+    connection pool, rate limit and statistics. A new client is created
+    when the provider's settings changed. The replaced client isn't closed,
+    as running jobs might still use it, it's closed once garbage collected.
+
+    :param provider: A provider from providers.yml
+    :type provider: dict
+
+    :rtype: Client
+    """
+    with _clients_lock:
+        clnt, settings = _clients.get(provider['name'], (None, None))
+        if clnt is None or settings != provider:
+            clnt = Client(provider)
+            _clients[provider['name']] = (clnt, copy.deepcopy(provider))
+
+    return clnt
+
+
+def close_clients():
+    """Closes the connections of all clients, e.g. when the plugin is unloaded."""
+    with _clients_lock:
+        for clnt, _ in _clients.values():
+            clnt.close()
+        _clients.clear()
+
+
+def _close(transport, hedge_executor, rate_limiter):
+    """Closes the connections of a client and persists its rate limit budget."""
+    transport.close()
+    if hedge_executor is not None:
+        hedge_executor.shutdown(wait=False)
+    rate_limiter.save()
+
+
+def _truncate(text, length=200):
+    """
+    :returns: the start of a response text for error messages
+    :rtype: str
+    """
+    text = (text or '').strip()
+    return text if len(text) <= length else text[:length] + '...'
+
+
+def _sleep(seconds, cancelled=None):
+    """
+    Sleeps, unless the request is cancelled.
+
+    :param seconds: Seconds to sleep.
+    :type seconds: float
+
+    :param cancelled: Ends the sleep early when set.
+    :type cancelled: threading.Event
+
+    :returns: whether the request was cancelled
+    :rtype: bool
+    """
+    if cancelled is None:
+        time.sleep(seconds)
+        return False
+
+    return cancelled.wait(seconds) if seconds > 0 else cancelled.is_set()
+
 
 class Client(QObject):
     """Performs requests to Pelias API services."""
@@ -53,12 +142,13 @@ class Client(QObject):
         """
         QObject.__init__(self)
 
+        self.name = provider['name']
         self.key = provider['key']
         self.base_url = provider['base_url']
-        self.limit = provider['limit']
-        self.limit_unit = provider['unit']
+        self.endpoints = provider.get('endpoints') or {}
+        self.limits = get_limits(provider)
         
-        self.session = requests.Session()
+        self.transport = transport.get_transport(provider)
 
         self.retry_timeout = timedelta(seconds=retry_timeout)
         self.requests_kwargs = dict()
@@ -68,29 +158,116 @@ class Client(QObject):
             'timeout': 60
         })
 
-        self.sent_times = collections.deque("", self.limit)
+        self.rate_limiter = RateLimiter(self.limits, self.name)
+        self.rate_limit_headers = dict(DEFAULT_HEADERS, **(provider.get('rate_limit_headers') or {}))
+        self.retry_policy = retry.RetryPolicy.from_provider(provider)
+        self.circuit_breaker = CircuitBreaker.from_provider(provider)
+        self.metrics = Metrics()
+
+        # Discovers how many requests the provider takes in flight, up to the configured concurrency
+        self.adaptive_concurrency = None
+        if provider.get('adaptive_concurrency', True) and batch.get_concurrency(provider) > 1:
+            self.adaptive_concurrency = AdaptiveConcurrency(batch.get_concurrency(provider))
+
+        # Duplicates slow requests, each request and its hedge wait in their own thread
+        self.hedge_policy = HedgePolicy.from_provider(provider)
+        self._hedge_executor = None
+        self._hedge_provider = None
+        if self.hedge_policy is not None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=2 * batch.get_concurrency(provider) + 2)
+
+        # Cache TTLs are configured in days, a TTL of 0 disables the cache
+        self.cache_ttl = (provider.get('cache_ttl') or 0) * 86400
+        self.cache_negative_ttl = self._get_cache_negative_ttl(provider) * 86400
+        self.cache = cache.get_cache() if self.cache_ttl else None
+
+        # Save some references to retrieve in client instances, per thread
+        # as a client is shared by all tools using the same provider
+        self._local = threading.local()
+
+        # Closes replaced clients once the last job using them is done
+        self._finalizer = weakref.finalize(self, _close, self.transport, self._hedge_executor, self.rate_limiter)
 
-        # Save some references to retrieve in client instances
-        self.url = None
-        self.warnings = None
+    @staticmethod
+    def _get_cache_negative_ttl(provider):
+        """
+        :param provider: A provider from providers.yml
+        :type provider: dict
+
+        :returns: days until cached responses without results expire, 1 if
+            'cache_negative_ttl' is missing, empty or invalid.
+        :rtype: float
+        """
+        # Empty keys in providers.yml are None, but 0 days is a valid TTL
+        value = provider.get('cache_negative_ttl')
+        if value is None or value == '':
+            return 1
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            logger.log("Invalid cache_negative_ttl {!r} of {}, using 1 day.".format(value, provider['name']), 1)
+            return 1
+
+    @property
+    def url(self):
+        """URL of the last request sent from the current thread."""
+        return getattr(self._local, 'url', None)
+
+    @url.setter
+    def url(self, value):
+        self._local.url = value
+
+    @property
+    def warnings(self):
+        """Warnings of the last response received in the current thread."""
+        return getattr(self._local, 'warnings', None)
+
+    @warnings.setter
+    def warnings(self, value):
+        self._local.warnings = value
+
+    def close(self):
+        """Closes the connections and persists the rate limit budget."""
+        self._finalizer()
+
+    def warm_up(self):
+        """
+        Connects to the provider in the background, ahead of the first request.
+        Only the requests transport keeps the connection for its worker threads.
+        The warm-up request counts against the rate limits, it's skipped if
+        they don't allow a request right away.
+        """
+        if not hasattr(self.transport, 'warm_up'):
+            return
+        if self.rate_limiter.reserve(max_wait=0) > 0:
+            return
+
+        self.transport.warm_up(self.base_url)
+
+    def save_state(self):
+        """Persists the rate limit budget, e.g. after a batch job."""
+        self.rate_limiter.save()
 
     overQueryLimit = pyqtSignal("int")
     def request(self, 
                 url, params,
                 first_request_time=None,
                 requests_kwargs=None,
-                post_json=None):
+                post_json=None,
+                use_cache=True,
+                cancelled=None):
         """Performs HTTP GET/POST with credentials, returning the body asdlg
         JSON.
 
-        :param url: URL extension for request. Should begin with a slash.
-        :type url: string
+        :param url: URL extension for request. Should begin with a slash. A
+            prepared query adds its constant parameters to params.
+        :type url: string or PeliasGeocoding.core.query.PreparedQuery
 
         :param params: HTTP GET parameters.
         :type params: dict or list of key/value tuples
 
-        :param first_request_time: The time of the first request (None if no
-            retries have occurred).
+        :param first_request_time: The time of the first request, the request
+            times out when it can't be sent within retry_timeout after it.
         :type first_request_time: datetime.datetime
 
         :param requests_kwargs: Same extra keywords arg for requests as per
@@ -101,33 +278,65 @@ class Client(QObject):
         :param post_json: Parameters for POST endpoints
         :type post_json: dict
 
-        :raises PeliasGeocoding.utils.exceptions.ApiError: when the API returns an error.
+        :param use_cache: Whether to answer from the response cache. If False,
+            the request is sent anyway and its response refreshes the cache.
+        :type use_cache: bool
 
-        :returns: openrouteservice response body
+        :param cancelled: Set to stop the request, e.g. when its batch job is
+            cancelled. It isn't sent (again) anymore and stops waiting for the
+            rate limits or a retry.
+        :type cancelled: threading.Event
+
+        :raises PeliasGeocoding.utils.exceptions.ApiError: when the API returns an error.
+        :raises PeliasGeocoding.utils.exceptions.Timeout: when the request timed out
+            or retry_timeout passed before it succeeded.
+        :raises PeliasGeocoding.utils.exceptions.NetworkError: when the connection failed
+            on the last retry.
+        :raises PeliasGeocoding.utils.exceptions.ProviderUnavailable: when the provider
+            failed repeatedly and its circuit breaker is open.
+
+        :returns: openrouteservice response body, None if cancelled
         :rtype: dict
         """
 
         if not first_request_time:
             first_request_time = datetime.now()
 
-        elapsed = datetime.now() - first_request_time
-        if elapsed > self.retry_timeout:
-            raise exceptions.Timeout()
+        if self.hedge_policy is not None and post_json is None:
+            return self._hedged_request(url, params, first_request_time, requests_kwargs, use_cache, cancelled)
+
+        return self._send(url, params, first_request_time, requests_kwargs, post_json, use_cache, cancelled)
+
+    def _send(self, url, params, first_request_time, requests_kwargs, post_json, use_cache, cancelled):
+        """
+        Sends the request without hedging and retries it, see request.
 
+        :returns: the response body, None if cancelled
+        :rtype: dict
+        """
         authed_url = self._generate_auth_url(url,
                                              params,
                                              )
         self.url = self.base_url + authed_url
+
+        cache_key = None
+        if post_json is None:
+            cache_key, result = self._get_cached(url, params, use_cache)
+            if result is not None:
+                self.warnings = result['geocoding'].get('warnings')
+                return result
+
         # Default to the client-level self.requests_kwargs, with method-level
         # requests_kwargs arg overriding.
-        requests_kwargs = requests_kwargs or {}
-        final_requests_kwargs = dict(self.requests_kwargs, **requests_kwargs)
+        final_requests_kwargs = self.requests_kwargs
+        if requests_kwargs or post_json is not None:
+            final_requests_kwargs = dict(self.requests_kwargs, **(requests_kwargs or {}))
         
         # Determine GET/POST
-        requests_method = self.session.get
+        method = 'GET'
         # Keep for future compatibility of POST
         if post_json is not None:
-            requests_method = self.session.post
+            method = 'POST'
             final_requests_kwargs["json"] = post_json
 
         logger.log(
@@ -138,40 +347,303 @@ class Client(QObject):
             0
         )
 
+        attempt = 0
+        while True:
+            elapsed = datetime.now() - first_request_time
+            if elapsed > self.retry_timeout:
+                raise exceptions.Timeout()
+
+            if cancelled is not None and cancelled.is_set():
+                return None
+
+            # Wait for a free slot in the provider's rate limits
+            if _sleep(self._reserve(first_request_time), cancelled):
+                return None
+            self.metrics.increment('requests')
+
+            response = None
+            try:
+                start = time.time()
+                response = self.transport.request(
+                    method,
+                    self.base_url + authed_url,
+                    **final_requests_kwargs
+                )
+                latency = time.time() - start
+                self.metrics.add_latency(latency)
+                self._on_response(response, start)
+                result = self._get_body(response)
+                self._on_success(latency)
+                break
+
+            except (exceptions.Timeout,
+                    exceptions.NetworkError,
+                    exceptions.OverQueryLimit,
+                    exceptions.GenericServerError) as e:
+                error = e
+            except Exception as e:
+                logger.log("{}: {}".format(e.__class__.__name__, str(e)), 2)
+                raise
+
+            attempt, sleep_for = self._get_retry_delay(error, response, attempt, first_request_time)
+            if _sleep(sleep_for, cancelled):
+                return None
+
+        if cache_key is not None:
+            self.cache.set(cache_key, self.name, result)
+
+        # Write warnings
+        self.warnings = result['geocoding'].get('warnings')
+
+        return result
+
+
+    def _hedged_request(self, url, params, first_request_time, requests_kwargs, use_cache, cancelled=None):
+        """
+        Sends the request from a worker thread and, if it isn't answered within
+        the hedging percentile of the recent latencies, a duplicate to this or
+        the alternate provider. The first response wins, the other request isn't
+        sent anymore if it's still waiting or retrying, else its response is dropped.
+
+        Hedges count against the rate limits and are only sent if the provider
+        has a free slot right away and its circuit is closed.
+
+        :param cancelled: Set to stop both requests, see request.
+        :type cancelled: threading.Event
+
+        :returns: the response body of the first successful request, None if cancelled
+        :rtype: dict
+        """
+        self.url = self.base_url + self._generate_auth_url(url, params)
+
+        # Stops the other request of the pair, shared requests of a batch keep running
+        pair_cancelled = threading.Event()
+        args = (first_request_time, requests_kwargs, None, use_cache, pair_cancelled)
+        primary = self._hedge_executor.submit(self._send, url, params, *args)
+        futures = [primary]
+
+        delay = self.hedge_policy.get_delay(self.metrics)
+        if delay is not None and not wait(futures, timeout=delay).done:
+            target, target_url = self._get_hedge_target(url)
+            if target.circuit_breaker.state == CLOSED and target.rate_limiter.peek() == 0:
+                self.metrics.increment('hedges')
+                futures.append(self._hedge_executor.submit(target._send, target_url, params, *args))
+
+        error = None
         try:
-            response = requests_method(
-                self.base_url + authed_url,
-                **final_requests_kwargs
+            while futures:
+                if cancelled is None:
+                    wait(futures, return_when=FIRST_COMPLETED)
+                elif not wait(futures, timeout=_POLL_INTERVAL, return_when=FIRST_COMPLETED).done \
+                        and cancelled.is_set():
+                    return None
+                for future in [future for future in futures if future.done()]:
+                    futures.remove(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Wait for the other request, but rather report the original error
+                        if error is None or future is primary:
+                            error = e
+                        continue
+
+                    if future is not primary:
+                        self.metrics.increment('hedge_wins')
+                    self.warnings = result['geocoding'].get('warnings')
+                    return result
+
+            raise error
+        finally:
+            pair_cancelled.set()
+            for future in futures:
+                future.cancel()
+
+    def _get_hedge_target(self, url):
+        """
+        :param url: URL extension of the hedged request.
+        :type url: str or PeliasGeocoding.core.query.PreparedQuery
+
+        :returns: client to send hedges to and its URL extension for the same endpoint
+        :rtype: tuple of (Client, str or PeliasGeocoding.core.query.PreparedQuery)
+        """
+        alternate = self.hedge_policy.alternate
+        if not alternate or alternate == self.name:
+            return self, url
+
+        if self._hedge_provider is None:
+            providers = configmanager.read_config()['providers']
+            self._hedge_provider = next((provider for provider in providers if provider['name'] == alternate), None)
+            if self._hedge_provider is None:
+                logger.log("Hedging provider {} not found in providers.yml, hedging to {}.".format(
+                    alternate, self.name), 1)
+                self._hedge_provider = False
+        if not self._hedge_provider:
+            return self, url
+
+        query = url if isinstance(url, PreparedQuery) else None
+        if query is not None:
+            url = query.path
+        endpoint = next((name for name, path in self.endpoints.items() if path == url), None)
+        alternate_url = (self._hedge_provider.get('endpoints') or {}).get(endpoint, url)
+        if query is not None:
+            alternate_url = query.with_path(alternate_url)
+
+        return get_client(self._hedge_provider), alternate_url
+
+    def _get_cached(self, url, params, use_cache=True):
+        """
+        Looks up a GET request in the response cache.
+
+        :param url: URL extension for request.
+        :type url: string
+
+        :param params: HTTP GET parameters.
+        :type params: dict or list of key/value tuples
+
+        :param use_cache: If False, only the cache key is returned, so the
+            response refreshes the cache.
+        :type use_cache: bool
+
+        :returns: the cache key, None if the cache is disabled, and the cached
+            response or None.
+        :rtype: tuple of (str, dict)
+        """
+        if self.cache is None:
+            return None, None
+
+        cache_key = self._generate_cache_key(url, params)
+        result = None
+        if use_cache:
+            result = self.cache.get(cache_key, self.cache_ttl, self.cache_negative_ttl)
+            if result is not None:
+                self.metrics.increment('cache_hits')
+
+        return cache_key, result
+
+    def _reserve(self, first_request_time):
+        """
+        Reserves a slot in the provider's rate limits within retry_timeout, if
+        the provider is available.
+
+        :param first_request_time: The time of the first request.
+        :type first_request_time: datetime.datetime
+
+        :raises PeliasGeocoding.utils.exceptions.ProviderUnavailable: when the
+            circuit breaker is open.
+        :raises PeliasGeocoding.utils.exceptions.OverQueryLimit: when the limits
+            allow no request within retry_timeout, e.g. the daily budget is used up.
+
+        :returns: seconds to wait until the request may be sent
+        :rtype: float
+        """
+        if not self.circuit_breaker.allow():
+            raise exceptions.ProviderUnavailable(
+                "{} failed repeatedly, requests are paused for {:.0f} seconds".format(
+                    self.name, self.circuit_breaker.retry_in())
             )
-        except requests.exceptions.Timeout:
-            raise exceptions.Timeout()
 
-        try:
-            result = self._get_body(response)
-            self.sent_times.append(time.time())
+        max_wait = (self.retry_timeout - (datetime.now() - first_request_time)).total_seconds()
+        wait = self.rate_limiter.reserve(max_wait)
+        if wait > max_wait:
+            raise exceptions.OverQueryLimit(
+                "Rate limit",
+                "The provider's limits allow the next request in {:.0f} seconds".format(wait)
+            )
 
-        except exceptions.OverQueryLimit as e:
-            elapsed_since_earliest = time.time() - self.sent_times[0]
-            interval = 60 if self.limit_unit == 'minute' else 1
-            sleep_for = interval - elapsed_since_earliest
+        return wait
 
-            # let the client know smth happened
-            self.overQueryLimit.emit(sleep_for)
-            logger.log("{}: {}".format(e.__class__.__name__, str(e)), 1)
+    def _on_response(self, response, sent_at):
+        """
+        Records the provider's health and feeds its rate limit headers into
+        request pacing.
 
-            time.sleep(sleep_for)
+        :param response: The HTTP response.
+        :type response: requests.Response
 
-            return self.request(url, params, first_request_time, requests_kwargs, post_json)
+        :param sent_at: Time the request was sent.
+        :type sent_at: float
+        """
+        if response.status_code < 500:
+            self.circuit_breaker.on_success()
 
-        except Exception as e:
-            logger.log("{}: {}".format(e.__class__.__name__, str(e)), 2)
-            raise
+        quota = parse_rate_limit_headers(response.headers, self.rate_limit_headers)
+        if quota is not None:
+            self.rate_limiter.update_quota(*quota, sent_at=sent_at)
 
-        # Write warnings
-        self.warnings = result['geocoding'].get('warnings')
+    def _on_success(self, latency):
+        """
+        Records a successful request.
 
-        return result
+        :param latency: Seconds from sending the request to receiving the response.
+        :type latency: float
+        """
+        if self.adaptive_concurrency is not None:
+            self.adaptive_concurrency.on_success(latency)
+
+    def _get_retry_delay(self, error, response, attempt, first_request_time):
+        """
+        Decides whether a failed request is sent again and records the retry.
+
+        :param error: Error raised by the request.
+        :type error: Exception
+
+        :param response: The HTTP response, if any was received.
+        :type response: requests.Response
+
+        :param attempt: Number of retries so far.
+        :type attempt: int
+
+        :param first_request_time: The time of the first request.
+        :type first_request_time: datetime.datetime
+
+        :raises PeliasGeocoding.utils.exceptions.ProviderUnavailable: if the
+            error opened the circuit breaker.
+        :raises Exception: the error, if the request is not retried.
+
+        :returns: the number of retries so far and the seconds to sleep before the next attempt.
+        :rtype: tuple of (int, float)
+        """
+        self.circuit_breaker.on_failure(error)
+        if self.adaptive_concurrency is not None:
+            self.adaptive_concurrency.on_error(error)
+
+        # Don't wait for a retry which the open circuit won't let through
+        if self.circuit_breaker.state == OPEN:
+            logger.log("{}: {}".format(error.__class__.__name__, str(error)), 2)
+            raise exceptions.ProviderUnavailable(
+                "{} failed repeatedly, last {}: {}".format(self.name, error.__class__.__name__, str(error))
+            )
+
+        # Rate limit rejections don't count as retries, they are only bounded by retry_timeout
+        over_query_limit = isinstance(error, exceptions.OverQueryLimit)
+        if not self.retry_policy.is_retriable(error) or \
+                (not over_query_limit and attempt >= self.retry_policy.max_retries):
+            logger.log("{}: {}".format(error.__class__.__name__, str(error)), 2)
+            raise error
+
+        retry_after = retry.parse_retry_after(response.headers) if response is not None else None
+        if over_query_limit:
+            sleep_for = self.rate_limiter.throttle(retry_after)
+            # let the client know smth happened
+            self.overQueryLimit.emit(int(round(sleep_for)))
+        else:
+            attempt += 1
+            sleep_for = self.retry_policy.get_delay(attempt, retry_after)
 
+        if datetime.now() + timedelta(seconds=sleep_for) - first_request_time > self.retry_timeout:
+            logger.log("{}: {}".format(error.__class__.__name__, str(error)), 2)
+            raise error
+
+        self.metrics.increment('retries')
+        self.metrics.increment('retries_' + error.__class__.__name__)
+        self.metrics.add_time('retry_wait', sleep_for)
+        logger.log("{}: {}. Retrying in {:.1f} seconds".format(error.__class__.__name__, str(error), sleep_for), 1)
+
+        # the rate limiter already delays the next request after a 429
+        if over_query_limit:
+            sleep_for = 0
+
+        return attempt, sleep_for
 
     @staticmethod
     def _get_body(response):
@@ -185,17 +657,23 @@ class Client(QObject):
         :raises PeliasGeocoding.utils.exceptions.ApiError: when the backend API throws an error, HTTP 400
         :raises PeliasGeocoding.utils.exceptions.InvalidKey: when API key is invalid (or quota is exceeded), HTTP 403
         :raises PeliasGeocoding.utils.exceptions.GenericServerError: all other HTTP errors
+            and responses which aren't a Pelias response, e.g. HTML error pages
 
         :returns: response body
         :rtype: dict
         """
-        body = response.json()
         status_code = response.status_code
-        
+        try:
+            # Straight from the bytes, without decoding the text first
+            body = json_loads(response.content)
+        except ValueError:
+            # e.g. HTML error pages of proxies
+            body = None
+
         if status_code == 429:
             raise exceptions.OverQueryLimit(
                 str(status_code),
-                str(body)
+                str(body) if body is not None else _truncate(response.text)
             )
 
         if status_code == 401:
@@ -206,9 +684,13 @@ class Client(QObject):
 
         # Internal error message for Bad Request
         if status_code == 400:
+            try:
+                message = "\n".join(body['geocoding']['errors'])
+            except (KeyError, TypeError):
+                message = _truncate(response.text)
             raise exceptions.ApiError(
                 str(status_code),
-                "\n".join(body['geocoding']['errors'])
+                message
             )
 
         if status_code == 403:
@@ -220,7 +702,13 @@ class Client(QObject):
         if status_code != 200:
             raise exceptions.GenericServerError(
                 status_code,
-                body
+                body if body is not None else _truncate(response.text)
+            )
+
+        if not isinstance(body, dict) or not isinstance(body.get('geocoding'), dict):
+            raise exceptions.GenericServerError(
+                status_code,
+                "Invalid response: " + _truncate(response.text)
             )
 
         return body
@@ -230,7 +718,7 @@ class Client(QObject):
         adding any necessary parameters.
 
         :param path: The path portion of the URL.
-        :type path: string
+        :type path: string or PeliasGeocoding.core.query.PreparedQuery
 
         :param params: URL parameters.
         :type params: dict or list of key/value tuples
@@ -238,7 +726,9 @@ class Client(QObject):
         :returns: encoded URL
         :rtype: string
         """
-        
+        if isinstance(path, PreparedQuery):
+            return path.url(params, self.key)
+
         if type(params) is dict:
             params = sorted(dict(**params).items())
         
@@ -247,4 +737,26 @@ class Client(QObject):
         if self.key != '':
             params.append(("api_key", self.key))
 
-        return path + "?" + requests.utils.unquote_unreserved(urlencode(params))
\ No newline at end of file
+        return path + "?" + requests.utils.unquote_unreserved(urlencode(params))
+
+    def _generate_cache_key(self, path, params):
+        """Returns the key of a request in the response cache. The API key is
+        left out, so cached responses survive a change of key.
+
+        :param path: The path portion of the URL.
+        :type path: string or PeliasGeocoding.core.query.PreparedQuery
+
+        :param params: URL parameters.
+        :type params: dict or list of key/value tuples
+
+        :returns: normalized URL without API key
+        :rtype: string
+        """
+        if isinstance(path, PreparedQuery):
+            return self.base_url.rstrip('/') + '/' + path.path.lstrip('/') + "?" + path.cache_query(params)
+
+        if type(params) is dict:
+            params = params.items()
+        params = sorted((str(k), str(v)) for k, v in params if k != 'api_key')
+
+        return self.base_url.rstrip('/') + '/' + path.lstrip('/') + "?" + urlencode(params)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import collections
+import threading
+import time
+
+from PeliasGeocoding.utils import exceptions
+
+
+class AdaptiveConcurrency:
+    """
+    Thread-safe AIMD controller for the number of requests in flight.
+
+    The limit starts at the minimum and doubles every round trip (slow start)
+    until the first congestion signal. From then on it grows by one per round
+    trip while responses are healthy and is cut multiplicatively on HTTP 429,
+    timeouts and p95 latency spikes. Other errors, e.g. a failing backend,
+    don't say anything about the capacity, they're left to the retries.
+    """
+
+    def __init__(self, maximum, minimum=1, decrease=0.5, latency_factor=2.0, window=50):
+        """
+        :param maximum: Upper bound of the limit, the configured concurrency.
+        :type maximum: int
+
+        :param minimum: Lower bound of the limit.
+        :type minimum: int
+
+        :param decrease: Factor the limit is multiplied with on congestion.
+        :type decrease: float
+
+        :param latency_factor: A window's p95 latency exceeding this multiple
+            of the baseline p95 counts as congestion.
+        :type latency_factor: float
+
+        :param window: Number of responses per p95 latency sample.
+        :type window: int
+        """
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.window = window
+
+        self._limit = float(minimum)
+        self._slow_start = True
+        self._latencies = []
+        self._baseline = None
+        self._cooldown_until = 0
+        self._lock = threading.Lock()
+
+        # (sequence number, limit, reason) of the most recent changes
+        self._changes = collections.deque(maxlen=100)
+        self._seq = 0
+
+    @property
+    def limit(self):
+        """Current number of requests allowed in flight."""
+        return int(self._limit)
+
+    def on_success(self, latency):
+        """
+        Records a successful response.
+
+        :param latency: Seconds from sending the request to receiving the response.
+        :type latency: float
+        """
+        with self._lock:
+            self._latencies.append(latency)
+            if len(self._latencies) >= self.window:
+                latencies = sorted(self._latencies)
+                self._latencies = []
+                p95 = latencies[int(round(0.95 * (len(latencies) - 1)))]
+                if self._baseline is not None and p95 > self.latency_factor * self._baseline:
+                    self._cut("p95 latency {:.0f} ms exceeds {:g}x the baseline of {:.0f} ms".format(
+                        1000 * p95, self.latency_factor, 1000 * self._baseline))
+                    return
+                self._baseline = p95 if self._baseline is None else 0.8 * self._baseline + 0.2 * p95
+
+            if time.time() < self._cooldown_until or self._limit >= self.maximum:
+                return
+
+            old = self.limit
+            # Per response, so the limit doubles or grows by one per round trip
+            self._limit = min(self.maximum, self._limit + (1 if self._slow_start else 1 / self._limit))
+            if self.limit != old:
+                self._add_change("slow start" if self._slow_start else "healthy responses")
+
+    def on_error(self, error):
+        """
+        Records a failed request, cutting the limit for congestion signals.
+
+        :param error: Error raised by the request.
+        :type error: Exception
+        """
+        if isinstance(error, exceptions.OverQueryLimit):
+            reason = "rate limited (HTTP 429)"
+        elif isinstance(error, exceptions.Timeout):
+            reason = "request timed out"
+        else:
+            return
+
+        with self._lock:
+            self._cut(reason)
+
+    def changes_since(self, seq):
+        """
+        :param seq: Sequence number of the last change seen, 0 for all.
+        :type seq: int
+
+        :returns: changes after seq as (sequence number, limit, reason)
+        :rtype: list of tuple
+        """
+        with self._lock:
+            return [change for change in self._changes if change[0] > seq]
+
+    def _cut(self, reason):
+        # Responses to requests sent before the cut would cut again
+        if time.time() < self._cooldown_until:
+            return
+        self._slow_start = False
+        self._latencies = []
+        self._cooldown_until = time.time() + max(1.0, self._baseline or 0)
+
+        old = self.limit
+        self._limit = max(self.minimum, self._limit * self.decrease)
+        if self.limit != old:
+            self._add_change(reason)
+
+    def _add_change(self, reason):
+        self._seq += 1
+        self._changes.append((self._seq, self.limit, reason))
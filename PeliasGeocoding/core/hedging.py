@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+class HedgePolicy:
+    """
+    When to send a duplicate of a slow request, to cut tail latency caused
+    by a few slow queries of the provider.
+    """
+
+    def __init__(self, percentile=95, min_samples=20, alternate=None):
+        """
+        :param percentile: Latency percentile of the recent requests after which
+            an unanswered request is hedged.
+        :type percentile: float
+
+        :param min_samples: Number of latencies to observe before hedging.
+        :type min_samples: int
+
+        :param alternate: Name of the provider from providers.yml to send hedges
+            to, by default the same provider.
+        :type alternate: str
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.alternate = alternate
+
+    @classmethod
+    def from_provider(cls, provider):
+        """
+        Builds the policy from the optional 'hedging' settings of a provider,
+        either True for the defaults or a dict.
+
+        :param provider: A provider from providers.yml
+        :type provider: dict
+
+        :returns: the policy or None if hedging is disabled
+        :rtype: HedgePolicy
+        """
+        settings = provider.get('hedging')
+        if not settings:
+            return None
+        if settings is True:
+            return cls()
+        return cls(**settings)
+
+    def get_delay(self, metrics):
+        """
+        :param metrics: Metrics of the client sending the request.
+        :type metrics: PeliasGeocoding.core.metrics.Metrics
+
+        :returns: seconds after which to hedge a request, None while too
+            few latencies were observed.
+        :rtype: float
+        """
+        return metrics.percentile(self.percentile, self.min_samples)
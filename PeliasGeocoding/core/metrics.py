@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import collections
+import threading
+
+
+class Metrics:
+    """Thread-safe counters, timers and latencies of a client's requests."""
+
+    def __init__(self, max_samples=1000):
+        """
+        :param max_samples: Number of most recent latencies to keep for percentiles.
+        :type max_samples: int
+        """
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+        self._timers = collections.Counter()
+        self._latencies = collections.deque(maxlen=max_samples)
+
+    def increment(self, name, value=1):
+        """
+        :param name: Name of the counter.
+        :type name: str
+
+        :param value: Amount to add.
+        :type value: int
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def add_time(self, name, seconds):
+        """
+        :param name: Name of the timer.
+        :type name: str
+
+        :param seconds: Time to add.
+        :type seconds: float
+        """
+        with self._lock:
+            self._timers[name] += seconds
+
+    def add_latency(self, seconds):
+        """
+        :param seconds: Time from sending a request to receiving its response.
+        :type seconds: float
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, percent, min_samples=1):
+        """
+        :param percent: Percentile to compute, e.g. 95.
+        :type percent: float
+
+        :param min_samples: Number of latencies needed for a meaningful percentile.
+        :type min_samples: int
+
+        :returns: latency percentile of the most recent requests in seconds,
+            None if fewer than min_samples requests were sent yet.
+        :rtype: float
+        """
+        latencies = sorted(self.latencies())
+        if not latencies or len(latencies) < min_samples:
+            return None
+
+        return latencies[int(round(percent / 100.0 * (len(latencies) - 1)))]
+
+    def latencies(self):
+        """
+        :returns: the most recent latencies in seconds.
+        :rtype: list of float
+        """
+        with self._lock:
+            return list(self._latencies)
+
+    def snapshot(self):
+        """
+        :returns: copy of all counters and timers.
+        :rtype: (dict, dict)
+        """
+        with self._lock:
+            return dict(self._counters), dict(self._timers)
+
+    def summary(self, since=None):
+        """
+        Human readable summary, used for processing feedback.
+
+        :param since: Earlier snapshot to only summarize what happened after it.
+        :type since: (dict, dict)
+
+        :rtype: str
+        """
+        counters, timers = self.snapshot()
+        if since is not None:
+            counters = {k: v - since[0].get(k, 0) for k, v in counters.items()}
+            timers = {k: v - since[1].get(k, 0) for k, v in timers.items()}
+
+        lines = ["{}: {}".format(k, v) for k, v in sorted(counters.items()) if v]
+        lines += ["{}: {:.1f} s".format(k, v) for k, v in sorted(timers.items()) if v]
+        if counters.get('hedges') and counters.get('requests'):
+            lines.append("hedge rate: {:.1f}% of requests, win rate: {:.1f}% of hedges".format(
+                100.0 * counters['hedges'] / counters['requests'],
+                100.0 * counters.get('hedge_wins', 0) / counters['hedges']))
+        if self.latencies():
+            lines.append("latency p50: {:.0f} ms, p95: {:.0f} ms".format(1000 * self.percentile(50),
+                                                                         1000 * self.percentile(95)))
+
+        return "\n".join(lines)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import collections
+import random
+
+from PeliasGeocoding.core import batch, client
+from PeliasGeocoding.core.circuitbreaker import CLOSED, HALF_OPEN, OPEN
+from PeliasGeocoding.core.metrics import Metrics
+from PeliasGeocoding.core.query import PreparedQuery
+from PeliasGeocoding.utils import exceptions, logger
+
+# Errors after which a request is sent to another provider of the pool
+FAILOVER_ERRORS = (exceptions.InvalidKey,
+                   exceptions.OverQueryLimit,
+                   exceptions.GenericServerError,
+                   exceptions.Timeout,
+                   exceptions.NetworkError,
+                   exceptions.ProviderUnavailable)
+
+
+class PoolCircuitBreaker:
+    """Read-only view on the circuit breakers of all providers of a pool."""
+
+    def __init__(self, breakers):
+        """
+        :param breakers: Circuit breakers of the providers.
+        :type breakers: list of PeliasGeocoding.core.circuitbreaker.CircuitBreaker
+        """
+        self.breakers = breakers
+        self.max_open = max(breaker.max_open for breaker in breakers)
+
+    @property
+    def state(self):
+        """Closed as long as one provider is available."""
+        states = [breaker.state for breaker in self.breakers]
+        if CLOSED in states:
+            return CLOSED
+        if HALF_OPEN in states:
+            return HALF_OPEN
+        return OPEN
+
+    def retry_in(self):
+        return min(breaker.retry_in() for breaker in self.breakers)
+
+    def unavailable_for(self):
+        return min(breaker.unavailable_for() for breaker in self.breakers)
+
+
+class PoolSignal:
+    """Connects slots to the same signal of all providers of a pool."""
+
+    def __init__(self, signals):
+        """
+        :param signals: Bound signals of the providers' clients.
+        :type signals: list of pyqtBoundSignal
+        """
+        self.signals = signals
+
+    def connect(self, slot, *args):
+        for signal in self.signals:
+            signal.connect(slot, *args)
+
+    def disconnect(self, slot):
+        for signal in self.signals:
+            signal.disconnect(slot)
+
+
+class PoolMetrics(Metrics):
+    """Metrics of a pool, including those its providers' clients recorded."""
+
+    def __init__(self, members):
+        """
+        :param members: Metrics of the providers' clients.
+        :type members: list of PeliasGeocoding.core.metrics.Metrics
+        """
+        Metrics.__init__(self)
+        self.members = members
+
+    def latencies(self):
+        return Metrics.latencies(self) + [latency for metrics in self.members for latency in metrics.latencies()]
+
+    def snapshot(self):
+        counters, timers = (collections.Counter(values) for values in Metrics.snapshot(self))
+        for metrics in self.members:
+            member_counters, member_timers = metrics.snapshot()
+            counters.update(member_counters)
+            timers.update(member_timers)
+
+        return dict(counters), dict(timers)
+
+
+class ProviderPool:
+    """
+    Spreads the requests of batch jobs across several providers, by weight
+    and by free capacity in their rate limits, and fails over to another
+    provider when one errors or its circuit is open.
+
+    Offers what batch jobs use from a Client, but request() returns the
+    name of the answering provider with the response.
+    """
+
+    def __init__(self, providers):
+        """
+        :param providers: Providers from providers.yml, with an optional
+            'weight', 1 by default.
+        :type providers: list of dict
+        """
+        self.providers = providers
+        self.clients = [client.get_client(provider) for provider in providers]
+        self.weights = [max(0.0, float(provider.get('weight', 1))) for provider in providers]
+        self.name = "Provider pool ({})".format(", ".join(provider['name'] for provider in providers))
+
+        # Settings of the pool as a whole, e.g. for batch.get_concurrency. The
+        # endpoints are resolved per provider, so their "URLs" are their names.
+        self.provider = dict(
+            name=self.name,
+            endpoints={endpoint: endpoint for endpoint in providers[0]['endpoints']},
+            concurrency=sum(batch.get_concurrency(provider) for provider in providers)
+        )
+
+        self.metrics = PoolMetrics([clnt.metrics for clnt in self.clients])
+        self.circuit_breaker = PoolCircuitBreaker([clnt.circuit_breaker for clnt in self.clients])
+        # The providers adapt their concurrency on their own
+        self.adaptive_concurrency = None
+
+        self.overQueryLimit = PoolSignal([clnt.overQueryLimit for clnt in self.clients])
+
+    def request(self, endpoint, params, use_cache=True, cancelled=None):
+        """
+        Sends a request to one provider of the pool, trying the others if it fails.
+
+        :param endpoint: Name of the endpoint, e.g. 'search', or a query prepared for it.
+        :type endpoint: str or PeliasGeocoding.core.query.PreparedQuery
+
+        :param params: HTTP GET parameters.
+        :type params: dict
+
+        :param use_cache: Whether to answer from the response cache.
+        :type use_cache: bool
+
+        :param cancelled: Set to stop the request, see Client.request.
+        :type cancelled: threading.Event
+
+        :raises Exception: the error of the last provider tried, if none succeeded.
+
+        :returns: name of the answering provider and its response body, or None if cancelled
+        :rtype: tuple of (str, dict)
+        """
+        tried = set()
+        error = exceptions.ProviderUnavailable("No provider of the pool is available")
+        while True:
+            idx = self._choose(tried)
+            if idx is None:
+                raise error
+
+            provider = self.providers[idx]
+            try:
+                response = self.clients[idx].request(self._get_url(provider, endpoint), params,
+                                                     use_cache=use_cache, cancelled=cancelled)
+            except FAILOVER_ERRORS as e:
+                error = e
+                tried.add(idx)
+                self.metrics.increment('failovers')
+                logger.log("{} failed with {}: {}, failing over.".format(
+                    provider['name'], e.__class__.__name__, str(e)), 1)
+                continue
+
+            if response is None:
+                return None
+
+            self.metrics.increment('answered_' + provider['name'])
+            return provider['name'], response
+
+    def save_state(self):
+        """Persists the rate limit budgets of all providers."""
+        for clnt in self.clients:
+            clnt.save_state()
+
+    @staticmethod
+    def _get_url(provider, endpoint):
+        """
+        :returns: URL extension or prepared query of the endpoint at the provider
+        :rtype: str or PeliasGeocoding.core.query.PreparedQuery
+        """
+        if isinstance(endpoint, PreparedQuery):
+            return endpoint.with_path(provider['endpoints'][endpoint.path])
+
+        return provider['endpoints'][endpoint]
+
+    def _choose(self, exclude):
+        """
+        Picks a provider at random by weight among those which can send right
+        away, or else the one with the earliest free slot. Providers weighted 0
+        are only picked if no other one can send right away.
+
+        :param exclude: Indices of providers not to choose.
+        :type exclude: set
+
+        :returns: index of the provider or None if none is available
+        :rtype: int
+        """
+        candidates = [(clnt.rate_limiter.peek(), idx) for idx, clnt in enumerate(self.clients)
+                      if idx not in exclude and clnt.circuit_breaker.state != OPEN]
+        if not candidates:
+            return None
+
+        ready = [idx for wait, idx in candidates if wait == 0]
+        weighted = [idx for idx in ready if self.weights[idx]]
+        if weighted:
+            return random.choices(weighted, weights=[self.weights[idx] for idx in weighted])[0]
+        if ready:
+            return ready[0]
+
+        return min(candidates)[1]
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from heapq import merge
+from urllib.parse import quote_plus
+
+from requests.utils import unquote_unreserved
+
+
+class PreparedQuery:
+    """
+    Query of an endpoint whose constant parameters are encoded once, e.g.
+    the filters and size of a batch job, so every request only encodes its
+    own parameters. Builds the same URLs and cache keys as encoding all
+    parameters per request.
+
+    Can be passed as URL to Client.request and the batch requesters.
+    """
+
+    def __init__(self, path, params):
+        """
+        :param path: URL extension of the endpoint. Should begin with a slash.
+        :type path: str
+
+        :param params: Parameters shared by all requests.
+        :type params: dict
+        """
+        self.path = path
+        self.params = params
+        # Sorted by name, with the query string and URL pieces of each parameter
+        self._encoded = sorted(_encode(name, value) for name, value in params.items())
+
+    def with_path(self, path):
+        """
+        :param path: URL extension of the same endpoint of another provider.
+        :type path: str
+
+        :returns: the query for the other path, sharing the encoded parameters
+        :rtype: PreparedQuery
+        """
+        query = PreparedQuery.__new__(PreparedQuery)
+        query.path = path
+        query.params = self.params
+        query._encoded = self._encoded
+        return query
+
+    def url(self, params, key=''):
+        """
+        :param params: Parameters of the request, overriding constant ones.
+        :type params: dict
+
+        :param key: API key to append, if any.
+        :type key: str
+
+        :returns: path and query string of the request URL
+        :rtype: str
+        """
+        query = "&".join(url_part for _, _, url_part in self._merge(params))
+        if key:
+            query += "&" + _encode("api_key", key)[2]
+
+        return self.path + "?" + query
+
+    def cache_query(self, params):
+        """
+        :param params: Parameters of the request, overriding constant ones.
+        :type params: dict
+
+        :returns: query string of the request's cache key, see Client._generate_cache_key
+        :rtype: str
+        """
+        return "&".join(encoded for _, encoded, _ in self._merge(params) if not encoded.startswith('api_key='))
+
+    def _merge(self, params):
+        encoded = self._encoded
+        if any(name in self.params for name in params):
+            encoded = [item for item in encoded if item[0] not in params]
+
+        return merge(encoded, sorted(_encode(name, value) for name, value in params.items()))
+
+
+def _encode(name, value):
+    """Encodes a parameter like urllib.parse.urlencode, and for URLs also like Client._generate_auth_url."""
+    encoded = quote_plus(str(name)) + "=" + quote_plus(str(value))
+    return str(name), encoded, unquote_unreserved(encoded)
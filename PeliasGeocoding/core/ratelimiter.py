@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+from PeliasGeocoding import RATE_LIMITS
+
+# Length of a rate limit window in seconds
+UNITS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400
+}
+
+# Windows at least this long survive QGIS restarts and count requests per bucket
+_PERSIST_INTERVAL = 3600
+
+# Seconds per bucket of windows of an hour or longer
+_BUCKET_INTERVAL = 60
+
+# Seconds between writes of the persisted windows
+_SAVE_INTERVAL = 60
+
+_state_lock = threading.Lock()
+
+
+def get_limits(provider):
+    """
+    Returns the rate limit windows of a provider, read from 'limits' or the
+    single 'limit' and 'unit' of older providers.yml.
+
+    :param provider: A provider from providers.yml
+    :type provider: dict
+
+    :returns: limit and unit of every window with a limit, shortest window first
+    :rtype: list of (int, str)
+    """
+    if 'limits' in provider:
+        limits = [(window['limit'], window['unit']) for window in provider['limits'] or []]
+    else:
+        limits = [(provider.get('limit'), provider.get('unit', 'second'))]
+
+    return sorted(((limit, unit) for limit, unit in limits if limit), key=lambda window: UNITS[window[1]])
+
+
+def _load_state():
+    try:
+        with open(RATE_LIMITS) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+# Rate limit headers most providers send
+DEFAULT_HEADERS = {
+    'limit': 'X-RateLimit-Limit',
+    'remaining': 'X-RateLimit-Remaining',
+    'reset': 'X-RateLimit-Reset'
+}
+
+# Reset values above this are UNIX timestamps, below seconds until the reset
+_TIMESTAMP_THRESHOLD = 1e9
+
+# Share of the quota below which the remaining requests are spread until the reset
+_LOW_QUOTA = 0.1
+
+# Share of the shortest window within which reported resets belong to the same window
+_SAME_WINDOW = 0.25
+
+
+def parse_rate_limit_headers(headers, mapping):
+    """
+    Parses the provider's quota from rate limit response headers.
+
+    :param headers: Response headers, case-insensitive.
+    :type headers: requests.structures.CaseInsensitiveDict
+
+    :param mapping: Header names of 'remaining', 'reset' and optionally 'limit'.
+    :type mapping: dict
+
+    :returns: remaining requests, seconds until the quota resets and the
+        quota or None if it's not sent. None if the headers are missing.
+    :rtype: tuple of (int, float, int)
+    """
+    try:
+        remaining = int(headers[mapping['remaining']])
+        reset = float(headers[mapping['reset']])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    try:
+        limit = int(headers[mapping['limit']])
+    except (KeyError, TypeError, ValueError):
+        limit = None
+
+    if reset > _TIMESTAMP_THRESHOLD:
+        reset -= time.time()
+
+    return remaining, max(0.0, reset), limit
+
+
+class SlidingWindow:
+    """Send times of the last requests within a window, for short windows."""
+
+    def __init__(self, limit, interval):
+        """
+        :param limit: Maximum number of requests per window.
+        :type limit: int
+
+        :param interval: Length of the window in seconds.
+        :type interval: int
+        """
+        self.limit = limit
+        self.interval = interval
+        # the oldest slots drop out with maxlen
+        self._sent_times = collections.deque(maxlen=limit)
+
+    def add(self, send_at):
+        """
+        :param send_at: Time of a reserved slot.
+        :type send_at: float
+        """
+        self._sent_times.append(send_at)
+
+    def next_slot(self, now):
+        """
+        :returns: earliest time the window allows another request.
+        :rtype: float
+        """
+        if len(self._sent_times) == self.limit:
+            return self._sent_times[0] + self.interval
+        return now
+
+    def expiry(self):
+        """
+        :returns: time the oldest request leaves the window, None if it's empty.
+        :rtype: float
+        """
+        return self._sent_times[0] + self.interval if self._sent_times else None
+
+
+class BucketWindow(SlidingWindow):
+    """
+    Request counts per bucket of _BUCKET_INTERVAL, for windows of an hour or
+    longer, e.g. daily budgets of millions of requests. A bucket's requests
+    leave the window with its end, so the window may be up to a bucket longer.
+    """
+
+    def __init__(self, limit, interval):
+        SlidingWindow.__init__(self, limit, interval)
+        # Start and number of requests per bucket, oldest first
+        self._buckets = collections.deque()
+        self._count = 0
+
+    def add(self, send_at, count=1):
+        """
+        :param send_at: Time of a reserved slot.
+        :type send_at: float
+
+        :param count: Number of requests to add, for restored buckets.
+        :type count: int
+        """
+        start = send_at - send_at % _BUCKET_INTERVAL
+        if self._buckets and self._buckets[-1][0] >= start:
+            # Slots are mostly reserved in order, else they count to the latest bucket
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([start, count])
+        self._count += count
+
+    def next_slot(self, now):
+        self._expire(now)
+        count = self._count
+        for start, bucket_count in self._buckets:
+            if count < self.limit:
+                break
+            count -= bucket_count
+            now = max(now, start + _BUCKET_INTERVAL + self.interval)
+        return now
+
+    def expiry(self):
+        return self._buckets[0][0] + _BUCKET_INTERVAL + self.interval if self._buckets else None
+
+    def get_state(self, now):
+        """
+        :returns: start and number of requests of the buckets within the window.
+        :rtype: list of [float, int]
+        """
+        self._expire(now)
+        return [list(bucket) for bucket in self._buckets]
+
+    def restore(self, state, now):
+        """
+        :param state: Buckets as from get_state, or send times persisted by
+            earlier versions.
+        :type state: list
+        """
+        for bucket in state:
+            start, count = bucket if isinstance(bucket, list) else (bucket, 1)
+            self.add(start, count)
+        self._expire(now)
+
+    def _expire(self, now):
+        while self._buckets and self._buckets[0][0] + _BUCKET_INTERVAL + self.interval <= now:
+            self._count -= self._buckets.popleft()[1]
+
+
+class RateLimiter:
+    """
+    Thread-safe sliding window limiter which paces requests before they're
+    sent, enforcing any number of windows at once, e.g. 10 per second and
+    1000 per day.
+    """
+
+    def __init__(self, limits, name=None):
+        """
+        :param limits: Limit and unit of every window, see get_limits. An
+            empty list disables pacing.
+        :type limits: list of (int, str)
+
+        :param name: Provider name to persist windows of an hour or longer
+            under, so restarting QGIS doesn't reset a daily budget.
+        :type name: str
+        """
+        # Requests per window, including reserved future slots
+        self._windows = [(BucketWindow if UNITS[unit] >= _PERSIST_INTERVAL else SlidingWindow)(limit, UNITS[unit])
+                         for limit, unit in limits]
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+        # Quota as reported by the provider's rate limit headers, less the
+        # requests in flight then, and the number of reservations at the time
+        self._quota_remaining = None
+        self._quota_sent_at = 0
+        self._quota_reserved = 0
+        self._quota_reset_at = 0
+        self._quota_low = 1
+        self._reserved_times = collections.deque(maxlen=1000)
+        self._n_reserved = 0
+
+        self.name = name
+        self._saved = time.time()
+        if name is not None:
+            self._restore(_load_state().get(name, dict()))
+
+    def acquire(self, max_wait=None):
+        """
+        Reserves a slot for a request and blocks until it may be sent.
+
+        :param max_wait: Maximum seconds to wait, e.g. when the daily budget is
+            exhausted. Nothing is reserved if the slot is further away.
+        :type max_wait: float
+
+        :returns: seconds until the slot, waited if it's at most max_wait
+        :rtype: float
+        """
+        wait = self.reserve(max_wait)
+        if 0 < wait and (max_wait is None or wait <= max_wait):
+            time.sleep(wait)
+
+        return wait
+
+    def reserve(self, max_wait=None):
+        """
+        Reserves a slot for a request without blocking, e.g. for callers which
+        wait on an event loop.
+
+        :param max_wait: Maximum seconds to wait, nothing is reserved if the
+            slot is further away.
+        :type max_wait: float
+
+        :returns: seconds to wait until the request may be sent
+        :rtype: float
+        """
+        with self._lock:
+            now = time.time()
+            send_at = self._next_slot(now)
+
+            if max_wait is not None and send_at - now > max_wait:
+                return send_at - now
+
+            for window in self._windows:
+                window.add(send_at)
+            self._reserved_times.append(send_at)
+            self._n_reserved += 1
+
+            save = self.name is not None and now - self._saved > _SAVE_INTERVAL
+
+        if save:
+            self.save()
+
+        return max(0.0, send_at - now)
+
+    def peek(self):
+        """
+        :returns: seconds until a request could be sent, without reserving the slot.
+        :rtype: float
+        """
+        with self._lock:
+            now = time.time()
+            return max(0.0, self._next_slot(now) - now)
+
+    def throttle(self, retry_after=None):
+        """
+        Blocks new requests after the provider rejected one with HTTP 429,
+        until the oldest request in the shortest window expired.
+
+        :param retry_after: Seconds to wait as requested by the provider, takes precedence.
+        :type retry_after: float
+
+        :returns: seconds until requests will be sent again
+        :rtype: float
+        """
+        with self._lock:
+            now = time.time()
+            expiry = self._windows[0].expiry() if self._windows else None
+            if retry_after is not None:
+                sleep_for = retry_after
+            elif expiry is not None:
+                sleep_for = expiry - now
+            else:
+                sleep_for = 1
+            # The quota might be shared with other clients, so wait at least one slot
+            if self._windows:
+                sleep_for = max(sleep_for, self._windows[0].interval / self._windows[0].limit)
+            self._blocked_until = max(self._blocked_until, now + sleep_for)
+
+        return sleep_for
+
+    def update_quota(self, remaining, reset_in, limit=None, sent_at=None):
+        """
+        Paces requests by the quota the provider reported in a response.
+
+        :param remaining: Requests left until the quota resets.
+        :type remaining: int
+
+        :param reset_in: Seconds until the quota resets.
+        :type reset_in: float
+
+        :param limit: Quota per window, if reported.
+        :type limit: int
+
+        :param sent_at: Time the request of the response was sent, requests
+            reserved after it aren't counted in remaining yet.
+        :type sent_at: float
+        """
+        with self._lock:
+            now = time.time()
+            # Requests sent after this one aren't counted by the provider yet
+            if sent_at is not None:
+                remaining -= sum(1 for reserved in self._reserved_times if reserved > sent_at)
+            else:
+                sent_at = now
+
+            reset_at = now + reset_in
+            # Responses arrive out of order, one sent before the last applied
+            # mustn't raise the remaining quota of the same window
+            tolerance = _SAME_WINDOW * (self._windows[0].interval if self._windows else 1)
+            if self._quota_remaining is not None and sent_at < self._quota_sent_at and \
+                    abs(reset_at - self._quota_reset_at) <= tolerance:
+                remaining = min(remaining, self._get_quota_remaining())
+            else:
+                self._quota_sent_at = sent_at
+
+            self._quota_remaining = remaining
+            self._quota_reserved = self._n_reserved
+            self._quota_reset_at = reset_at
+            if limit:
+                self._quota_low = max(1, int(limit * _LOW_QUOTA))
+
+    def save(self):
+        """Persists the request counts of windows of an hour or longer."""
+        if self.name is None:
+            return
+
+        with self._lock:
+            self._saved = time.time()
+            windows = {
+                str(window.interval): window.get_state(self._saved)
+                for window in self._windows if isinstance(window, BucketWindow)
+            }
+        if not windows:
+            return
+
+        with _state_lock:
+            state = _load_state()
+            state[self.name] = windows
+            tmp_path = RATE_LIMITS + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, RATE_LIMITS)
+
+    def _next_slot(self, now):
+        send_at = max(now, self._blocked_until)
+        for window in self._windows:
+            send_at = max(send_at, window.next_slot(now))
+
+        if self._quota_remaining is not None and self._quota_reset_at > now:
+            remaining = self._get_quota_remaining()
+            if remaining <= 0:
+                send_at = max(send_at, self._quota_reset_at)
+            elif remaining < self._quota_low:
+                # Spread the last requests until the reset instead of running into 429s
+                spacing = (self._quota_reset_at - now) / remaining
+                if self._reserved_times:
+                    send_at = max(send_at, self._reserved_times[-1] + spacing)
+
+        return send_at
+
+    def _get_quota_remaining(self):
+        # Each request is counted once, either in flight at the last update or reserved since
+        return self._quota_remaining - (self._n_reserved - self._quota_reserved)
+
+    def _restore(self, windows):
+        now = time.time()
+        for window in self._windows:
+            if isinstance(window, BucketWindow):
+                window.restore(windows.get(str(window.interval), []), now)
@@ -23,28 +23,52 @@
 
 from PyQt5.QtCore import QVariant
 
-from qgis.core import QgsField, QgsFields, QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer
+from qgis.core import QgsField, QgsFields, QgsFeature, QgsFeatureSink, QgsGeometry, QgsPointXY, QgsVectorLayer
 from collections import OrderedDict
 
+from PeliasGeocoding.core.retry import is_transient
+
+
+# Number of features written to a sink or layer at once
+CHUNK_SIZE = 1000
+
 
 class ResponseHandler:
     """Populate Fields and features for response of API endpoints"""
 
-    def __init__(self, id_field, debug=False):
+    def __init__(self, id_field, debug=False, provider_field=False):
         """
         :param id_field: ID field set by user.
         :type id_field: QgsField
 
         :param debug: Switch for debug mode, which will output all '_gid' response fields
         :type debug: boolean
+
+        :param provider_field: Whether to add a 'provider' field with the name of the
+            answering provider, for requests spread across a provider pool.
+        :type provider_field: boolean
         """
         self.id_field = id_field
         self.debug = debug
+        self.provider_field = provider_field
 
         self.fields_map = self._get_fields_mapping()
         self.fields = QgsFields()
+        for field in self.fields_map.values():
+            self.fields.append(QgsField(field['nice_name'], field['type']))
 
-    def generate_out_features(self, response, id_field_value):
+        # Compiled schema: attribute index of every response property
+        self.attribute_index = {attr: idx for idx, attr in enumerate(self.fields_map)}
+
+        self.failed_fields = QgsFields()
+        self.failed_fields.append(QgsField(self.id_field.name(), self.id_field.type()))
+        for name, field_type in (('error', QVariant.String),
+                                 ('status', QVariant.String),
+                                 ('message', QVariant.String),
+                                 ('transient', QVariant.Bool)):
+            self.failed_fields.append(QgsField(name, field_type))
+
+    def generate_out_features(self, response, id_field_value, provider=None):
         """
         Generator for output features from response.
 
@@ -54,25 +78,76 @@ class ResponseHandler:
         :param id_field_value: Value of user set ID field
         :type id_field_value: any
 
+        :param provider: Name of the answering provider, set with provider_field.
+        :type provider: str
+
         :returns: yields built feature to be inserted to output layer.
         :rtype: QgsFeature
         """
 
+        n_fields = len(self.attribute_index)
+        attribute_index = self.attribute_index
+
         for point in response['features']:
-            feat = QgsFeature()
-            coords = point['geometry']['coordinates']
-            feat.attributes()
-            feat.setGeometry(QgsGeometry().fromPointXY(QgsPointXY(*coords)))
-            feat.setFields(self.fields)
-            feat.setAttribute(self.id_field.name(), id_field_value)
-
-            for attr in point['properties']:
-                field_attr = self.fields_map.get(attr)
-                if field_attr is not None:
-                    feat.setAttribute(field_attr['nice_name'], point['properties'][attr])
+            attributes = [None] * n_fields
+            attributes[0] = id_field_value
+            if self.provider_field:
+                attributes[-1] = provider
+            for attr, value in point['properties'].items():
+                idx = attribute_index.get(attr)
+                if idx is not None:
+                    attributes[idx] = value
+
+            feat = QgsFeature(self.fields)
+            feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(*point['geometry']['coordinates'])))
+            feat.setAttributes(attributes)
 
             yield feat
 
+    def generate_failed_features(self, failed):
+        """
+        Generator for features of input features whose request failed.
+
+        :param failed: Input IDs sharing a request and its error.
+        :type failed: list of (list, Exception)
+
+        :returns: yields a feature without geometry per input ID.
+        :rtype: QgsFeature
+        """
+        for id_field_values, error in failed:
+            status = getattr(error, 'status', None)
+            message = getattr(error, 'message', None) or str(error)
+            for id_field_value in id_field_values:
+                feat = QgsFeature(self.failed_fields)
+                feat.setAttributes([id_field_value,
+                                    error.__class__.__name__,
+                                    None if status is None else str(status),
+                                    message if isinstance(message, str) else str(message),
+                                    is_transient(error)])
+                yield feat
+
+    def write_features(self, sink, features):
+        """
+        Writes features to a sink in chunks.
+
+        :param sink: Output sink or data provider.
+        :type sink: QgsFeatureSink
+
+        :param features: Features to write.
+        :type features: iterable of QgsFeature
+        """
+        chunk = []
+        try:
+            for feat in features:
+                chunk.append(feat)
+                if len(chunk) == CHUNK_SIZE:
+                    sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+                    chunk = []
+        finally:
+            # Keep what was built if the features can't be completed
+            if chunk:
+                sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+
     def get_layer(self, name, response):
         """
         Returns a populated Point layer to GUI control.
@@ -90,21 +165,17 @@ class ResponseHandler:
         layer_out.dataProvider().addAttributes(self.get_fields())
         layer_out.updateFields()
 
-        for feat in self.generate_out_features(response, None):
-            layer_out.dataProvider().addFeature(feat)
+        self.write_features(layer_out.dataProvider(), self.generate_out_features(response, None))
 
         return layer_out
 
     def get_fields(self):
         """
-        Builds fields() object for layer.
+        Returns fields() object for layer.
 
         :returns: initialized fields for layer
         :rtype: QgsFields
         """
-        for field in self.fields_map.values():
-            self.fields.append(QgsField(field['nice_name'], field['type']))
-
         return self.fields
 
     def _get_fields_mapping(self):
@@ -166,4 +237,7 @@ class ResponseHandler:
                 )
             )
 
+        if self.provider_field:
+            fields_map['_provider'] = _get_dict('provider')
+
         return fields_map
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from PeliasGeocoding.utils import exceptions
+
+# Server errors which are usually temporary
+RETRIABLE_STATUS = (502, 503, 504)
+
+
+def is_transient(error):
+    """
+    :param error: Error of a request, after the client's retries.
+    :type error: Exception
+
+    :returns: whether the request may succeed later in a batch job.
+    :rtype: bool
+    """
+    return RetryPolicy.is_retriable(error) or isinstance(error, exceptions.ProviderUnavailable)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for retriable errors."""
+
+    def __init__(self, max_retries=5, backoff=0.5, max_backoff=30):
+        """
+        :param max_retries: Maximum number of retries per request, not counting
+            retries after HTTP 429, which are only bounded by the client's retry_timeout.
+        :type max_retries: int
+
+        :param backoff: Base delay in seconds, doubled with every retry.
+        :type backoff: float
+
+        :param max_backoff: Maximum delay between retries in seconds.
+        :type max_backoff: float
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    @classmethod
+    def from_provider(cls, provider):
+        """
+        Builds the policy from the optional 'retry' settings of a provider.
+
+        :param provider: A provider from providers.yml
+        :type provider: dict
+
+        :rtype: RetryPolicy
+        """
+        return cls(**(provider.get('retry') or {}))
+
+    @staticmethod
+    def is_retriable(error):
+        """
+        :param error: Error raised by a request.
+        :type error: Exception
+
+        :returns: whether the request should be sent again.
+        :rtype: bool
+        """
+        if isinstance(error, (exceptions.Timeout, exceptions.NetworkError, exceptions.OverQueryLimit)):
+            return True
+        if isinstance(error, exceptions.GenericServerError):
+            try:
+                return int(error.status) in RETRIABLE_STATUS
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        :param attempt: Number of the upcoming retry, starting at 1.
+        :type attempt: int
+
+        :param retry_after: Delay requested by the server, takes precedence.
+        :type retry_after: float
+
+        :returns: seconds to wait before the retry.
+        :rtype: float
+        """
+        if retry_after is not None:
+            return retry_after
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+def parse_retry_after(headers):
+    """
+    Parses the Retry-After header, given either in seconds or as HTTP date.
+
+    :param headers: Response headers.
+    :type headers: dict
+
+    :returns: seconds to wait or None if the header is missing or invalid.
+    :rtype: float
+    """
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
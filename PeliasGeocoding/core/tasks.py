@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+
+from PyQt5.QtCore import pyqtSignal
+
+from qgis.core import QgsTask
+
+
+class RequestTask(QgsTask):
+    """Performs a single Pelias request in the background, off the GUI thread."""
+
+    # Relays the client's signal, so receivers in the GUI thread get it queued
+    overQueryLimit = pyqtSignal("int")
+
+    def __init__(self, description, clnt, url, params):
+        """
+        :param description: Description shown in the task manager.
+        :type description: str
+
+        :param clnt: Client to perform the request with.
+        :type clnt: PeliasGeocoding.core.client.Client
+
+        :param url: URL extension of the endpoint.
+        :type url: str
+
+        :param params: Request parameters.
+        :type params: dict
+        """
+        QgsTask.__init__(self, description, QgsTask.CanCancel)
+
+        self.clnt = clnt
+        self.url = url
+        self.params = params
+
+        # Results to retrieve once the task finished
+        self.response = None
+        self.error = None
+        self.request_url = None
+        self.warnings = None
+
+        # Stops the request waiting for the rate limit or a retry
+        self._cancelled = threading.Event()
+
+    def run(self):
+        """Runs in a worker thread of the task manager."""
+
+        self.clnt.overQueryLimit.connect(self.overQueryLimit)
+        try:
+            self.response = self.clnt.request(self.url, self.params, cancelled=self._cancelled)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.clnt.overQueryLimit.disconnect(self.overQueryLimit)
+            # url and warnings are only available in the requesting thread
+            self.request_url = self.clnt.url
+            self.warnings = self.clnt.warnings
+
+        return not self.isCanceled()
+
+    def cancel(self):
+        """Cancels the task, a request still waiting isn't sent anymore."""
+        self._cancelled.set()
+        QgsTask.cancel(self)
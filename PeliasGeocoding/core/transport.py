@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import collections
+from concurrent.futures import Future
+from datetime import datetime
+from functools import partial
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from PyQt5.QtCore import QByteArray, QEventLoop, QTimer, QUrl
+from PyQt5.QtNetwork import QNetworkReply, QNetworkRequest
+
+from qgis.core import QgsApplication, QgsBlockingNetworkRequest, QgsNetworkAccessManager
+
+from PeliasGeocoding.core import batch
+from PeliasGeocoding.utils import exceptions, logger
+
+# Milliseconds to wait for a finished request before checking for cancellation again
+_POLL_INTERVAL = 500
+
+# Seconds to wait for the connection when warming it up
+_WARM_UP_TIMEOUT = 10
+
+
+def get_transport(provider):
+    """
+    Returns the transport configured for a provider, 'requests' by default.
+
+    :param provider: A provider from providers.yml
+    :type provider: dict
+
+    :rtype: RequestsTransport or QgsTransport
+    """
+    name = provider.get('transport') or 'requests'
+    if name == 'requests':
+        # Keep a connection for every request in flight, plus their hedges
+        pool_size = batch.get_concurrency(provider)
+        if provider.get('hedging'):
+            pool_size *= 2
+        return RequestsTransport(pool_size)
+    if name == 'qgis':
+        return QgsTransport(provider.get('authcfg'))
+
+    raise ValueError("Unknown transport '{}' for provider {}".format(name, provider['name']))
+
+
+class Response:
+    """Minimal HTTP response, offering what Client._get_body needs from a requests.Response."""
+
+    def __init__(self, status_code, headers, content, elapsed=None):
+        """
+        :param status_code: HTTP status code.
+        :type status_code: int
+
+        :param headers: Response headers.
+        :type headers: requests.structures.CaseInsensitiveDict
+
+        :param content: Raw response body.
+        :type content: bytes
+
+        :param elapsed: Seconds from sending the request until the response was read.
+        :type elapsed: float
+        """
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class RequestsTransport:
+    """
+    Sends requests with a requests.Session, blocking the calling thread.
+    Its connections are kept alive for the client's lifetime.
+    """
+
+    def __init__(self, pool_size=10):
+        """
+        :param pool_size: Number of connections per host to keep alive, should be
+            at least the number of concurrent requests.
+        :type pool_size: int
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(pool_size, requests.adapters.DEFAULT_POOLSIZE))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Prepared requests and settings from the environment per method, host and headers
+        self._templates = dict()
+
+    def request(self, method, url, **kwargs):
+        """
+        :param method: HTTP method, GET or POST.
+        :type method: str
+
+        :param url: Full URL of the request.
+        :type url: str
+
+        :param kwargs: Keyword arguments for requests, e.g. headers, timeout or json.
+        :type kwargs: dict
+
+        :raises PeliasGeocoding.utils.exceptions.Timeout: when the request timed out.
+        :raises PeliasGeocoding.utils.exceptions.NetworkError: when the connection failed.
+
+        :rtype: requests.Response
+        """
+        try:
+            prepared, settings = self.prepare(method, url, **kwargs)
+            if prepared is None:
+                return self.session.request(method, url, **kwargs)
+            return self.session.send(prepared, **settings)
+        except requests.exceptions.Timeout:
+            raise exceptions.Timeout()
+        except requests.exceptions.ConnectionError as e:
+            raise exceptions.NetworkError(str(e))
+
+    def prepare(self, method, url, headers=None, timeout=None, **kwargs):
+        """
+        Prepares a request by copying a request prepared earlier for the same
+        method, host and headers, which saves most of the CPU time of
+        Session.request: merging the session's settings, reading proxies from
+        the environment and looking up .netrc credentials.
+
+        The URL must already be encoded, as Client builds it.
+
+        :returns: the prepared request and keyword arguments for Session.send,
+            or None if the request has to be prepared by Session.request, e.g.
+            for a body or cookies of the session.
+        :rtype: tuple of (requests.PreparedRequest, dict)
+        """
+        if kwargs or self.session.cookies:
+            return None, None
+
+        parts = urlsplit(url)
+        key = (method, parts.scheme, parts.netloc, tuple(sorted((headers or {}).items())))
+        template = self._templates.get(key)
+        if template is None:
+            host_url = parts.scheme + "://" + parts.netloc + "/"
+            template = (self.session.prepare_request(requests.Request(method, host_url, headers=headers)),
+                        self.session.merge_environment_settings(host_url, {}, None, None, None))
+            self._templates[key] = template
+
+        prepared = template[0].copy()
+        prepared.url = url
+
+        return prepared, dict(template[1], timeout=timeout, allow_redirects=True)
+
+    def warm_up(self, url):
+        """
+        Opens a connection to the host of a URL from a background thread, so
+        the first request doesn't wait for the DNS lookup and TLS handshake.
+
+        :param url: Any URL of the host, e.g. the provider's base URL.
+        :type url: str
+        """
+        def head():
+            try:
+                self.session.head(url, timeout=_WARM_UP_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                logger.log("Couldn't warm up the connection to {}: {}".format(url, e), 0)
+
+        threading.Thread(target=head, daemon=True).start()
+
+    def close(self):
+        self.session.close()
+
+
+class QgsTransport:
+    """
+    Sends requests with QGIS' network access manager, which applies the
+    proxy, SSL and authentication settings of QGIS.
+    """
+
+    def __init__(self, authcfg=None):
+        """
+        :param authcfg: ID of a QGIS authentication configuration to apply to requests.
+        :type authcfg: str
+        """
+        self.authcfg = authcfg or ''
+
+    def request(self, method, url, headers=None, timeout=None, json=None, **kwargs):
+        """
+        Blocks the calling thread until the request finished, see RequestsTransport.request.
+
+        :param kwargs: Other keyword arguments for requests, which don't apply here.
+        :type kwargs: dict
+
+        :rtype: Response
+        """
+        request = self.build_request(url, headers, timeout)
+        blocking = QgsBlockingNetworkRequest()
+        blocking.setAuthCfg(self.authcfg)
+
+        start = time.time()
+        if method == 'POST':
+            request.setHeader(QNetworkRequest.ContentTypeHeader, 'application/json')
+            error_code = blocking.post(request, QByteArray(_dumps(json)), True)
+        else:
+            error_code = blocking.get(request, True)
+
+        if error_code == QgsBlockingNetworkRequest.TimeoutError:
+            raise exceptions.Timeout()
+
+        reply = blocking.reply()
+        response = to_response(reply, reply.content())
+        response.elapsed = time.time() - start
+
+        return response
+
+    @staticmethod
+    def build_request(url, headers=None, timeout=None):
+        """
+        :param url: Full URL of the request.
+        :type url: str
+
+        :param headers: Request headers.
+        :type headers: dict
+
+        :param timeout: Timeout in seconds.
+        :type timeout: float
+
+        :rtype: QNetworkRequest
+        """
+        request = QNetworkRequest(QUrl(url))
+        for name, value in (headers or {}).items():
+            request.setRawHeader(name.encode('latin-1'), value.encode('latin-1'))
+        # Qt >= 5.15, otherwise QgsNetworkAccessManager's timeout applies
+        if timeout and hasattr(request, 'setTransferTimeout'):
+            request.setTransferTimeout(int(timeout * 1000))
+
+        return request
+
+    def close(self):
+        # Connections are owned by QgsNetworkAccessManager
+        pass
+
+
+def _dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+def to_response(reply, content):
+    """
+    Converts a finished Qt network reply to a Response.
+
+    :param reply: The finished reply.
+    :type reply: QNetworkReply or QgsNetworkReplyContent
+
+    :param content: Body of the reply.
+    :type content: QByteArray
+
+    :raises PeliasGeocoding.utils.exceptions.Timeout: when the request timed out.
+    :raises PeliasGeocoding.utils.exceptions.NetworkError: when no HTTP response was received.
+
+    :rtype: Response
+    """
+    status_code = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+    if status_code is None:
+        # Transfer timeouts abort the reply
+        if reply.error() in (QNetworkReply.TimeoutError, QNetworkReply.OperationCanceledError):
+            raise exceptions.Timeout()
+        raise exceptions.NetworkError(reply.errorString())
+
+    headers = CaseInsensitiveDict(
+        (bytes(name).decode('latin-1'), bytes(value).decode('latin-1'))
+        for name, value in reply.rawHeaderPairs()
+    )
+
+    return Response(int(status_code), headers, bytes(content))
+
+
+class EventLoopBatchRequester:
+    """
+    Multiplexes the requests of batch jobs on a Qt event loop in the calling
+    thread, see BatchRequester. All replies are handled by the calling
+    thread's QgsNetworkAccessManager, no worker threads are started.
+    """
+
+    def __init__(self, clnt, url, concurrency=1, use_cache=True, authcfg=None):
+        """
+        :param clnt: Client to perform the requests with.
+        :type clnt: PeliasGeocoding.core.client.Client
+
+        :param url: URL extension of the endpoint. Should begin with a slash.
+        :type url: str
+
+        :param concurrency: Maximum number of requests in flight.
+        :type concurrency: int
+
+        :param use_cache: Whether requests may be answered from the response cache.
+        :type use_cache: bool
+
+        :param authcfg: ID of a QGIS authentication configuration to apply to requests.
+        :type authcfg: str
+        """
+        self.clnt = clnt
+        self.url = url
+        self.concurrency = concurrency
+        self.use_cache = use_cache
+        self.authcfg = authcfg or ''
+
+    def run(self, items, feedback):
+        """
+        Generator which sends the requests on the event loop and yields their
+        results in order of completion.
+
+        :param items: Input ID and request parameters per request.
+        :type items: iterable of (any, dict)
+
+        :param feedback: Processing feedback to check for cancellation.
+        :type feedback: QgsProcessingFeedback
+
+        :returns: yields the input ID and the finished future of its request
+        :rtype: tuple of (any, concurrent.futures.Future)
+        """
+        clnt = self.clnt
+        nam = QgsNetworkAccessManager.instance()
+        loop = QEventLoop()
+        finished = collections.deque()
+        pending = dict()
+        timers = set()
+        # Set on cancellation, so no timer sends a request anymore
+        cancelled = threading.Event()
+
+        # Wakes the loop up regularly to check for cancellation
+        poll = QTimer()
+        poll.setInterval(_POLL_INTERVAL)
+        poll.timeout.connect(loop.quit)
+
+        def call_later(seconds, callback):
+            if seconds <= 0:
+                callback()
+                return
+            timer = QTimer()
+            timer.setSingleShot(True)
+            timer.timeout.connect(partial(timers.discard, timer))
+            timer.timeout.connect(callback)
+            timers.add(timer)
+            timer.start(int(seconds * 1000))
+
+        def finish(state, result):
+            del pending[id(state)]
+            future = Future()
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+            finished.append((state['in_id'], future))
+            loop.quit()
+
+        def send(state):
+            if cancelled.is_set():
+                return
+            if datetime.now() - state['first_request_time'] > clnt.retry_timeout:
+                finish(state, exceptions.Timeout())
+                return
+            try:
+                wait = clnt._reserve(state['first_request_time'])
+            except (exceptions.OverQueryLimit, exceptions.ProviderUnavailable) as e:
+                finish(state, e)
+                return
+            call_later(wait, partial(get, state))
+
+        def get(state):
+            if cancelled.is_set():
+                return
+            clnt.metrics.increment('requests')
+            request = QgsTransport.build_request(state['url'],
+                                                 clnt.requests_kwargs['headers'],
+                                                 clnt.requests_kwargs['timeout'])
+            if self.authcfg:
+                QgsApplication.authManager().updateNetworkRequest(request, self.authcfg)
+            state['start'] = time.time()
+            reply = nam.get(request)
+            state['reply'] = reply
+            reply.finished.connect(partial(on_finished, state))
+
+        def on_finished(state):
+            reply = state.pop('reply')
+            if self.authcfg:
+                QgsApplication.authManager().updateNetworkReply(reply, self.authcfg)
+
+            response = None
+            try:
+                response = to_response(reply, reply.readAll())
+                latency = time.time() - state['start']
+                clnt.metrics.add_latency(latency)
+                clnt._on_response(response, state['start'])
+                result = clnt._get_body(response)
+                clnt._on_success(latency)
+            except (exceptions.Timeout,
+                    exceptions.NetworkError,
+                    exceptions.OverQueryLimit,
+                    exceptions.GenericServerError) as e:
+                error = e
+            except Exception as e:
+                logger.log("{}: {}".format(e.__class__.__name__, str(e)), 2)
+                finish(state, e)
+                return
+            else:
+                if state['cache_key'] is not None:
+                    clnt.cache.set(state['cache_key'], clnt.name, result)
+                finish(state, result)
+                return
+            finally:
+                reply.deleteLater()
+
+            try:
+                state['attempt'], sleep_for = clnt._get_retry_delay(error,
+                                                                    response,
+                                                                    state['attempt'],
+                                                                    state['first_request_time'])
+            except Exception as e:
+                finish(state, e)
+                return
+            call_later(sleep_for, partial(send, state))
+
+        items = iter(items)
+        exhausted = False
+        paused = False
+        poll.start()
+        try:
+            while True:
+                paused = batch.check_provider(clnt, feedback, paused)
+                while not exhausted and len(pending) < batch.max_in_flight(clnt, self.concurrency) \
+                        and not feedback.isCanceled():
+                    try:
+                        in_id, params = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    state = dict(in_id=in_id, attempt=0, first_request_time=datetime.now())
+                    pending[id(state)] = state
+                    state['cache_key'], result = clnt._get_cached(self.url, params, self.use_cache)
+                    if result is not None:
+                        finish(state, result)
+                        continue
+                    state['url'] = clnt.base_url + clnt._generate_auth_url(self.url, params)
+                    send(state)
+
+                while finished:
+                    yield finished.popleft()
+
+                if (exhausted and not pending) or feedback.isCanceled():
+                    break
+
+                loop.exec_()
+        finally:
+            cancelled.set()
+            poll.stop()
+            # Requests still in flight are dropped
+            for timer in timers:
+                timer.stop()
+            for state in pending.values():
+                reply = state.pop('reply', None)
+                if reply is not None:
+                    reply.finished.disconnect()
+                    reply.abort()
+                    reply.deleteLater()
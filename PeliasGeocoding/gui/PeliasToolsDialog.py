@@ -30,10 +30,13 @@ from PyQt5.QtWidgets import (QAction,
                              QInputDialog,
                              QMenu,
                              QMessageBox,
+                             QPushButton,
                              QToolBar)
-from PyQt5.QtCore import QVariant
+from PyQt5.QtCore import QObject, QTimer, QVariant, pyqtSlot
 from PyQt5.QtGui import QPixmap, QIcon
-from qgis.core import (QgsProject,
+from qgis.core import (Qgis,
+                       QgsApplication,
+                       QgsProject,
                        QgsField)
 from qgis.gui import QgsFilterLineEdit, QgsCollapsibleGroupBox
 import processing
@@ -42,7 +45,7 @@ from . import resources_rc
 from .PeliasMainUI import Ui_PeliasMainDialog
 from .PeliasToolsDialogConfig import PeliasToolsDialogConfigMain
 from PeliasGeocoding import BASE_DIR, CONFIG, PLUGIN_NAME, RESOURCE_PREFIX, DEFAULT_COLOR, __email__, __web__, __version__, __help__
-from PeliasGeocoding.core import client, response_handler
+from PeliasGeocoding.core import client, response_handler, tasks
 from PeliasGeocoding.utils import maptools, configmanager, logger, exceptions
 
 
@@ -114,6 +117,70 @@ def populate_providers(combobox):
             combobox.addItem(provider_name)
 
 
+class TaskMessage(QObject):
+    """Message bar item for a running request task with a cancel button and a rate limit countdown."""
+
+    def __init__(self, iface, task):
+        """
+        :param iface: QGIS interface
+        :type iface: QgisInterface
+
+        :param task: The running request task.
+        :type task: PeliasGeocoding.core.tasks.RequestTask
+        """
+        QObject.__init__(self)
+
+        self.iface = iface
+        self.task = task
+        self.remaining = 0
+
+        self.item = self.iface.messageBar().createMessage(PLUGIN_NAME, task.description() + '...')
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(self.cancel)
+        self.item.layout().addWidget(cancel_button)
+        self.iface.messageBar().pushWidget(self.item, Qgis.Info)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._tick)
+        task.overQueryLimit.connect(self.start_countdown)
+
+    @pyqtSlot(int)
+    def start_countdown(self, seconds):
+        """
+        Counts down the time the client waits for the provider's rate limit.
+
+        :param seconds: seconds to wait
+        :type seconds: int
+        """
+        self.remaining = seconds
+        self._tick()
+        self.timer.start(1000)
+
+    def _tick(self):
+        """Updates the countdown every second."""
+        if self.remaining <= 0:
+            self.timer.stop()
+            self.item.setText(self.task.description() + '...')
+            return
+
+        self.item.setText("{}: over query limit, retrying in {} seconds...".format(self.task.description(), self.remaining))
+        self.remaining -= 1
+
+    def cancel(self):
+        """Cancels the task, its result will be discarded."""
+        self.task.cancel()
+        self.close()
+
+    def close(self):
+        """Removes the message from the message bar."""
+        self.timer.stop()
+        try:
+            self.iface.messageBar().popWidget(self.item)
+        except RuntimeError:
+            # already closed by the user
+            pass
+
+
 class PeliasToolsDialogMain:
     """Defines all mandatory QGIS things about dialog."""
 
@@ -138,6 +205,9 @@ class PeliasToolsDialogMain:
         self.last_maptool = None
         self.point_tool = None
 
+        # Keep references to running tasks and their messages, so they're not garbage collected
+        self.tasks = []
+
     def initGui(self):
         """Called when plugin is activated (on QGIS startup or when activated in Plugin Manager)."""
 
@@ -226,6 +296,11 @@ class PeliasToolsDialogMain:
         del self.toolbar
         del self.dlg
 
+        for task, message in self.tasks:
+            message.cancel()
+
+        client.close_clients()
+
         with open(os.path.join(BASE_DIR, 'config.ini'), 'w') as configfile:
             CONFIG.write(configfile)
 
@@ -263,6 +338,50 @@ class PeliasToolsDialogMain:
         return providers, provider_name, ok
 
 
+    def _start_task(self, task, on_finished):
+        """
+        Runs a request task in the background and shows it in the message bar.
+
+        :param task: The request task to run.
+        :type task: PeliasGeocoding.core.tasks.RequestTask
+
+        :param on_finished: Called with the task in the GUI thread when it finished, unless it was canceled.
+        :type on_finished: function
+        """
+        message = TaskMessage(self.iface, task)
+        self.tasks.append((task, message))
+
+        def finish():
+            message.close()
+            self.tasks.remove((task, message))
+            if not task.isCanceled():
+                on_finished(task)
+
+        task.taskCompleted.connect(finish)
+        task.taskTerminated.connect(finish)
+        QgsApplication.taskManager().addTask(task)
+
+    def _add_quick_layer(self, task, method):
+        """
+        Adds the result of a quick geocoding task to the project.
+
+        :param task: The finished request task.
+        :type task: PeliasGeocoding.core.tasks.RequestTask
+
+        :param method: Endpoint which was requested, names the layer.
+        :type method: str
+        """
+        if task.error is not None:
+            msg = "{}: {}".format(task.error.__class__.__name__, str(task.error))
+            logger.log(msg, 2)
+            self.iface.messageBar().pushCritical(PLUGIN_NAME, msg)
+            return
+
+        responsehandler = response_handler.ResponseHandler(QgsField('id', QVariant.String))
+        layer_out = responsehandler.get_layer(method, task.response)
+        layer_out.updateExtents()
+        self.project.addMapLayer(layer_out)
+
     def _forward_geocode(self):
         """Performs quick forward geocoding"""
 
@@ -278,14 +397,13 @@ class PeliasToolsDialogMain:
             return
         if ok:
             provider = [provider for provider in providers if provider['name'] == provider_name][0]
-            clnt = client.Client(provider)
-            responsehandler = response_handler.ResponseHandler(QgsField('id', QVariant.String))
-            response = clnt.request(provider['endpoints']['search'],
+            clnt = client.get_client(provider)
+            task = tasks.RequestTask('Pelias forward geocoding',
+                                     clnt,
+                                     provider['endpoints']['search'],
                                      {'text': address,
                                       'size': 5})
-            layer_out = responsehandler.get_layer('search', response)
-            layer_out.updateExtents()
-            self.project.addMapLayer(layer_out)
+            self._start_task(task, lambda task: self._add_quick_layer(task, 'search'))
             CONFIG['provider']['last_used'] = provider_name
 
     def _init_reverse(self):
@@ -305,18 +423,15 @@ class PeliasToolsDialogMain:
             no_provider_warning(self.iface)
         if ok:
             provider = [provider for provider in providers if provider['name'] == provider_name][0]
-            clnt = client.Client(provider)
-            responsehandler = response_handler.ResponseHandler(QgsField('id', QVariant.String))
+            clnt = client.get_client(provider)
             try:
-                response = clnt.request(provider['endpoints']['reverse'],
+                task = tasks.RequestTask('Pelias reverse geocoding',
+                                         clnt,
+                                         provider['endpoints']['reverse'],
                                          {'point.lat': point.y(),
                                           'point.lon': point.x(),
                                           'size': 5})
-                layer_out = responsehandler.get_layer('reverse', response)
-                layer_out.updateExtents()
-                self.project.addMapLayer(layer_out)
-            except:
-                raise
+                self._start_task(task, lambda task: self._add_quick_layer(task, 'reverse'))
             finally:
                 QApplication.restoreOverrideCursor()
                 self.point_tool.canvasClicked.disconnect()
@@ -376,9 +491,19 @@ class PeliasToolsDialogMain:
             self.dlg.buttonBox.accepted.connect(self._run_main_dialog)
 
         populate_providers(self.dlg.provider_combo)
+        self._warm_up_last_used()
 
         self.dlg.show()
 
+    @staticmethod
+    def _warm_up_last_used():
+        """Connects to the last used provider while the user fills in the dialog."""
+        providers, providers_names = get_provider_list()
+        for provider in providers:
+            if provider['name'] == CONFIG['provider'].get('last_used') and provider['name'] in providers_names:
+                client.get_client(provider).warm_up()
+                break
+
     def _run_main_dialog(self):
         """Runs the main function when Apply is clicked."""
 
@@ -389,12 +514,7 @@ class PeliasToolsDialogMain:
             no_provider_warning(self.iface)
             return
 
-        clnt = client.Client(provider=provider)  # provider object has all data from providers.yml
-        clnt_msg = ''
-
-        # Notify user when query limit is reached
-        sleep_notifier = "OverQueryLimit: Wait for {} seconds"
-        clnt.overQueryLimit.connect(lambda sleep_for: self.dlg.debug_text.setText(sleep_notifier.format(str(sleep_for))))
+        clnt = client.get_client(provider)  # provider object has all data from providers.yml
 
         # Collect base parameters common for both endpoints
         params = self._collect_base_params()
@@ -418,20 +538,48 @@ class PeliasToolsDialogMain:
 
         responsehandler = response_handler.ResponseHandler(QgsField('id', QVariant.String),
                                                            self.dlg.debug_check.isChecked())
+
+        task = tasks.RequestTask('Pelias {} geocoding'.format(method),
+                                 clnt,
+                                 provider['endpoints'][method],
+                                 params)
+        self._start_task(task, lambda task: self._on_main_dialog_finished(task, method, responsehandler))
+
+        # Update last_used provider
+        CONFIG['provider']['last_used'] = provider['name']
+
+    def _on_main_dialog_finished(self, task, method, responsehandler):
+        """
+        Adds the result of the main dialog's request to the project and writes the debug output.
+
+        :param task: The finished request task.
+        :type task: PeliasGeocoding.core.tasks.RequestTask
+
+        :param method: Endpoint which was requested.
+        :type method: str
+
+        :param responsehandler: Builds the output layer.
+        :type responsehandler: PeliasGeocoding.core.response_handler.ResponseHandler
+        """
+        clnt_msg = ''
+
         try:
-            response = clnt.request(provider['endpoints'][method],
-                                    params)
-            layer_out = responsehandler.get_layer(method, response)
+            if task.error is not None:
+                raise task.error
+            layer_out = responsehandler.get_layer(method, task.response)
             layer_out.updateExtents()
             self.project.addMapLayer(layer_out)
         except exceptions.Timeout:
             msg = "The connection has timed out!"
             logger.log(msg, 2)
-            self.dlg.debug_text.setText(msg)
+            clnt_msg += "<b>{}</b><br>".format(msg)
 
         except (exceptions.ApiError,
                 exceptions.InvalidKey,
-                exceptions.GenericServerError) as e:
+                exceptions.GenericServerError,
+                exceptions.OverQueryLimit,
+                exceptions.NetworkError,
+                exceptions.ProviderUnavailable) as e:
 
             msg = [e.__class__.__name__ ,
                    str(e)]
@@ -447,17 +595,14 @@ class PeliasToolsDialogMain:
 
         finally:
             # Write some output
-            if clnt.warnings is not None:
-                for warning in clnt.warnings:
+            if task.warnings is not None:
+                for warning in task.warnings:
                     clnt_msg += "<b>Warning</b>: {}<br>".format(warning)
                     logger.log(warning, 1)
 
-            clnt_msg += '<a href="{0}">{0}</a><br>'.format(clnt.url)
+            clnt_msg += '<a href="{0}">{0}</a><br>'.format(task.request_url)
             self.dlg.debug_text.setHtml(clnt_msg)
 
-            # Update last_used provider
-            CONFIG['provider']['last_used'] = provider['name']
-
 
 class PeliasToolsDialog(QDialog, Ui_PeliasMainDialog):
     """Define the custom behaviour of Dialog, more Qt related"""
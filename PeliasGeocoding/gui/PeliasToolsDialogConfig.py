@@ -23,11 +23,13 @@
 
 from PyQt5 import QtWidgets
 from PyQt5.QtCore import QMetaObject
-from PyQt5.QtWidgets import QDialog, QInputDialog
+from PyQt5.QtWidgets import QDialog, QDialogButtonBox, QInputDialog, QMessageBox
 
 from qgis.gui import QgsCollapsibleGroupBox
 
 from .PeliasToolsConfigUI import Ui_PeliasToolsDialogConfigBase
+from PeliasGeocoding.core import cache
+from PeliasGeocoding.core.ratelimiter import UNITS, get_limits
 from PeliasGeocoding.utils import configmanager
 
 
@@ -53,6 +55,10 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
         self.provider_add.clicked.connect(self._add_provider)
         self.provider_remove.clicked.connect(self._remove_provider)
 
+        self.cache_clear = self.buttonBox.addButton("Clear cache", QDialogButtonBox.ResetRole)
+        self.cache_clear.setToolTip("Delete all cached responses of all providers.")
+        self.cache_clear.clicked.connect(self._clear_cache)
+
     def accept(self):
         """When the OK Button is clicked, in-memory temp_config is updated and written to providers.yml"""
 
@@ -61,8 +67,16 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
             current_provider = self.temp_config['providers'][idx]
             current_provider['key'] = box.findChild(QtWidgets.QLineEdit, box.title() + "_key_text").text()
             current_provider['base_url'] = box.findChild(QtWidgets.QLineEdit, box.title() + "_base_url_text").text()
-            current_provider['limit'] = box.findChild(QtWidgets.QSpinBox, box.title() + "_request_value").value()
-            current_provider['unit'] = box.findChild(QtWidgets.QComboBox, box.title() + "_request_unit").currentText()
+            current_provider['limits'] = []
+            for unit in UNITS:
+                limit = box.findChild(QtWidgets.QSpinBox, box.title() + "_limit_" + unit).value()
+                if limit:
+                    current_provider['limits'].append(dict(limit=limit, unit=unit))
+            # replaced by limits
+            current_provider.pop('limit', None)
+            current_provider.pop('unit', None)
+            current_provider['concurrency'] = box.findChild(QtWidgets.QSpinBox, box.title() + "_concurrency_value").value()
+            current_provider['cache_ttl'] = box.findChild(QtWidgets.QSpinBox, box.title() + "_cache_ttl_value").value()
 
         configmanager.write_config(self.temp_config)
         self.close()
@@ -74,8 +88,9 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
             self._add_box(provider_entry['name'],
                           provider_entry['base_url'],
                           provider_entry['key'],
-                          provider_entry['limit'],
-                          provider_entry['unit'],
+                          get_limits(provider_entry),
+                          provider_entry.get('concurrency') or 1,
+                          provider_entry.get('cache_ttl') or 0,
                           new=False)
 
         self.gridLayout.addWidget(self.providers, 0, 0, 1, 3)
@@ -93,7 +108,7 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
         # Show quick user input dialog
         provider_name, ok = QInputDialog.getText(self, "New Pelias provider", "Enter a name for the provider")
         if ok:
-            self._add_box(provider_name, 'https://', '', 0, 'minute', new=True)
+            self._add_box(provider_name, 'https://', '', [], 1, 30, new=True)
 
     def _remove_provider(self):
         """Remove provider from list"""
@@ -114,6 +129,12 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
             provider_id = providers.index(provider)
             del self.temp_config['providers'][provider_id]
 
+    def _clear_cache(self):
+        """Deletes all cached responses"""
+
+        cache.get_cache().clear()
+        QMessageBox.information(self, "Response cache", "All cached responses were deleted.")
+
     def _collapse_boxes(self):
         """Collapse all QgsCollapsibleGroupBoxes"""
 
@@ -121,7 +142,7 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
         for box in collapsible_boxes:
             box.setCollapsed(True)
 
-    def _add_box(self, name, url, key, limit, unit, new=False):
+    def _add_box(self, name, url, key, limits, concurrency, cache_ttl, new=False):
         """
         Adds a provider box to the QWidget layout and self.temp_config.
 
@@ -134,11 +155,14 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
         :param key: user's API key
         :type key: str
 
-        :param limit: value of API key limit
-        :type limit: int
+        :param limits: limit and unit of every rate limit window of the API key.
+        :type limits: list of (int, str)
+
+        :param concurrency: number of requests in flight for batch jobs.
+        :type concurrency: int
 
-        :param unit: unit of API key limit.
-        :type unit: str
+        :param cache_ttl: days until cached responses expire, 0 disables the cache.
+        :type cache_ttl: int
 
         :param new: Specifies whether user wants to insert provider or the GUI is being built.
         :type new: boolean
@@ -149,8 +173,9 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
                     name=name,
                     base_url=url,
                     key=key,
-                    limit=limit,
-                    unit=unit,
+                    limits=[dict(limit=limit, unit=unit) for limit, unit in limits],
+                    concurrency=concurrency,
+                    cache_ttl=cache_ttl,
                     endpoints={
                         "search": "/search",
                         "structured": "/search/structured",
@@ -168,11 +193,6 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
         key_label.setObjectName(name + '_key_label')
         key_label.setText('API Key')
         gridLayout_3.addWidget(key_label, 0, 0, 1, 1)
-        label = QtWidgets.QLabel(provider)
-        label.setObjectName(name + "_label")
-        label.setWhatsThis("How many requests you can fire within a second/minute/hour. Depending on your provider")
-        label.setText("Requests per")
-        gridLayout_3.addWidget(label, 4, 1, 1, 1)
         base_url_text = QtWidgets.QLineEdit(provider)
         base_url_text.setObjectName(name + "_base_url_text")
         base_url_text.setText(url)
@@ -181,18 +201,40 @@ class PeliasToolsDialogConfigMain(QDialog, Ui_PeliasToolsDialogConfigBase):
         key_text.setObjectName(name + "_key_text")
         key_text.setText(key)
         gridLayout_3.addWidget(key_text, 1, 0, 1, 4)
-        request_value = QtWidgets.QSpinBox(provider)
-        request_value.setObjectName(name + "_request_value")
-        request_value.setMaximum(10000)
-        request_value.setValue(limit)
-        gridLayout_3.addWidget(request_value, 4, 0, 1, 1)
-        request_unit = QtWidgets.QComboBox(provider)
-        request_unit.setObjectName(name + "_request_unit")
-        request_unit.addItem("second")
-        request_unit.addItem("minute")
-        current_unit_index = request_unit.findText(unit)
-        request_unit.setCurrentIndex(current_unit_index)
-        gridLayout_3.addWidget(request_unit, 4, 2, 1, 2)
+        limits_by_unit = dict((unit, limit) for limit, unit in limits)
+        for row, unit in enumerate(UNITS, 4):
+            limit_value = QtWidgets.QSpinBox(provider)
+            limit_value.setObjectName(name + "_limit_" + unit)
+            limit_value.setMaximum(10000000)
+            limit_value.setValue(limits_by_unit.get(unit, 0))
+            gridLayout_3.addWidget(limit_value, row, 0, 1, 1)
+            limit_label = QtWidgets.QLabel(provider)
+            limit_label.setObjectName(name + "_limit_label_" + unit)
+            limit_label.setWhatsThis("How many requests you can fire within a {}. Depending on your provider, "
+                                     "0 for no limit. All limits apply at once.".format(unit))
+            limit_label.setText("Requests per " + unit)
+            gridLayout_3.addWidget(limit_label, row, 1, 1, 3)
+        concurrency_value = QtWidgets.QSpinBox(provider)
+        concurrency_value.setObjectName(name + "_concurrency_value")
+        concurrency_value.setMinimum(1)
+        concurrency_value.setMaximum(256)
+        concurrency_value.setValue(concurrency)
+        gridLayout_3.addWidget(concurrency_value, 8, 0, 1, 1)
+        concurrency_label = QtWidgets.QLabel(provider)
+        concurrency_label.setObjectName(name + "_concurrency_label")
+        concurrency_label.setWhatsThis("How many requests batch jobs keep in flight at the same time. Capped by the request limit.")
+        concurrency_label.setText("Concurrent requests")
+        gridLayout_3.addWidget(concurrency_label, 8, 1, 1, 3)
+        cache_ttl_value = QtWidgets.QSpinBox(provider)
+        cache_ttl_value.setObjectName(name + "_cache_ttl_value")
+        cache_ttl_value.setMaximum(3650)
+        cache_ttl_value.setValue(cache_ttl)
+        gridLayout_3.addWidget(cache_ttl_value, 9, 0, 1, 1)
+        cache_ttl_label = QtWidgets.QLabel(provider)
+        cache_ttl_label.setObjectName(name + "_cache_ttl_label")
+        cache_ttl_label.setWhatsThis("How many days responses are cached on disk. 0 disables the cache for this provider.")
+        cache_ttl_label.setText("Days to cache responses")
+        gridLayout_3.addWidget(cache_ttl_label, 9, 1, 1, 3)
         base_url_label = QtWidgets.QLabel(provider)
         base_url_label.setObjectName("base_url_label")
         base_url_label.setText("Base URL")
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeliasGeocoding
+                                 A QGIS plugin
+ QGIS plugin to query Pelias endpoints from configurable sources.
+                             -------------------
+        begin                : 2019-01-05
+        copyright            : (C) 2019 by Nils Nolde
+        email                : nils@gis-ops.com
+        git sha              : $Format:%H$
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import collections
+import time
+
+from PyQt5.QtCore import Qt
+
+from qgis.core import (QgsFeatureRequest,
+                       QgsMapLayer,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingException,
+                       QgsProcessingFeatureSourceDefinition)
+
+from PeliasGeocoding.core import async_client, batch, checkpoint, client, pool, transport
+from PeliasGeocoding.core.retry import is_transient
+from PeliasGeocoding.utils import exceptions, logger
+
+# Minimum seconds between feedback messages about increased concurrency
+_CONCURRENCY_REPORT_INTERVAL = 5
+
+
+def _get_source(value):
+    """
+    :param value: Value of a processing parameter.
+    :type value: any
+
+    :returns: the value as string, layers as their source
+    :rtype: str
+    """
+    if isinstance(value, QgsProcessingFeatureSourceDefinition):
+        value = (value.source.staticValue(), value.selectedFeaturesOnly)
+    elif isinstance(value, QgsMapLayer):
+        value = value.source()
+    return str(value)
+
+
+class PeliasBaseAlgo(QgsProcessingAlgorithm):
+    """Base class with the request handling common to all Pelias algorithms."""
+
+    IN_POOL = "INPUT_PROVIDER_POOL"
+    IN_RESUME = "INPUT_RESUME"
+    IN_INCREMENTAL = "INPUT_INCREMENTAL"
+    OUT_FAILED = "OUTPUT_FAILED"
+
+    def _get_client(self, providers, parameters, context):
+        """
+        Returns the client of the chosen provider or, if several providers are
+        chosen as provider pool, a pool spreading the requests across them.
+
+        :param providers: All providers from providers.yml.
+        :type providers: list of dict
+
+        :returns: client and the provider settings to process the requests with
+        :rtype: tuple of (PeliasGeocoding.core.client.Client or PeliasGeocoding.core.pool.ProviderPool, dict)
+        """
+        pool_indices = self.parameterAsEnums(parameters, self.IN_POOL, context)
+        if len(pool_indices) > 1:
+            provider_pool = pool.ProviderPool([providers[idx] for idx in pool_indices])
+            return provider_pool, provider_pool.provider
+
+        if pool_indices:
+            provider = providers[pool_indices[0]]
+        else:
+            provider = providers[self.parameterAsEnum(parameters, self.IN_PROVIDER, context)]
+        return client.get_client(provider), provider
+
+    @staticmethod
+    def _get_attributes_request(in_source, field_names, geometry=False):
+        """
+        Returns a request reading only the given attributes of the input features.
+
+        :param in_source: Input features.
+        :type in_source: QgsProcessingFeatureSource
+
+        :param field_names: Names of the fields to read, empty for optional fields not set.
+        :type field_names: list of str
+
+        :param geometry: Whether to read the geometries as well.
+        :type geometry: bool
+
+        :returns: feature request and index of each field in the features' attributes,
+            -1 for fields not set
+        :rtype: tuple of (QgsFeatureRequest, list of int)
+        """
+        fields = in_source.fields()
+        indices = [fields.lookupField(name) if name else -1 for name in field_names]
+
+        request = QgsFeatureRequest()
+        if not geometry:
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([idx for idx in indices if idx >= 0])
+
+        return request, indices
+
+    def _get_journal(self, parameters, context, clnt, url):
+        """
+        Opens the checkpoint journal of the job, which is the same for all
+        runs with the same parameters, or in incremental mode the results of
+        all earlier runs on the same input layer.
+
+        :param clnt: Client or provider pool performing the requests.
+        :type clnt: PeliasGeocoding.core.client.Client or PeliasGeocoding.core.pool.ProviderPool
+
+        :param url: Prepared query of the job.
+        :type url: PeliasGeocoding.core.query.PreparedQuery
+
+        :returns: the journal, keeping the results of earlier runs if resuming or incremental
+        :rtype: PeliasGeocoding.core.checkpoint.Checkpoint or PeliasGeocoding.core.checkpoint.ResultStore
+        """
+        if self.parameterAsBool(parameters, self.IN_INCREMENTAL, context):
+            # Keyed on the data source, layer IDs change when the layer is loaded again
+            value = parameters[self.IN_POINTS]
+            layer = self.parameterAsVectorLayer(parameters, self.IN_POINTS, context)
+            selected = isinstance(value, QgsProcessingFeatureSourceDefinition) and value.selectedFeaturesOnly
+            source = [(self.IN_POINTS, layer.source() if layer is not None else _get_source(value)),
+                      ('selected', str(selected)),
+                      (self.IN_ID_FIELD, _get_source(parameters[self.IN_ID_FIELD]))]
+            signature = [('provider', clnt.name), ('endpoint', url.path)]
+            signature += [(name, str(value)) for name, value in url.params.items()]
+            return checkpoint.ResultStore(checkpoint.get_path(self.name(), source, 'incremental'), signature)
+
+        settings = []
+        for name, value in parameters.items():
+            if name in (self.OUT, self.OUT_FAILED, self.IN_RESUME, self.IN_INCREMENTAL, self.IN_BYPASS_CACHE):
+                continue
+            settings.append((name, _get_source(value)))
+
+        return checkpoint.Checkpoint(checkpoint.get_path(self.name(), settings),
+                                     resume=self.parameterAsBool(parameters, self.IN_RESUME, context))
+
+    def _process_requests(self, clnt, url, provider, items, total, responsehandler, sink, feedback, use_cache=True,
+                          prepare_response=None, journal=None, failed_sink=None):
+        """
+        Dispatches the requests concurrently and writes the responses to the sink.
+        Duplicate requests are only sent once and their response is written
+        for every input feature.
+
+        :param clnt: Client to perform the requests with.
+        :type clnt: PeliasGeocoding.core.client.Client or PeliasGeocoding.core.pool.ProviderPool
+
+        :param url: URL extension of the endpoint, or a query prepared for it.
+        :type url: str or PeliasGeocoding.core.query.PreparedQuery
+
+        :param provider: The provider from providers.yml
+        :type provider: dict
+
+        :param items: Input ID and request parameters per input feature, which
+            are added to the constant parameters of a prepared query.
+        :type items: iterable of (any, dict)
+
+        :param total: Number of input features for progress reporting.
+        :type total: int
+
+        :param responsehandler: Builds the output features.
+        :type responsehandler: PeliasGeocoding.core.response_handler.ResponseHandler
+
+        :param sink: Output sink.
+        :type sink: QgsFeatureSink
+
+        :param feedback: Processing feedback.
+        :type feedback: QgsProcessingFeedback
+
+        :param use_cache: Whether requests may be answered from the response cache.
+        :type use_cache: bool
+
+        :param prepare_response: Optional function altering a response before it's
+            written for one input ID, called with the response and the input ID.
+        :type prepare_response: function
+
+        :param journal: Optional checkpoint journal or result store, to skip the input
+            features it has results for and to journal new results. It's completed once
+            all requests succeeded, otherwise kept to resume the job.
+        :type journal: PeliasGeocoding.core.checkpoint.Checkpoint
+
+        :param failed_sink: Optional sink for the input IDs of failed requests and their errors.
+        :type failed_sink: QgsFeatureSink
+        """
+        engine = provider.get('engine')
+        if engine == 'asyncio':
+            requester = async_client.AsyncBatchRequester(clnt, url, batch.get_concurrency(provider), use_cache,
+                                                         provider.get('connections') or 10)
+        elif engine == 'qt':
+            requester = transport.EventLoopBatchRequester(clnt, url, batch.get_concurrency(provider), use_cache,
+                                                          provider.get('authcfg'))
+        else:
+            requester = batch.BatchRequester(clnt, url, batch.get_concurrency(provider), use_cache)
+        metrics_start = clnt.metrics.snapshot()
+
+        completed = []
+        if journal is not None:
+            items, completed = journal.split(items)
+            if completed:
+                feedback.pushInfo("{} input features were completed by earlier runs, copying their results.".format(
+                    len(completed)))
+
+        groups = batch.group_requests(items)
+        if groups:
+            n_features = sum(len(in_ids) for in_ids, _ in groups)
+            feedback.pushInfo("{} input features require {} unique requests, {:.1f}% are duplicates.".format(
+                n_features,
+                len(groups),
+                100.0 * (n_features - len(groups)) / n_features))
+
+        controller = clnt.adaptive_concurrency
+        if controller is not None:
+            feedback.pushInfo("Adaptive concurrency: starting with {} of at most {} requests in flight.".format(
+                controller.limit, controller.maximum))
+
+        def report_concurrency(changes, limit, reported):
+            """Pushes every decrease and the increases at most every few seconds."""
+            for seq, new_limit, reason in changes:
+                if new_limit < limit or new_limit == controller.maximum or \
+                        time.time() - reported >= _CONCURRENCY_REPORT_INTERVAL:
+                    feedback.pushInfo("Concurrency changed to {}: {}".format(new_limit, reason))
+                    reported = time.time()
+                limit = new_limit
+            return limit, reported
+
+        # Input IDs and error of requests which failed for good
+        failed = []
+
+        # Waits after HTTP 429, emitted by the requester's worker threads
+        over_query_limits = collections.deque()
+
+        def on_over_query_limit(sleep_for):
+            over_query_limits.append(sleep_for)
+
+        def report_over_query_limits():
+            """Reports the waits from the processing thread, feedback isn't thread-safe."""
+            while over_query_limits:
+                feedback.reportError("OverQueryLimit: Wait for {} seconds".format(over_query_limits.popleft()))
+
+        def write_out_features(in_id_field_values, response, provider_name):
+            for in_id_field_value in in_id_field_values:
+                response_out = response
+                if prepare_response is not None:
+                    response_out = prepare_response(response, in_id_field_value)
+                yield from responsehandler.generate_out_features(response_out, in_id_field_value, provider_name)
+
+        def request_out_features(groups, retry_groups, on_result):
+            """
+            Sends the requests of the groups and yields the output features. Groups whose request
+            failed with a transient error are added to retry_groups, unless it's None.
+            """
+            if controller is not None:
+                changes = controller.changes_since(0)
+                seq = changes[-1][0] if changes else 0
+                limit, reported = controller.limit, time.time()
+
+            items = [(idx, params) for idx, (_, params) in enumerate(groups)]
+            for idx, future in requester.run(items, feedback):
+                in_id_field_values = groups[idx][0]
+                on_result(in_id_field_values)
+                report_over_query_limits()
+
+                if controller is not None:
+                    changes = controller.changes_since(seq)
+                    if changes:
+                        seq = changes[-1][0]
+                        limit, reported = report_concurrency(changes, limit, reported)
+
+                try:
+                    response = future.result()
+                    provider_name = None
+                    if responsehandler.provider_field:
+                        provider_name, response = response
+                except (exceptions.ApiError,
+                        exceptions.GenericServerError,
+                        exceptions.InvalidKey,
+                        exceptions.OverQueryLimit,
+                        exceptions.Timeout,
+                        exceptions.NetworkError,
+                        exceptions.ProviderUnavailable) as e:
+                    msg = "Feature ID {} caused a {}:\n{}".format(
+                        ", ".join(map(str, in_id_field_values)),
+                        e.__class__.__name__,
+                        str(e))
+                    if retry_groups is not None and is_transient(e):
+                        logger.log(msg + "\nRetrying it at the end.", 1)
+                        retry_groups.append(groups[idx])
+                        continue
+                    feedback.reportError(msg)
+                    logger.log(msg, 2)
+                    failed.append((in_id_field_values, e))
+                    continue
+
+                if journal is not None:
+                    journal.add(in_id_field_values, provider_name, response)
+                yield from write_out_features(in_id_field_values, response, provider_name)
+
+        def get_out_features():
+            num = 0
+
+            def on_result(in_id_field_values):
+                nonlocal num
+                num += len(in_id_field_values)
+                feedback.setProgress(int(100.0 / total * num))
+
+            for in_id_field_value, provider_name, response in journal.replay(completed) if completed else []:
+                on_result([in_id_field_value])
+                yield from write_out_features([in_id_field_value], response, provider_name)
+
+            retry_groups = []
+            yield from request_out_features(groups, retry_groups, on_result)
+
+            # Transient errors might be gone by now, the requests were already retried with backoff
+            if retry_groups and not feedback.isCanceled():
+                feedback.pushInfo("Retrying {} requests which failed with transient errors.".format(len(retry_groups)))
+                yield from request_out_features(retry_groups, None, lambda in_id_field_values: None)
+
+        # The client is shared, so only listen while this job is running. The
+        # slot runs in the emitting thread, which has no event loop to queue to.
+        clnt.overQueryLimit.connect(on_over_query_limit, Qt.DirectConnection)
+        try:
+            responsehandler.write_features(sink, get_out_features())
+        except exceptions.ProviderUnavailable as e:
+            # Features written so far are kept
+            raise QgsProcessingException(str(e))
+        finally:
+            clnt.overQueryLimit.disconnect(on_over_query_limit)
+            report_over_query_limits()
+            if journal is not None:
+                journal.close()
+
+        if failed:
+            feedback.reportError("{} requests for {} input features failed.".format(
+                len(failed), sum(len(in_id_field_values) for in_id_field_values, _ in failed)))
+            if failed_sink is not None:
+                responsehandler.write_features(failed_sink, responsehandler.generate_failed_features(failed))
+
+        if journal is not None:
+            if failed or feedback.isCanceled():
+                feedback.pushInfo(journal.resume_hint)
+            else:
+                journal.complete()
+
+        clnt.save_state()
+
+        summary = clnt.metrics.summary(since=metrics_start)
+        if summary:
+            feedback.pushInfo("Request statistics:\n" + summary)
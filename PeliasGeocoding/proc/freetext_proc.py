@@ -28,25 +28,24 @@ from PyQt5.QtGui import QIcon
 from qgis.core import (QgsWkbTypes,
                        QgsCoordinateReferenceSystem,
                        QgsProcessing,
-                       QgsProcessingAlgorithm,
                        QgsProcessingParameterField,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterString,
                        QgsProcessingParameterEnum,
+                       QgsProcessingParameterBoolean,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterPoint,
                        QgsProcessingParameterExtent)
 
 from . import HELP_DIR
+from .base_proc import PeliasBaseAlgo
 from PeliasGeocoding import RESOURCE_PREFIX, __help__
-from PeliasGeocoding.core import client, LAYERS, SOURCES, response_handler
-from PeliasGeocoding.utils import exceptions, configmanager, logger, convert
+from PeliasGeocoding.core import pool, query, LAYERS, SOURCES, response_handler
+from PeliasGeocoding.utils import configmanager, convert
 
 
-class PeliasFreeSearchAlgo(QgsProcessingAlgorithm):
-    # TODO: create base algorithm class common to all modules
-
+class PeliasFreeSearchAlgo(PeliasBaseAlgo):
     ALGO_NAME = 'pelias_search_free'
     ALGO_NAME_LIST = ALGO_NAME.split("_")
 
@@ -62,6 +61,7 @@ class PeliasFreeSearchAlgo(QgsProcessingAlgorithm):
     IN_LAYERS = 'INPUT_LAYERS'
     IN_SOURCES = 'INPUT_SOURCES'
     IN_SIZE = 'INPUT_SIZE'
+    IN_BYPASS_CACHE = 'INPUT_BYPASS_CACHE'
     OUT = 'OUTPUT'
 
     # Save some important references
@@ -81,6 +81,16 @@ class PeliasFreeSearchAlgo(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                name=self.IN_POOL,
+                description="Provider pool (spreads requests across several providers, overrides Provider)",
+                options=providers,
+                optional=True,
+                allowMultiple=True
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSource(
                 name=self.IN_POINTS,
@@ -179,6 +189,30 @@ class PeliasFreeSearchAlgo(QgsProcessingAlgorithm):
             )
         ))
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_BYPASS_CACHE,
+                description="Bypass response cache (refreshes cached responses)",
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_RESUME,
+                description="Resume from checkpoint (skips input features completed by an interrupted run)",
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_INCREMENTAL,
+                description="Incremental (only requests new or changed input features, copies earlier results)",
+                defaultValue=False
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 name=self.OUT,
@@ -187,6 +221,16 @@ class PeliasFreeSearchAlgo(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                name=self.OUT_FAILED,
+                description="Failed rows",
+                type=QgsProcessing.TypeVector,
+                optional=True,
+                createByDefault=False
+            )
+        )
+
     def name(self):
         return self.ALGO_NAME
 
@@ -218,7 +262,7 @@ class PeliasFreeSearchAlgo(QgsProcessingAlgorithm):
     def processAlgorithm(self, parameters, context, feedback):
         providers = configmanager.read_config()['providers']
         # Init client
-        provider = providers[self.parameterAsEnum(parameters, self.IN_PROVIDER, context)]
+        clnt, provider = self._get_client(providers, parameters, context)
         in_source = self.parameterAsSource(parameters, self.IN_POINTS, context)
         in_id_field_name = self.parameterAsString(parameters, self.IN_ID_FIELD, context)
         in_text_field_name = self.parameterAsString(parameters, self.IN_TEXT_FIELD, context)
@@ -230,13 +274,11 @@ class PeliasFreeSearchAlgo(QgsProcessingAlgorithm):
         in_layers = self.parameterAsEnums(parameters, self.IN_LAYERS, context)
         in_sources = self.parameterAsEnums(parameters, self.IN_SOURCES, context)
         in_size = self.parameterAsInt(parameters, self.IN_SIZE, context)
+        in_bypass_cache = self.parameterAsBool(parameters, self.IN_BYPASS_CACHE, context)
 
         # Get user specified ID field as object
         in_id_field = in_source.fields().field(in_id_field_name)
 
-        clnt = client.Client(provider)
-        clnt.overQueryLimit.connect(lambda sleep_for: feedback.reportError("OverQueryLimit: Wait for {} seconds".format(sleep_for)))
-
         params = dict()
 
         if in_focus.x() and in_focus.y():
@@ -258,40 +300,42 @@ class PeliasFreeSearchAlgo(QgsProcessingAlgorithm):
             params['sources'] = convert.comma_list([SOURCES[idx] for idx in in_sources])
         params['size'] = str(in_size)
 
-        responsehandler = response_handler.ResponseHandler(in_id_field)
+        responsehandler = response_handler.ResponseHandler(in_id_field,
+                                                           provider_field=isinstance(clnt, pool.ProviderPool))
 
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUT, context,
                                                responsehandler.get_fields(),
                                                QgsWkbTypes.Point,
                                                self.crs_out)
-
-        for num, feat_in in enumerate(in_source.getFeatures()):
-            if feedback.isCanceled():
-                break
-
-            params_feat = dict()
-            if in_text_field_name and feat_in[in_text_field_name]:
-                params_feat['text'] = feat_in[in_text_field_name]
-            in_id_field_value = feat_in[in_id_field_name]
-
-            try:
-                response = clnt.request(provider['endpoints'][self.ALGO_NAME_LIST[1]],
-                                        {**params, **params_feat})
-            except (exceptions.ApiError,
-                    exceptions.GenericServerError,
-                    exceptions.InvalidKey) as e:
-                msg = "Feature ID {} caused a {}:\n{}".format(
-                    in_id_field_value,
-                    e.__class__.__name__,
-                    str(e))
-                feedback.reportError(msg)
-                logger.log(msg, 2)
-                continue
-
-            features_out = responsehandler.generate_out_features(response, in_id_field_value)
-            for feat_out in features_out:
-                sink.addFeature(feat_out)
-
-            feedback.setProgress(int(100.0 / in_source.featureCount() * num))
-
-        return {self.OUT: dest_id}
+        (failed_sink, failed_dest_id) = self.parameterAsSink(parameters, self.OUT_FAILED, context,
+                                                             responsehandler.failed_fields,
+                                                             QgsWkbTypes.NoGeometry)
+
+        # Only read the ID and address, the geometry isn't needed
+        request, (id_idx, text_idx) = self._get_attributes_request(in_source, [in_id_field_name,
+                                                                               in_text_field_name])
+
+        def get_requests():
+            for feat_in in in_source.getFeatures(request):
+                attributes = feat_in.attributes()
+                params_feat = dict()
+                if text_idx >= 0 and attributes[text_idx]:
+                    params_feat['text'] = attributes[text_idx]
+
+                yield attributes[id_idx], params_feat
+
+        # The parameters shared by all requests are only encoded once
+        prepared_query = query.PreparedQuery(provider['endpoints'][self.ALGO_NAME_LIST[1]], params)
+        self._process_requests(clnt,
+                               prepared_query,
+                               provider,
+                               get_requests(),
+                               in_source.featureCount(),
+                               responsehandler,
+                               sink,
+                               feedback,
+                               use_cache=not in_bypass_cache,
+                               journal=self._get_journal(parameters, context, clnt, prepared_query),
+                               failed_sink=failed_sink)
+
+        return {self.OUT: dest_id, self.OUT_FAILED: failed_dest_id}
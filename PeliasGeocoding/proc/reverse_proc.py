@@ -28,25 +28,24 @@ from PyQt5.QtGui import QIcon
 from qgis.core import (QgsWkbTypes,
                        QgsCoordinateReferenceSystem,
                        QgsProcessing,
-                       QgsProcessingAlgorithm,
                        QgsProcessingParameterField,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterString,
                        QgsProcessingParameterEnum,
+                       QgsProcessingParameterBoolean,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterPoint,
                        QgsProcessingParameterExtent)
 
 from . import HELP_DIR
+from .base_proc import PeliasBaseAlgo
 from PeliasGeocoding import RESOURCE_PREFIX, __help__
-from PeliasGeocoding.core import client, LAYERS, SOURCES, response_handler
-from PeliasGeocoding.utils import exceptions, configmanager, logger, convert, transform
+from PeliasGeocoding.core import pool, query, LAYERS, SOURCES, response_handler
+from PeliasGeocoding.utils import configmanager, convert, transform
 
 
-class PeliasReverseAlgo(QgsProcessingAlgorithm):
-    # TODO: create base algorithm class common to all modules
-
+class PeliasReverseAlgo(PeliasBaseAlgo):
     ALGO_NAME = 'pelias_reverse'
     ALGO_NAME_LIST = ALGO_NAME.split("_")
 
@@ -57,6 +56,9 @@ class PeliasReverseAlgo(QgsProcessingAlgorithm):
     IN_LAYERS = 'INPUT_LAYERS'
     IN_SOURCES = 'INPUT_SOURCES'
     IN_SIZE = 'INPUT_SIZE'
+    IN_BYPASS_CACHE = 'INPUT_BYPASS_CACHE'
+    IN_REUSE_DISTANCE = 'INPUT_REUSE_DISTANCE'
+    IN_RERANK = 'INPUT_RERANK'
     OUT = 'OUTPUT'
 
     # Save some important references
@@ -75,6 +77,16 @@ class PeliasReverseAlgo(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                name=self.IN_POOL,
+                description="Provider pool (spreads requests across several providers, overrides Provider)",
+                options=providers,
+                optional=True,
+                allowMultiple=True
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSource(
                 name=self.IN_POINTS,
@@ -129,6 +141,49 @@ class PeliasReverseAlgo(QgsProcessingAlgorithm):
             )
         ))
 
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                name=self.IN_REUSE_DISTANCE,
+                description="Reuse results within N metres (0 to geocode every point)",
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0,
+                minValue=0,
+                maxValue=10000
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_RERANK,
+                description="Re-rank reused results by distance",
+                defaultValue=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_BYPASS_CACHE,
+                description="Bypass response cache (refreshes cached responses)",
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_RESUME,
+                description="Resume from checkpoint (skips input features completed by an interrupted run)",
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_INCREMENTAL,
+                description="Incremental (only requests new or changed input features, copies earlier results)",
+                defaultValue=False
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 name=self.OUT,
@@ -137,6 +192,16 @@ class PeliasReverseAlgo(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                name=self.OUT_FAILED,
+                description="Failed rows",
+                type=QgsProcessing.TypeVector,
+                optional=True,
+                createByDefault=False
+            )
+        )
+
     def name(self):
         return self.ALGO_NAME
 
@@ -145,7 +210,7 @@ class PeliasReverseAlgo(QgsProcessingAlgorithm):
 
         file = os.path.join(
             HELP_DIR,
-            'algorithm_freetext.help'
+            'algorithm_reverse.help'
         )
         with open(file) as helpf:
             msg = helpf.read()
@@ -169,20 +234,20 @@ class PeliasReverseAlgo(QgsProcessingAlgorithm):
         providers = configmanager.read_config()['providers']
 
         # Init client
-        provider = providers[self.parameterAsEnum(parameters, self.IN_PROVIDER, context)]
+        clnt, provider = self._get_client(providers, parameters, context)
         in_source = self.parameterAsSource(parameters, self.IN_POINTS, context)
         in_id_field_name = self.parameterAsString(parameters, self.IN_ID_FIELD, context)
         in_country = self.parameterAsString(parameters, self.IN_COUNTRY, context)
         in_layers = self.parameterAsEnums(parameters, self.IN_LAYERS, context)
         in_sources = self.parameterAsEnums(parameters, self.IN_SOURCES, context)
         in_size = self.parameterAsInt(parameters, self.IN_SIZE, context)
+        in_bypass_cache = self.parameterAsBool(parameters, self.IN_BYPASS_CACHE, context)
+        in_reuse_distance = self.parameterAsDouble(parameters, self.IN_REUSE_DISTANCE, context)
+        in_rerank = self.parameterAsBool(parameters, self.IN_RERANK, context)
 
         # Get user specified ID field as object
         in_id_field = in_source.fields().field(in_id_field_name)
 
-        clnt = client.Client(provider)
-        clnt.overQueryLimit.connect(lambda sleep_for: feedback.reportError("OverQueryLimit: Wait for {} seconds".format(sleep_for)))
-
         params = dict()
 
         if in_country:
@@ -193,40 +258,60 @@ class PeliasReverseAlgo(QgsProcessingAlgorithm):
             params['sources'] = convert.comma_list([SOURCES[idx] for idx in in_sources])
         params['size'] = str(in_size)
 
-        responsehandler = response_handler.ResponseHandler(in_id_field)
+        responsehandler = response_handler.ResponseHandler(in_id_field,
+                                                           provider_field=isinstance(clnt, pool.ProviderPool))
 
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUT, context,
                                                responsehandler.get_fields(),
                                                QgsWkbTypes.Point,
                                                self.crs_out)
+        (failed_sink, failed_dest_id) = self.parameterAsSink(parameters, self.OUT_FAILED, context,
+                                                             responsehandler.failed_fields,
+                                                             QgsWkbTypes.NoGeometry)
 
         xformer = transform.transformToWGS(in_source.sourceCrs())
-        for num, feat_in in enumerate(in_source.getFeatures()):
-            if feedback.isCanceled():
-                break
-            x_point = xformer.transform(feat_in.geometry().asPoint())
-            params['point.lon'] = x_point.x()
-            params['point.lat'] = x_point.y()
-
-            in_id_field_value = feat_in[in_id_field_name]
-            try:
-                response = clnt.request(provider['endpoints'][self.ALGO_NAME_LIST[1]],
-                                        params)
-            except (exceptions.ApiError,
-                    exceptions.GenericServerError,
-                    exceptions.InvalidKey) as e:
-                msg = "Feature ID {} caused a {}:\n{}".format(
-                    in_id_field_value,
-                    e.__class__.__name__,
-                    str(e))
-                feedback.reportError(msg)
-                logger.log(msg, 2)
-                continue
-
-            features_out = responsehandler.generate_out_features(response, in_id_field_value)
-            for feat_out in features_out:
-                sink.addFeature(feat_out)
-
-            feedback.setProgress(int(100.0 / in_source.featureCount() * num))
-
-        return {self.OUT: dest_id}
+
+        # Input points by ID to re-rank reused results
+        in_points = dict()
+
+        # Only read the ID besides the geometry
+        request, (id_idx,) = self._get_attributes_request(in_source, [in_id_field_name], geometry=True)
+
+        def get_requests():
+            for feat_in in in_source.getFeatures(request):
+                x_point = xformer.transform(feat_in.geometry().asPoint())
+                in_id_field_value = feat_in.attributes()[id_idx]
+                if in_reuse_distance:
+                    # Points in the same grid cell share the request for the cell center
+                    in_points[in_id_field_value] = (x_point.x(), x_point.y())
+                    lon, lat = transform.snap_to_grid(x_point.x(), x_point.y(), in_reuse_distance)
+                    params_feat = {'point.lon': convert.format_float(lon),
+                                   'point.lat': convert.format_float(lat)}
+                else:
+                    params_feat = {'point.lon': x_point.x(),
+                                   'point.lat': x_point.y()}
+
+                yield in_id_field_value, params_feat
+
+        def rerank(response, in_id_field_value):
+            lon, lat = in_points[in_id_field_value]
+            features = sorted(response['features'],
+                              key=lambda f: transform.distance(lon, lat, *f['geometry']['coordinates']))
+            return dict(response, features=features)
+
+        # The parameters shared by all requests are only encoded once
+        prepared_query = query.PreparedQuery(provider['endpoints'][self.ALGO_NAME_LIST[1]], params)
+        self._process_requests(clnt,
+                               prepared_query,
+                               provider,
+                               get_requests(),
+                               in_source.featureCount(),
+                               responsehandler,
+                               sink,
+                               feedback,
+                               use_cache=not in_bypass_cache,
+                               prepare_response=rerank if in_reuse_distance and in_rerank else None,
+                               journal=self._get_journal(parameters, context, clnt, prepared_query),
+                               failed_sink=failed_sink)
+
+        return {self.OUT: dest_id, self.OUT_FAILED: failed_dest_id}
@@ -28,25 +28,24 @@ from PyQt5.QtGui import QIcon
 from qgis.core import (QgsWkbTypes,
                        QgsCoordinateReferenceSystem,
                        QgsProcessing,
-                       QgsProcessingAlgorithm,
                        QgsProcessingParameterField,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterString,
                        QgsProcessingParameterEnum,
+                       QgsProcessingParameterBoolean,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterPoint,
                        QgsProcessingParameterExtent)
 
 from . import HELP_DIR
+from .base_proc import PeliasBaseAlgo
 from PeliasGeocoding import RESOURCE_PREFIX, __help__
-from PeliasGeocoding.core import client, LAYERS, SOURCES, response_handler
-from PeliasGeocoding.utils import exceptions, configmanager, logger, convert
+from PeliasGeocoding.core import pool, query, LAYERS, SOURCES, response_handler
+from PeliasGeocoding.utils import configmanager, convert
 
 
-class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
-    # TODO: create base algorithm class common to all modules
-
+class PeliasStrucSearchAlgo(PeliasBaseAlgo):
     ALGO_NAME = 'pelias_search_structured'
     ALGO_NAME_LIST = ALGO_NAME.split("_")
 
@@ -69,6 +68,7 @@ class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
     IN_LAYERS = 'INPUT_LAYERS'
     IN_SOURCES = 'INPUT_SOURCES'
     IN_SIZE = 'INPUT_SIZE'
+    IN_BYPASS_CACHE = 'INPUT_BYPASS_CACHE'
     OUT = 'OUTPUT'
 
     # Save some important references
@@ -86,6 +86,16 @@ class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                name=self.IN_POOL,
+                description="Provider pool (spreads requests across several providers, overrides Provider)",
+                options=providers,
+                optional=True,
+                allowMultiple=True
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSource(
                 name=self.IN_POINTS,
@@ -253,6 +263,30 @@ class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
             )
         ))
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_BYPASS_CACHE,
+                description="Bypass response cache (refreshes cached responses)",
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_RESUME,
+                description="Resume from checkpoint (skips input features completed by an interrupted run)",
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                name=self.IN_INCREMENTAL,
+                description="Incremental (only requests new or changed input features, copies earlier results)",
+                defaultValue=False
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 name=self.OUT,
@@ -261,6 +295,16 @@ class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                name=self.OUT_FAILED,
+                description="Failed rows",
+                type=QgsProcessing.TypeVector,
+                optional=True,
+                createByDefault=False
+            )
+        )
+
     def name(self):
         return self.ALGO_NAME
 
@@ -269,7 +313,7 @@ class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
 
         file = os.path.join(
             HELP_DIR,
-            'algorithm_freetext.help'
+            'algorithm_structured.help'
         )
         with open(file) as helpf:
             msg = helpf.read()
@@ -292,7 +336,7 @@ class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
     def processAlgorithm(self, parameters, context, feedback):
         providers = configmanager.read_config()['providers']
         # Init client
-        provider = providers[self.parameterAsEnum(parameters, self.IN_PROVIDER, context)]
+        clnt, provider = self._get_client(providers, parameters, context)
         in_source = self.parameterAsSource(parameters, self.IN_POINTS, context)
         in_id_field_name = self.parameterAsString(parameters, self.IN_ID_FIELD, context)
         in_add_name = self.parameterAsString(parameters, self.IN_ADDR_FIELD, context)
@@ -311,13 +355,11 @@ class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
         in_layers = self.parameterAsEnums(parameters, self.IN_LAYERS, context)
         in_sources = self.parameterAsEnums(parameters, self.IN_SOURCES, context)
         in_size = self.parameterAsInt(parameters, self.IN_SIZE, context)
+        in_bypass_cache = self.parameterAsBool(parameters, self.IN_BYPASS_CACHE, context)
 
         # Get user specified ID field as object
         in_id_field = in_source.fields().field(in_id_field_name)
 
-        clnt = client.Client(provider)
-        clnt.overQueryLimit.connect(lambda sleep_for: feedback.reportError("OverQueryLimit: Wait for {} seconds".format(sleep_for)))
-
         params = dict()
 
         if in_focus.x() and in_focus.y():
@@ -339,55 +381,53 @@ class PeliasStrucSearchAlgo(QgsProcessingAlgorithm):
             params['sources'] = convert.comma_list([SOURCES[idx] for idx in in_sources])
         params['size'] = str(in_size)
 
-        responsehandler = response_handler.ResponseHandler(in_id_field)
+        responsehandler = response_handler.ResponseHandler(in_id_field,
+                                                           provider_field=isinstance(clnt, pool.ProviderPool))
 
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUT, context,
                                                responsehandler.get_fields(),
                                                QgsWkbTypes.Point,
                                                self.crs_out)
-
-        for num, feat_in in enumerate(in_source.getFeatures()):
-            if feedback.isCanceled():
-                break
-
-            params_feat = dict()
-            if in_add_name and feat_in[in_add_name]:
-                params_feat['address'] = feat_in[in_add_name]
-            if in_neigh_name and feat_in[in_neigh_name]:
-                params_feat['neighbourhood'] = feat_in[in_neigh_name]
-            if in_borough_name and feat_in[in_borough_name]:
-                params_feat['borough'] = feat_in[in_borough_name]
-            if in_locality_name and feat_in[in_locality_name]:
-                params_feat['locality'] = feat_in[in_locality_name]
-            if in_county_name and feat_in[in_county_name]:
-                params_feat['county'] = feat_in[in_county_name]
-            if in_region_name and feat_in[in_region_name]:
-                params_feat['region'] = feat_in[in_region_name]
-            if in_postal_name and feat_in[in_postal_name]:
-                params_feat['postalcode'] = feat_in[in_postal_name]
-            if in_country_name and feat_in[in_country_name]:
-                params_feat['country'] = feat_in[in_country_name]
-
-            in_id_field_value = feat_in[in_id_field_name]
-
-            try:
-                response = clnt.request(provider['endpoints'][self.ALGO_NAME_LIST[2]],
-                                        {**params, **params_feat})
-            except (exceptions.ApiError,
-                    exceptions.GenericServerError,
-                    exceptions.InvalidKey) as e:
-                msg = "Feature ID {} caused a {}:\n{}".format(
-                    in_id_field_value,
-                    e.__class__.__name__,
-                    str(e))
-                feedback.reportError(msg)
-                logger.log(msg, 2)
-                continue
-
-            features_out = responsehandler.generate_out_features(response, in_id_field_value)
-            for feat_out in features_out:
-                sink.addFeature(feat_out)
-
-            feedback.setProgress(int(100.0 / in_source.featureCount() * num))
-
-        return {self.OUT: dest_id}
+        (failed_sink, failed_dest_id) = self.parameterAsSink(parameters, self.OUT_FAILED, context,
+                                                             responsehandler.failed_fields,
+                                                             QgsWkbTypes.NoGeometry)
+
+        # Only read the ID and address components, the geometry isn't needed
+        components = [('address', in_add_name),
+                      ('neighbourhood', in_neigh_name),
+                      ('borough', in_borough_name),
+                      ('locality', in_locality_name),
+                      ('county', in_county_name),
+                      ('region', in_region_name),
+                      ('postalcode', in_postal_name),
+                      ('country', in_country_name)]
+        request, indices = self._get_attributes_request(in_source,
+                                                        [in_id_field_name] + [name for _, name in components])
+        id_idx = indices[0]
+        components = [(param, idx) for (param, _), idx in zip(components, indices[1:]) if idx >= 0]
+
+        def get_requests():
+            for feat_in in in_source.getFeatures(request):
+                attributes = feat_in.attributes()
+                params_feat = dict()
+                for param, idx in components:
+                    if attributes[idx]:
+                        params_feat[param] = attributes[idx]
+
+                yield attributes[id_idx], params_feat
+
+        # The parameters shared by all requests are only encoded once
+        prepared_query = query.PreparedQuery(provider['endpoints'][self.ALGO_NAME_LIST[2]], params)
+        self._process_requests(clnt,
+                               prepared_query,
+                               provider,
+                               get_requests(),
+                               in_source.featureCount(),
+                               responsehandler,
+                               sink,
+                               feedback,
+                               use_cache=not in_bypass_cache,
+                               journal=self._get_journal(parameters, context, clnt, prepared_query),
+                               failed_sink=failed_sink)
+
+        return {self.OUT: dest_id, self.OUT_FAILED: failed_dest_id}
@@ -90,3 +90,13 @@ class GenericServerError(Exception):
 class Timeout(Exception):
     """The request timed out."""
     pass
+
+
+class NetworkError(Exception):
+    """The connection to the provider failed."""
+    pass
+
+
+class ProviderUnavailable(Exception):
+    """The provider's circuit breaker is open after repeated failures."""
+    pass
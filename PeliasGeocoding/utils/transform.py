@@ -21,6 +21,8 @@
  ***************************************************************************/
 """
 
+import math
+
 from qgis.core import (QgsCoordinateReferenceSystem,
                        QgsCoordinateTransform,
                        QgsProject
@@ -41,3 +43,49 @@ def transformToWGS(old_crs):
     xformer = QgsCoordinateTransform(old_crs, outCrs, QgsProject.instance())
 
     return xformer
+
+
+# Mean earth radius in metres
+EARTH_RADIUS = 6371008.8
+
+
+def snap_to_grid(lon, lat, tolerance):
+    """
+    Returns the center of the grid cell a WGS84 point falls into. Cells are
+    squares with a diagonal of tolerance metres, so all points in the same
+    cell are at most tolerance metres apart.
+
+    :param lon: Longitude of the point.
+    :type lon: float
+
+    :param lat: Latitude of the point.
+    :type lat: float
+
+    :param tolerance: Maximum distance in metres between points of one cell.
+    :type tolerance: float
+
+    :returns: longitude and latitude of the cell center
+    :rtype: (float, float)
+    """
+    lat_step = math.degrees(tolerance / math.sqrt(2) / EARTH_RADIUS)
+    center_lat = (math.floor(lat / lat_step) + 0.5) * lat_step
+
+    # Longitude degrees get shorter towards the poles
+    lon_step = lat_step / max(math.cos(math.radians(center_lat)), 1e-6)
+    center_lon = (math.floor(lon / lon_step) + 0.5) * lon_step
+
+    return center_lon, center_lat
+
+
+def distance(lon1, lat1, lon2, lat2):
+    """
+    Great circle distance between two WGS84 points.
+
+    :returns: distance in metres
+    :rtype: float
+    """
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
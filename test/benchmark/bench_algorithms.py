@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the Pelias processing algorithms end to end against a local stub
+server and reports requests/s, features/s, p50/p95 latency and peak memory.
+
+Run with the Python interpreter of a QGIS installation from the repository root, e.g.:
+
+    python test/benchmark/bench_algorithms.py --rows 10000 --latency lognormal:0.05,0.5 --rate-limit 200 --concurrency 16
+
+Latencies are the client's view of the most recent 1000 requests. Peak memory is
+the process' maximum resident set size, or the peak of Python allocations per
+algorithm with --trace-memory (which slows down the run).
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import yaml
+from PyQt5.QtCore import QVariant
+from qgis.core import (QgsApplication,
+                       QgsFeature,
+                       QgsField,
+                       QgsGeometry,
+                       QgsPointXY,
+                       QgsVectorLayer)
+
+from stub_server import StubServer
+
+ALGORITHMS = ('free', 'structured', 'reverse')
+
+
+def make_provider(url, args):
+    return {
+        'name': 'stub',
+        'base_url': url,
+        'key': '',
+        'limits': [{'limit': args.limit, 'unit': 'second'}],
+        'concurrency': args.concurrency,
+        'engine': args.engine,
+        'transport': args.transport,
+        'connections': args.connections,
+        'cache_ttl': 0,
+        'endpoints': {
+            'search': '/search',
+            'structured': '/search/structured',
+            'reverse': '/reverse'
+        }
+    }
+
+
+def make_layer(algorithm, rows, duplicates):
+    """Builds an input layer, a share of duplicates rows repeats earlier ones."""
+    if algorithm == 'reverse':
+        layer = QgsVectorLayer("Point?crs=EPSG:4326&field=id:integer", algorithm, "memory")
+    elif algorithm == 'structured':
+        layer = QgsVectorLayer("None?field=id:integer&field=address:string&field=locality:string"
+                               "&field=postalcode:string&field=country:string", algorithm, "memory")
+    else:
+        layer = QgsVectorLayer("None?field=id:integer&field=Address:string", algorithm, "memory")
+
+    features = []
+    for num in range(rows):
+        source = random.randrange(num) if num and random.random() < duplicates else num
+        feat = QgsFeature(layer.fields())
+        if algorithm == 'reverse':
+            # same coordinates for duplicates
+            rng = random.Random(source)
+            feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(rng.uniform(-180, 180), rng.uniform(-85, 85))))
+            feat.setAttributes([num])
+        elif algorithm == 'structured':
+            feat.setAttributes([num, '{} Example Street'.format(source), 'Example City', '{:05d}'.format(source), 'DEU'])
+        else:
+            feat.setAttributes([num, '{} Example Street, Example City'.format(source)])
+        features.append(feat)
+
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def get_parameters(algorithm, layer, size):
+    parameters = {
+        'INPUT_PROVIDER': 0,
+        'INPUT_POINT_LAYER': layer,
+        'INPUT_ID_FIELD': 'id',
+        'INPUT_SIZE': size,
+        'OUTPUT': 'memory:'
+    }
+    if algorithm == 'free':
+        parameters['INPUT_TEXT_FIELD'] = 'Address'
+    elif algorithm == 'structured':
+        parameters.update({
+            'INPUT_ADDR_FIELD': 'address',
+            'INPUT_LOCALITY_FIELD': 'locality',
+            'INPUT_POSTAL_FIELD': 'postalcode',
+            'INPUT_COUNTRY_FIELD': 'country'
+        })
+
+    return parameters
+
+
+def run_algorithm(algorithm, provider, args):
+    import processing
+    from qgis.core import QgsProcessingFeedback
+    from PeliasGeocoding import PLUGIN_NAME
+    from PeliasGeocoding.core import client
+
+    algorithm_id = {'free': 'pelias_search_free',
+                    'structured': 'pelias_search_structured',
+                    'reverse': 'pelias_reverse'}[algorithm]
+    layer = make_layer(algorithm, args.rows, args.duplicates)
+
+    # Fresh client, so statistics only cover this run
+    client.close_clients()
+    clnt = client.get_client(provider)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = processing.run('{}:{}'.format(PLUGIN_NAME, algorithm_id),
+                            get_parameters(algorithm, layer, args.size),
+                            feedback=QgsProcessingFeedback())
+    elapsed = time.perf_counter() - start
+    if args.trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    else:
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    counters, timers = clnt.metrics.snapshot()
+    n_requests = counters.get('requests', 0)
+    n_features = result['OUTPUT'].featureCount()
+    p50, p95 = clnt.metrics.percentile(50), clnt.metrics.percentile(95)
+
+    return {
+        'algorithm': algorithm,
+        'seconds': elapsed,
+        'requests': n_requests,
+        'requests/s': n_requests / elapsed,
+        'features/s': n_features / elapsed,
+        'p50 ms': 1000 * p50 if p50 is not None else float('nan'),
+        'p95 ms': 1000 * p95 if p95 is not None else float('nan'),
+        'retries': counters.get('retries', 0),
+        'peak MB': peak_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--algorithms', default=','.join(ALGORITHMS), help="comma separated, any of " + ', '.join(ALGORITHMS))
+    parser.add_argument('--rows', type=int, default=2000, help="input features per algorithm")
+    parser.add_argument('--duplicates', type=float, default=0, help="share of duplicate input rows")
+    parser.add_argument('--size', type=int, default=10, help="results per request")
+    parser.add_argument('--latency', default='lognormal:0.05,0.5', help="stub latency distribution")
+    parser.add_argument('--rate-limit', type=int, default=0, help="stub requests per second before HTTP 429")
+    parser.add_argument('--error-rate', type=float, default=0, help="stub share of HTTP 503 responses")
+    parser.add_argument('--limit', type=int, default=0, help="provider limit per second, 0 for unlimited")
+    parser.add_argument('--concurrency', type=int, default=8, help="provider concurrency")
+    parser.add_argument('--engine', default='threads', choices=('threads', 'asyncio', 'qt'), help="provider engine")
+    parser.add_argument('--transport', default='requests', choices=('requests', 'qgis'),
+                        help="provider transport of the threads engine")
+    parser.add_argument('--connections', type=int, default=10, help="open connections of the asyncio engine")
+    parser.add_argument('--trace-memory', action='store_true', help="report peak Python allocations per algorithm")
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from processing.core.Processing import Processing
+    Processing.initialize()
+
+    from PeliasGeocoding.utils import configmanager
+    from PeliasGeocoding.proc.provider import PeliasToolsProvider
+
+    with StubServer(args.latency, args.rate_limit, error_rate=args.error_rate) as stub, \
+            tempfile.NamedTemporaryFile('w', suffix='.yml', delete=False) as providers_file:
+        provider = make_provider(stub.url, args)
+        yaml.safe_dump({'providers': [provider]}, providers_file)
+        providers_file.close()
+        # Algorithms read their providers from this file
+        configmanager.PROVIDERS = providers_file.name
+
+        pelias_provider = PeliasToolsProvider()
+        QgsApplication.processingRegistry().addProvider(pelias_provider)
+
+        results = [run_algorithm(algorithm, provider, args) for algorithm in args.algorithms.split(',')]
+
+        QgsApplication.processingRegistry().removeProvider(pelias_provider)
+        os.remove(providers_file.name)
+
+    columns = list(results[0].keys())
+    print(" ".join("{:>12}".format(column) for column in columns))
+    for result in results:
+        print(" ".join("{:>12}".format(value if isinstance(value, str) else "{:.1f}".format(value))
+                       for value in result.values()))
+
+    qgs.exitQgis()
+
+
+if __name__ == '__main__':
+    main()
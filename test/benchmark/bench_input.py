@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks reading the input rows of the search algorithms from a wide
+GeoPackage: iterating all features with their geometry and looking up fields
+by name as before, against a request for only the needed attributes without
+geometry and lookups by index.
+
+Run with the Python interpreter of a QGIS installation from the repository root:
+
+    python test/benchmark/bench_input.py [--rows 1000000] [--columns 50] [--gpkg PATH]
+
+The GeoPackage is generated in a temporary directory unless --gpkg is given,
+in which case it's created only if it doesn't exist yet.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+# Fields of the structured search, the first being also the free text field
+STRUCTURED_FIELDS = ['address', 'neighbourhood', 'borough', 'locality',
+                     'county', 'region', 'postalcode', 'country']
+
+
+def create_gpkg(path, n_rows, n_columns):
+    """Writes a point layer with an ID, the search fields and filler columns."""
+    from osgeo import ogr, osr
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    ds = ogr.GetDriverByName('GPKG').CreateDataSource(path)
+    layer = ds.CreateLayer('input', srs, ogr.wkbPoint)
+    layer.CreateField(ogr.FieldDefn('id', ogr.OFTInteger))
+    filler = ['filler_{}'.format(i) for i in range(max(n_columns - len(STRUCTURED_FIELDS) - 1, 0))]
+    for name in STRUCTURED_FIELDS + filler:
+        layer.CreateField(ogr.FieldDefn(name, ogr.OFTString))
+
+    defn = layer.GetLayerDefn()
+    ds.StartTransaction()
+    for i in range(n_rows):
+        feat = ogr.Feature(defn)
+        feat.SetField('id', i)
+        feat.SetField('address', '{} Example Street'.format(i))
+        for name in STRUCTURED_FIELDS[1:] + filler:
+            feat.SetField(name, '{} {}'.format(name, i % 1000))
+        feat.SetGeometry(ogr.CreateGeometryFromWkt('POINT ({} {})'.format(13 + i % 1000 / 1000, 52.5)))
+        layer.CreateFeature(feat)
+        if i % 100000 == 99999:
+            ds.CommitTransaction()
+            ds.StartTransaction()
+    ds.CommitTransaction()
+    ds = None
+
+
+def legacy(source, field_names):
+    """All attributes and the geometry, fields looked up by name."""
+    for feat in source.getFeatures():
+        tuple(feat[name] for name in field_names)
+
+
+def subset(source, field_names):
+    """Only the needed attributes, no geometry, fields looked up by index."""
+    from PeliasGeocoding.proc.base_proc import PeliasBaseAlgo
+
+    request, indices = PeliasBaseAlgo._get_attributes_request(source, field_names)
+    for feat in source.getFeatures(request):
+        attributes = feat.attributes()
+        tuple(attributes[idx] for idx in indices)
+
+
+def run(path):
+    from qgis.core import QgsVectorLayer
+
+    source = QgsVectorLayer(path, 'input', 'ogr')
+    print("Reading {} rows with {} fields".format(source.featureCount(), len(source.fields())))
+
+    for case, field_names in (('free text', ['id', 'address']),
+                              ('structured', ['id'] + STRUCTURED_FIELDS)):
+        baseline = None
+        for name, read in (('legacy', legacy), ('subset', subset)):
+            start = time.perf_counter()
+            read(source, field_names)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print("{:<10} {:<8} {:>7.2f} s {:>6.1f}x".format(case, name, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--columns', type=int, default=50)
+    parser.add_argument('--gpkg', help="GeoPackage to read, created if it doesn't exist")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    path = args.gpkg
+    if path is None:
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'input.gpkg')
+    if not os.path.exists(path):
+        print("Creating {}".format(path))
+        create_gpkg(path, args.rows, args.columns)
+
+    from qgis.core import QgsApplication
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    try:
+        run(path)
+    finally:
+        qgs.exitQgis()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
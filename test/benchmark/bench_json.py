@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks decoding Pelias responses as in Client._get_body: requests'
+Response.json(), which decodes the text first, against json.loads and
+orjson.loads straight from the response bytes.
+
+Run from the repository root, optionally with a directory of recorded
+responses (*.json), otherwise synthetic size=40 responses with debug fields:
+
+    python test/benchmark/bench_json.py [--responses DIR] [--size 40] [--repeat 2000]
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import requests
+
+from fixtures import make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def load_responses(directory, size):
+    """Returns the raw bodies of recorded responses, or of synthetic ones."""
+    if directory:
+        bodies = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+            with open(path, 'rb') as f:
+                bodies.append(f.read())
+        if bodies:
+            return bodies
+        print("No *.json files in {}, using synthetic responses".format(directory))
+
+    return [json.dumps(make_response(size, offset=i * size)).encode('utf-8') for i in range(20)]
+
+
+def requests_json(content):
+    """Response.json() as before, including the charset detection and text decoding."""
+    response = requests.Response()
+    response._content = content
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json'
+    return response.json()
+
+
+def run(bodies, repeat):
+    decoders = [('requests .json()', requests_json),
+                ('json.loads(bytes)', json.loads)]
+    if orjson is not None:
+        decoders.append(('orjson.loads(bytes)', orjson.loads))
+    else:
+        print("orjson isn't installed, skipping it")
+
+    mean_size = sum(len(body) for body in bodies) / len(bodies)
+    print("Decoding {} responses of {:.0f} kB on average, {} times".format(len(bodies), mean_size / 1000, repeat))
+
+    baseline = None
+    for name, decode in decoders:
+        assert decode(bodies[0]) == json.loads(bodies[0])
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for body in bodies:
+                decode(body)
+        per_response = (time.perf_counter() - start) / (repeat * len(bodies))
+        baseline = baseline or per_response
+        print("{:<20} {:>8.1f} us/response {:>6.2f}x".format(name, per_response * 1e6, baseline / per_response))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--responses', help="Directory of recorded Pelias responses as *.json files")
+    parser.add_argument('--size', type=int, default=40, help="Features per synthetic response")
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    run(load_responses(args.responses, args.size), args.repeat)
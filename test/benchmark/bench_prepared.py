@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks the CPU time Client spends building requests of a batch job,
+without sending them: encoding every request's full query and preparing it
+with Session.request as before, against a PreparedQuery with the constant
+parameters encoded once and a copied PreparedRequest.
+
+Run with the Python interpreter of a QGIS installation from the repository root:
+
+    python test/benchmark/bench_prepared.py [--rows 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import requests
+
+# Constant parameters of a free text search with all filters set
+STATIC_PARAMS = {
+    'focus.lon': '13.388', 'focus.lat': '52.517',
+    'boundary.rect.min_lon': '13.088', 'boundary.rect.min_lat': '52.338',
+    'boundary.rect.max_lon': '13.761', 'boundary.rect.max_lat': '52.675',
+    'boundary.country': 'DEU',
+    'layers': 'address,venue,street',
+    'sources': 'osm,oa',
+    'size': '5',
+}
+
+
+def legacy(clnt, url, rows):
+    """Per request: merge and encode all parameters, then Session.request's preparation."""
+    transport = clnt.transport
+    for row in rows:
+        params = {**STATIC_PARAMS, **row}
+        clnt._generate_cache_key(url, params)
+        authed_url = clnt._generate_auth_url(url, params)
+        final_requests_kwargs = dict(clnt.requests_kwargs, **{})
+        prepared = transport.session.prepare_request(
+            requests.Request('GET', clnt.base_url + authed_url, headers=final_requests_kwargs['headers']))
+        transport.session.merge_environment_settings(prepared.url, {}, None, None, None)
+
+
+def prepared(clnt, url, rows):
+    """Per request: encode the row's parameters, then copy a prepared request."""
+    from PeliasGeocoding.core.query import PreparedQuery
+
+    transport = clnt.transport
+    query = PreparedQuery(url, STATIC_PARAMS)
+    for row in rows:
+        clnt._generate_cache_key(query, row)
+        authed_url = clnt._generate_auth_url(query, row)
+        transport.prepare('GET', clnt.base_url + authed_url, **clnt.requests_kwargs)
+
+
+def run(n_rows):
+    from PeliasGeocoding.core.client import Client
+
+    provider = dict(name='bench',
+                    base_url='https://api.example.com/v1',
+                    key='0123456789abcdef0123456789abcdef',
+                    limits=[dict(limit=100, unit='second')],
+                    cache_ttl=0,
+                    endpoints=dict(search='/search'))
+    clnt = Client(provider)
+    rows = [{'text': '{} Example Street, Berlin'.format(i)} for i in range(n_rows)]
+
+    print("Building {} requests".format(n_rows))
+    baseline = None
+    for name, build in (('legacy', legacy), ('prepared', prepared)):
+        start = time.process_time()
+        build(clnt, '/search', rows)
+        elapsed = time.process_time() - start
+        baseline = baseline or elapsed
+        print("{:<10} {:>7.2f} s CPU per 100k requests {:>6.1f}x".format(
+            name, elapsed * 100000 / n_rows, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    from qgis.core import QgsApplication
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    run(args.rows)
+    qgs.exitQgis()
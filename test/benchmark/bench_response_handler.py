@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks building and writing output features with ResponseHandler,
+compared to the former implementation which set every attribute by name
+and added features one by one.
+
+Run with the Python interpreter of a QGIS installation from the repository root:
+
+    python test/benchmark/bench_response_handler.py [n_results]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from PyQt5.QtCore import QVariant
+from qgis.core import QgsApplication, QgsFeature, QgsField, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+from fixtures import make_response
+
+
+def legacy_get_layer(responsehandler, response):
+    """Feature building and insertion as it was before the compiled schema."""
+    layer_out = QgsVectorLayer("Point?crs=EPSG:4326", 'legacy', "memory")
+    layer_out.dataProvider().addAttributes(responsehandler.get_fields())
+    layer_out.updateFields()
+
+    for point in response['features']:
+        feat = QgsFeature()
+        coords = point['geometry']['coordinates']
+        feat.setGeometry(QgsGeometry().fromPointXY(QgsPointXY(*coords)))
+        feat.setFields(responsehandler.fields)
+        feat.setAttribute(responsehandler.id_field.name(), None)
+
+        for attr in point['properties']:
+            field_attr = responsehandler.fields_map.get(attr)
+            if field_attr is not None:
+                feat.setAttribute(field_attr['nice_name'], point['properties'][attr])
+
+        layer_out.dataProvider().addFeature(feat)
+
+    return layer_out
+
+
+def run(n_results):
+    from PeliasGeocoding.core.response_handler import ResponseHandler
+
+    response = make_response(n_results)
+    print("Writing {} results to a memory layer".format(n_results))
+
+    for debug in (False, True):
+        for name, get_layer in (('legacy', legacy_get_layer),
+                                ('compiled', lambda rh, resp: rh.get_layer('search', resp))):
+            responsehandler = ResponseHandler(QgsField('id', QVariant.String), debug)
+            start = time.perf_counter()
+            layer = get_layer(responsehandler, response)
+            elapsed = time.perf_counter() - start
+            assert layer.featureCount() == n_results
+            print("{:<10} debug={:<6} {:>10.0f} features/s".format(name, str(debug), n_results / elapsed))
+
+
+if __name__ == '__main__':
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+    qgs.exitQgis()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Pelias responses for benchmarks, shaped like real /search and
+/reverse responses with debug fields.
+"""
+
+import random
+
+_LAYERS = ['address', 'street', 'venue', 'locality']
+_SOURCES = ['openstreetmap', 'openaddresses', 'whosonfirst']
+_ADMIN = ['neighbourhood', 'borough', 'localadmin', 'locality', 'county', 'region', 'macroregion', 'country']
+
+
+def make_feature(num, lon=None, lat=None):
+    """Returns one GeoJSON feature of a Pelias response."""
+    lon = random.uniform(-180, 180) if lon is None else lon
+    lat = random.uniform(-85, 85) if lat is None else lat
+
+    properties = {
+        'id': str(num),
+        'gid': 'openaddresses:address:{}'.format(num),
+        'layer': random.choice(_LAYERS),
+        'source': random.choice(_SOURCES),
+        'source_id': str(num),
+        'name': '{} Example Street'.format(num),
+        'housenumber': str(num % 300),
+        'street': 'Example Street',
+        'postalcode': '{:05d}'.format(num % 100000),
+        'confidence': round(random.random(), 2),
+        'distance': round(random.random() * 10, 3),
+        'accuracy': 'point',
+        'label': '{} Example Street, Example City, Example Country'.format(num),
+    }
+    for admin in _ADMIN:
+        properties[admin] = 'Example {}'.format(admin)
+        properties[admin + '_gid'] = 'whosonfirst:{}:{}'.format(admin, num % 1000)
+        properties[admin + '_a'] = admin[:3].upper()
+
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+        'properties': properties,
+    }
+
+
+def make_response(size, lon=None, lat=None, offset=0):
+    """Returns a Pelias response body with size features."""
+    return {
+        'geocoding': {
+            'version': '0.2',
+            'attribution': 'http://localhost/attribution',
+            'query': {'size': size},
+            'warnings': [],
+            'engine': {'name': 'Pelias', 'author': 'Mapzen', 'version': '1.0'},
+        },
+        'type': 'FeatureCollection',
+        'features': [make_feature(offset + i, lon, lat) for i in range(size)],
+    }
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP stub mimicking the Pelias /search, /search/structured and
+/reverse endpoints, to benchmark the plugin without network access.
+
+Run standalone:
+
+    python test/benchmark/stub_server.py --port 4000 --latency lognormal:0.05,0.5 --rate-limit 200
+
+or start it from a benchmark with StubServer.
+"""
+
+import argparse
+import json
+import math
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from fixtures import make_response
+
+ENDPOINTS = ('/search', '/search/structured', '/reverse')
+
+
+def parse_latency(spec):
+    """
+    Parses a latency distribution, all values in seconds:
+
+    - constant:0.02
+    - uniform:0.01,0.1
+    - lognormal:0.05,0.5 (median and sigma)
+
+    :returns: function returning a latency sample
+    """
+    kind, _, args = spec.partition(':')
+    args = [float(arg) for arg in args.split(',') if arg]
+    if kind == 'constant':
+        return lambda: args[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(*args)
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(args[0]), args[1])
+    raise ValueError("Unknown latency distribution: {}".format(spec))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path == '/__stats':
+            return self._send(200, {'requests': server.n_requests, 'rejected': server.n_rejected})
+
+        path = next((endpoint for endpoint in ENDPOINTS if url.path.endswith(endpoint)), None)
+        if path is None:
+            return self._send(404, {'geocoding': {'errors': ['Not found']}})
+
+        with server.lock:
+            server.n_requests += 1
+            now = time.time()
+            window = server.window
+            while window and window[0] <= now - 1:
+                window.popleft()
+            rejected = server.rate_limit and len(window) >= server.rate_limit
+            if rejected:
+                server.n_rejected += 1
+            else:
+                window.append(now)
+            remaining = max(server.rate_limit - len(window), 0) if server.rate_limit else None
+            reset = window[0] + 1 if window else now
+
+        headers = {}
+        if server.rate_limit:
+            headers = {'X-RateLimit-Limit': str(server.rate_limit),
+                       'X-RateLimit-Remaining': str(remaining),
+                       'X-RateLimit-Reset': str(int(math.ceil(reset)))}
+
+        time.sleep(server.latency())
+
+        if rejected:
+            headers['Retry-After'] = '1'
+            return self._send(429, {'geocoding': {'errors': ['Rate limit exceeded']}}, headers)
+
+        if server.error_rate and random.random() < server.error_rate:
+            return self._send(503, {'geocoding': {'errors': ['Service unavailable']}}, headers)
+
+        size = server.size or int(params.get('size', 10))
+        self._send(200, server.get_body(path, size, params), headers)
+
+    def _send(self, status, body, headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PeliasStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency='constant:0', rate_limit=0, size=None, error_rate=0):
+        """
+        :param latency: Latency distribution, see parse_latency.
+        :param rate_limit: Requests per second before answering with HTTP 429, 0 disables it.
+        :param size: Number of features per response, defaults to the request's size parameter.
+        :param error_rate: Fraction of requests answered with HTTP 503.
+        """
+        ThreadingHTTPServer.__init__(self, address, StubHandler)
+        self.latency = parse_latency(latency)
+        self.rate_limit = rate_limit
+        self.size = size
+        self.error_rate = error_rate
+
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.n_requests = 0
+        self.n_rejected = 0
+        self._bodies = {}
+
+    def get_body(self, path, size, params):
+        """Response bodies are built once per endpoint and size, serving them is cheap."""
+        key = (path, size)
+        if key not in self._bodies:
+            self._bodies[key] = json.dumps(make_response(size)).encode('utf-8')
+        return self._bodies[key]
+
+
+class StubServer:
+    """Runs the stub in a subprocess, so it doesn't compete for the benchmark's GIL."""
+
+    def __init__(self, latency='constant:0', rate_limit=0, size=None, error_rate=0):
+        self.args = ['--latency', latency,
+                     '--rate-limit', str(rate_limit),
+                     '--error-rate', str(error_rate)]
+        if size:
+            self.args += ['--size', str(size)]
+        self.process = None
+        self.url = None
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, __file__, '--port', '0'] + self.args,
+                                        stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+        # First line is the URL the stub listens on
+        self.url = self.process.stdout.readline().strip()
+        return self.url
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=4000)
+    parser.add_argument('--latency', default='constant:0', help="e.g. constant:0.02, uniform:0.01,0.1, lognormal:0.05,0.5")
+    parser.add_argument('--rate-limit', type=int, default=0, help="requests per second, 0 for unlimited")
+    parser.add_argument('--size', type=int, default=None, help="features per response, default: size parameter")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of HTTP 503 responses")
+    args = parser.parse_args()
+
+    server = PeliasStub(('127.0.0.1', args.port), args.latency, args.rate_limit, args.size, args.error_rate)
+    print("http://{}:{}".format(*server.server_address), flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
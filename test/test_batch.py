@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Tests grouping, concurrency and cancellation of batch requests.
+
+Run with the Python interpreter of a QGIS installation from the repository root:
+
+    python -m unittest discover -s test
+"""
+
+import json
+import os
+import sys
+import time
+import unittest
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'benchmark')))
+
+from stub_server import StubServer
+
+try:
+    from PeliasGeocoding.core import batch, client
+except ImportError:  # needs the Python interpreter of a QGIS installation
+    batch = client = None
+
+
+class Feedback:
+    """Processing feedback which is cancelled after cancel_after seconds."""
+
+    def __init__(self, cancel_after=None):
+        self.cancel_at = None if cancel_after is None else time.time() + cancel_after
+
+    def isCanceled(self):
+        return self.cancel_at is not None and time.time() >= self.cancel_at
+
+    def pushInfo(self, info):
+        pass
+
+    def reportError(self, error, fatalError=False):
+        pass
+
+
+@unittest.skipIf(batch is None, "requires QGIS")
+class TestGroupRequests(unittest.TestCase):
+
+    def test_identical_requests_are_grouped_in_order(self):
+        items = [(1, {'text': 'Berlin', 'size': 1}),
+                 (2, {'text': 'Paris', 'size': 1}),
+                 (3, {'size': 1, 'text': 'Berlin'}),
+                 (4, {'text': 'Berlin', 'size': '1'})]
+
+        self.assertEqual(batch.group_requests(items), [([1, 3, 4], {'text': 'Berlin', 'size': 1}),
+                                                       ([2], {'text': 'Paris', 'size': 1})])
+
+    def test_different_parameters_are_not_grouped(self):
+        items = [(1, {'text': 'Berlin'}), (2, {'text': 'Berlin', 'size': 1})]
+
+        self.assertEqual(len(batch.group_requests(items)), 2)
+
+
+@unittest.skipIf(batch is None, "requires QGIS")
+class TestConcurrency(unittest.TestCase):
+
+    def test_defaults_to_sequential(self):
+        self.assertEqual(batch.get_concurrency({}), 1)
+        self.assertEqual(batch.get_concurrency({'concurrency': None}), 1)
+        self.assertEqual(batch.get_concurrency({'concurrency': 0}), 1)
+
+    def test_capped_by_short_windows(self):
+        self.assertEqual(batch.get_concurrency({'concurrency': 8, 'limit': 5, 'unit': 'second'}), 5)
+        self.assertEqual(batch.get_concurrency({'concurrency': 8, 'limits': [{'limit': 120, 'unit': 'minute'}]}), 2)
+        self.assertEqual(batch.get_concurrency({'concurrency': 8, 'limits': [{'limit': 10, 'unit': 'minute'}]}), 1)
+
+    def test_budgets_dont_cap(self):
+        provider = {'concurrency': 8, 'limits': [{'limit': 100, 'unit': 'hour'}, {'limit': 1000, 'unit': 'day'}]}
+
+        self.assertEqual(batch.get_concurrency(provider), 8)
+
+
+@unittest.skipIf(batch is None, "requires QGIS")
+class TestBatchRequester(unittest.TestCase):
+
+    def get_client(self, url, **provider):
+        provider = dict({'name': 'batch_test', 'base_url': url, 'key': '', 'cache_ttl': 0}, **provider)
+        clnt = client.Client(provider)
+        self.addCleanup(clnt.close)
+        return clnt
+
+    def test_yields_every_result(self):
+        with StubServer(latency='constant:0.01') as server:
+            clnt = self.get_client(server.url, concurrency=4)
+            items = [(i, {'text': str(i)}) for i in range(50)]
+
+            results = {in_id: future.result() for in_id, future in
+                       batch.BatchRequester(clnt, '/search', 4).run(items, Feedback())}
+
+            self.assertEqual(sorted(results), list(range(50)))
+            self.assertTrue(all('features' in result for result in results.values()))
+
+    def test_cancel_stops_requests_waiting_for_rate_limits(self):
+        with StubServer() as server:
+            clnt = self.get_client(server.url, concurrency=2, limits=[{'limit': 6, 'unit': 'minute'}])
+            items = [(i, {'text': str(i)}) for i in range(40)]
+
+            start = time.time()
+            for in_id, future in batch.BatchRequester(clnt, '/search', 2).run(items, Feedback(cancel_after=1)):
+                future.result()
+
+            # Without cancellation the workers would wait minutes for the rate limits
+            self.assertLess(time.time() - start, 5)
+            with urllib.request.urlopen(server.url + '/__stats') as response:
+                self.assertLessEqual(json.load(response)['requests'], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Tests expiry and eviction of the persistent response cache.
+
+Run from the repository root:
+
+    python -m unittest discover -s test
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import urllib.request
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'benchmark')))
+
+from PeliasGeocoding.core import cache
+from stub_server import StubServer
+
+try:
+    from PeliasGeocoding.core import client
+except ImportError:  # needs the Python interpreter of a QGIS installation
+    client = None
+
+FOUND = {'geocoding': {}, 'features': [{'type': 'Feature'}]}
+NOT_FOUND = {'geocoding': {}, 'features': []}
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(cache, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.cache = cache.ResponseCache(os.path.join(tmp_dir, 'cache.sqlite'), max_entries=3)
+        self.addCleanup(self.cache._conn.close)
+
+    def test_response_expires_after_ttl(self):
+        self.cache.set('key', 'provider', FOUND)
+
+        self.clock.sleep(100)
+        self.assertEqual(self.cache.get('key', ttl=100, negative_ttl=10), FOUND)
+        self.clock.sleep(1)
+        self.assertIsNone(self.cache.get('key', ttl=100, negative_ttl=10))
+
+    def test_response_without_results_expires_after_negative_ttl(self):
+        self.cache.set('key', 'provider', NOT_FOUND)
+
+        self.clock.sleep(10)
+        self.assertEqual(self.cache.get('key', ttl=100, negative_ttl=10), NOT_FOUND)
+        self.clock.sleep(1)
+        self.assertIsNone(self.cache.get('key', ttl=100, negative_ttl=10))
+
+    def test_expired_response_is_deleted(self):
+        self.cache.set('key', 'provider', FOUND)
+        self.clock.sleep(101)
+        self.cache.get('key', ttl=100, negative_ttl=10)
+
+        # A longer TTL doesn't bring it back
+        self.assertIsNone(self.cache.get('key', ttl=1000, negative_ttl=10))
+
+    def test_least_recently_used_responses_are_evicted(self):
+        with mock.patch.object(cache, '_EVICT_EVERY', 5):
+            for key in 'abcd':
+                self.cache.set(key, 'provider', FOUND)
+                self.clock.sleep(1)
+            # Reading 'a' makes 'b' the least recently used response
+            self.cache.get('a', ttl=100, negative_ttl=10)
+            self.clock.sleep(1)
+            self.cache.set('e', 'provider', FOUND)
+
+        cached = [key for key in 'abcde' if self.cache.get(key, ttl=100, negative_ttl=10) is not None]
+        self.assertEqual(cached, ['a', 'd', 'e'])
+
+    def test_clear_by_provider(self):
+        self.cache.set('a', 'provider', FOUND)
+        self.cache.set('b', 'other', FOUND)
+
+        self.cache.clear('provider')
+        self.assertIsNone(self.cache.get('a', ttl=100, negative_ttl=10))
+        self.assertEqual(self.cache.get('b', ttl=100, negative_ttl=10), FOUND)
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('b', ttl=100, negative_ttl=10))
+
+
+@unittest.skipIf(client is None, "requires QGIS")
+class TestClientCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        response_cache = cache.ResponseCache(os.path.join(tmp_dir, 'cache.sqlite'))
+        self.addCleanup(response_cache._conn.close)
+        patcher = mock.patch.object(cache, 'get_cache', lambda: response_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_negative_ttl_defaults_to_a_day(self):
+        for value, days in ((None, 1), ('', 1), ('never', 1), (0, 0), ('0.5', 0.5)):
+            provider = {'name': 'cache_test', 'cache_negative_ttl': value}
+            self.assertEqual(client.Client._get_cache_negative_ttl(provider), days, value)
+        self.assertEqual(client.Client._get_cache_negative_ttl({'name': 'cache_test'}), 1)
+
+    def test_repeated_request_is_answered_from_cache(self):
+        with StubServer() as server:
+            clnt = client.Client({'name': 'cache_test', 'base_url': server.url, 'key': '', 'cache_ttl': 1})
+            self.addCleanup(clnt.close)
+
+            first = clnt.request('/search', {'text': 'Berlin'})
+            second = clnt.request('/search', {'text': 'Berlin'})
+
+            self.assertEqual(first, second)
+            with urllib.request.urlopen(server.url + '/__stats') as response:
+                self.assertEqual(json.load(response)['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
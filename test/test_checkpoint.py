@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Tests resuming batch jobs from their checkpoint and the incremental result store.
+
+Run from the repository root:
+
+    python -m unittest discover -s test
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PeliasGeocoding.core import checkpoint
+
+ITEMS = [(1, {'text': 'Berlin'}), (2, {'text': 'Paris'}), (3, {'text': 'Berlin'})]
+
+
+def response(text):
+    return {'geocoding': {}, 'features': [{'properties': {'label': text}}]}
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, 'checkpoints', 'job.sqlite')
+
+    def run_job(self, items, n_completed, resume=True):
+        """Journals the responses of the first n_completed pending items, as if the job was cancelled then."""
+        journal = checkpoint.Checkpoint(self.path, resume=resume)
+        pending, done = journal.split(items)
+        replayed = list(journal.replay(done))
+        for in_id, params in pending[:n_completed]:
+            journal.add([in_id], 'provider', response(params['text']))
+        journal.close()
+        return pending, replayed
+
+    def test_resume_requests_only_remaining_items(self):
+        self.run_job(ITEMS, 2)
+
+        pending, replayed = self.run_job(ITEMS, 0)
+        self.assertEqual(pending, ITEMS[2:])
+        self.assertEqual(replayed, [(1, 'provider', response('Berlin')),
+                                    (2, 'provider', response('Paris'))])
+
+    def test_items_sharing_a_request_are_journaled_together(self):
+        journal = checkpoint.Checkpoint(self.path)
+        journal.add([1, 3], 'provider', response('Berlin'))
+        journal.close()
+
+        pending, replayed = self.run_job(ITEMS, 0)
+        self.assertEqual(pending, ITEMS[1:2])
+        self.assertEqual(replayed, [(1, 'provider', response('Berlin')),
+                                    (3, 'provider', response('Berlin'))])
+
+    def test_without_resume_the_journal_starts_empty(self):
+        self.run_job(ITEMS, 2)
+
+        pending, replayed = self.run_job(ITEMS, 0, resume=False)
+        self.assertEqual(pending, ITEMS)
+        self.assertEqual(replayed, [])
+
+    def test_complete_deletes_the_journal(self):
+        journal = checkpoint.Checkpoint(self.path)
+        journal.add([1], 'provider', response('Berlin'))
+        journal.close()
+        journal.complete()
+
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_path_depends_on_settings_only(self):
+        settings = [('INPUT', 'layer.gpkg'), ('FIELD', 'address')]
+
+        self.assertEqual(checkpoint.get_path('search', settings), checkpoint.get_path('search', settings[::-1]))
+        self.assertNotEqual(checkpoint.get_path('search', settings),
+                            checkpoint.get_path('search', settings + [('SIZE', '2')]))
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, 'checkpoints', 'job.sqlite')
+
+    def run_job(self, items, signature=(('provider', 'pelias'),)):
+        """Requests the pending items and returns them with the stored ones."""
+        store = checkpoint.ResultStore(self.path, list(signature))
+        pending, done = store.split(items)
+        replayed = [in_id for in_id, _, _ in store.replay(done)]
+        for in_id, params in pending:
+            store.add([in_id], 'provider', response(params['text']))
+        store.close()
+        store.complete()
+        return pending, replayed
+
+    def count(self, table):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_only_new_and_changed_items_are_requested(self):
+        self.run_job(ITEMS)
+
+        changed = [(1, {'text': 'Berlin'}), (2, {'text': 'London'}), (3, {'text': 'Berlin'}), (4, {'text': 'Rome'})]
+        pending, replayed = self.run_job(changed)
+        self.assertEqual(pending, [changed[1], changed[3]])
+        self.assertEqual(replayed, [1, 3])
+
+    def test_changed_signature_requests_all_items(self):
+        self.run_job(ITEMS)
+
+        pending, replayed = self.run_job(ITEMS, signature=(('provider', 'other'),))
+        self.assertEqual(pending, ITEMS)
+        self.assertEqual(replayed, [])
+
+    def test_results_of_removed_items_are_deleted(self):
+        self.run_job(ITEMS)
+        self.assertEqual(self.count('responses'), 3)
+
+        pending, replayed = self.run_job(ITEMS[:1])
+        self.assertEqual(pending, [])
+        self.assertEqual(replayed, [1])
+        self.assertEqual(self.count('results'), 1)
+        self.assertEqual(self.count('responses'), 1)
+
+    def test_replaced_responses_are_deleted(self):
+        self.run_job(ITEMS)
+        self.run_job([(2, {'text': 'London'})] + ITEMS[::2])
+
+        self.assertEqual(self.count('responses'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Tests the state changes of the per provider circuit breaker.
+
+Run with the Python interpreter of a QGIS installation from the repository root:
+
+    python -m unittest discover -s test
+"""
+
+import json
+import os
+import sys
+import unittest
+import urllib.request
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'benchmark')))
+
+from PeliasGeocoding.utils import exceptions
+from stub_server import StubServer
+
+try:
+    from PeliasGeocoding.core import circuitbreaker, client
+except ImportError:  # needs the Python interpreter of a QGIS installation
+    circuitbreaker = client = None
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@unittest.skipIf(circuitbreaker is None, "requires QGIS")
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(circuitbreaker, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.breaker = circuitbreaker.CircuitBreaker(threshold=3, cooldown=30, probe_interval=5)
+
+    def fail(self, n, error=None):
+        for _ in range(n):
+            self.breaker.on_failure(error or exceptions.Timeout())
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, circuitbreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+        self.fail(1)
+        self.assertEqual(self.breaker.state, circuitbreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_in(), 30)
+
+    def test_success_resets_the_failures(self):
+        self.fail(2)
+        self.breaker.on_success()
+        self.fail(2)
+
+        self.assertEqual(self.breaker.state, circuitbreaker.CLOSED)
+
+    def test_client_errors_are_ignored(self):
+        for error in (exceptions.ApiError('400'), exceptions.InvalidKey('403', None),
+                      exceptions.OverQueryLimit('429'), exceptions.GenericServerError('404')):
+            self.fail(3, error)
+
+        self.assertEqual(self.breaker.state, circuitbreaker.CLOSED)
+
+    def test_half_open_after_cooldown_lets_single_probes_through(self):
+        self.fail(3)
+        self.clock.sleep(30)
+
+        self.assertEqual(self.breaker.state, circuitbreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_in(), 5)
+
+        self.clock.sleep(5)
+        self.assertTrue(self.breaker.allow())
+
+    def test_successful_probe_closes(self):
+        self.fail(3)
+        self.clock.sleep(30)
+        self.breaker.allow()
+        self.breaker.on_success()
+
+        self.assertEqual(self.breaker.state, circuitbreaker.CLOSED)
+        self.assertEqual(self.breaker.unavailable_for(), 0)
+
+    def test_failed_probe_opens_again(self):
+        self.fail(3)
+        self.clock.sleep(30)
+        self.breaker.allow()
+        self.fail(1)
+
+        self.assertEqual(self.breaker.state, circuitbreaker.OPEN)
+        # The outage is measured from the first time the circuit opened
+        self.assertEqual(self.breaker.unavailable_for(), 30)
+
+    def test_threshold_0_disables(self):
+        self.breaker = circuitbreaker.CircuitBreaker(threshold=0)
+        self.fail(100)
+
+        self.assertTrue(self.breaker.allow())
+
+
+@unittest.skipIf(client is None, "requires QGIS")
+class TestClientCircuitBreaker(unittest.TestCase):
+
+    def test_requests_fail_fast_while_provider_is_down(self):
+        with StubServer(error_rate=1) as server:
+            clnt = client.Client({'name': 'circuit_test', 'base_url': server.url, 'key': '', 'cache_ttl': 0,
+                                  'retry': {'backoff': 0.01},
+                                  'circuit_breaker': {'threshold': 2}})
+            self.addCleanup(clnt.close)
+
+            with self.assertRaises(exceptions.ProviderUnavailable):
+                clnt.request('/search', {'text': 'Berlin'})
+            with self.assertRaises(exceptions.ProviderUnavailable):
+                clnt.request('/search', {'text': 'Paris'})
+
+            with urllib.request.urlopen(server.url + '/__stats') as response:
+                self.assertEqual(json.load(response)['requests'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
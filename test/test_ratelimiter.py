@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Tests pacing by the quota of rate limit headers.
+
+Run from the repository root:
+
+    python -m unittest discover -s test
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PeliasGeocoding.core import ratelimiter
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestQuota(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(ratelimiter, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Locally allowed more than the provider's quota of 10 per second
+        self.limiter = ratelimiter.RateLimiter([(100, 'second')])
+
+    def send(self, n, remaining, reset_at):
+        """Sends n requests 10 ms apart, the provider answering each right away."""
+        for _ in range(n):
+            self.assertEqual(self.limiter.reserve(), 0)
+            self.limiter.update_quota(remaining, reset_at - self.clock.now, 10, sent_at=self.clock.now)
+            remaining -= 1
+            self.clock.sleep(0.01)
+
+    def test_exhausted_quota_waits_for_reset(self):
+        reset_at = self.clock.now + 1
+        self.send(10, 9, reset_at)
+
+        self.assertAlmostEqual(self.limiter.peek(), reset_at - self.clock.now)
+
+    def test_quota_refills_every_second(self):
+        for second in range(5):
+            reset_at = self.clock.now + 1
+            self.send(10, 9, reset_at)
+            self.clock.now = reset_at
+
+            # The next window's first response raises the quota again
+            self.assertEqual(self.limiter.peek(), 0)
+
+    def test_in_flight_requests_counted_once(self):
+        reset_at = self.clock.now + 1
+        sent_at = self.clock.now
+        for _ in range(5):
+            self.limiter.reserve()
+            self.clock.sleep(0.01)
+        # The first request's response, the 4 others are still in flight
+        self.limiter.update_quota(9, reset_at - self.clock.now, 10, sent_at=sent_at)
+
+        self.assertEqual(self.limiter._get_quota_remaining(), 5)
+        self.limiter.reserve()
+        self.assertEqual(self.limiter._get_quota_remaining(), 4)
+
+    def test_late_response_of_same_window_keeps_quota(self):
+        reset_at = self.clock.now + 1
+        sent_at = self.clock.now
+        self.send(5, 9, reset_at)
+
+        # A response overtaken by the later ones reports more remaining requests
+        self.limiter.update_quota(9, reset_at - self.clock.now, 10, sent_at=sent_at)
+
+        self.assertEqual(self.limiter._get_quota_remaining(), 5)
+
+
+
+class TestBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock(3600.0 * 24 * 365)
+        patcher = mock.patch.object(ratelimiter, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        patcher = mock.patch.object(ratelimiter, 'RATE_LIMITS', os.path.join(tmp_dir, 'ratelimits.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_exhausted_budget_waits_for_oldest_bucket(self):
+        limiter = ratelimiter.RateLimiter([(3, 'hour')])
+        start = self.clock.now
+        for _ in range(3):
+            self.assertEqual(limiter.acquire(), 0)
+            self.clock.sleep(10)
+
+        # The first minute's requests leave the window with the minute
+        self.assertAlmostEqual(limiter.peek(), start + 60 + 3600 - self.clock.now)
+
+    def test_large_budget_keeps_counts_per_bucket(self):
+        limiter = ratelimiter.RateLimiter([(10000000, 'day')])
+        for _ in range(10000):
+            limiter.reserve()
+            self.clock.sleep(0.1)
+
+        window = limiter._windows[0]
+        self.assertEqual(len(window.get_state(self.clock.now)), 17)
+        self.assertEqual(sum(count for _, count in window.get_state(self.clock.now)), 10000)
+
+    def test_budget_survives_restart(self):
+        limiter = ratelimiter.RateLimiter([(1, 'second'), (5, 'day')], name='provider')
+        for _ in range(5):
+            limiter.acquire()
+        limiter.save()
+
+        restarted = ratelimiter.RateLimiter([(1, 'second'), (5, 'day')], name='provider')
+        self.assertGreater(restarted.peek(), 86000)
+
+    def test_send_times_of_earlier_versions_are_restored(self):
+        with open(ratelimiter.RATE_LIMITS, 'w') as f:
+            json.dump({'provider': {'86400': [self.clock.now - 10, self.clock.now - 5]}}, f)
+
+        limiter = ratelimiter.RateLimiter([(2, 'day')], name='provider')
+        self.assertGreater(limiter.peek(), 86000)
+
+
+if __name__ == '__main__':
+    unittest.main()
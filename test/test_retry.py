@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Tests the retry policy's backoff and the parsing of Retry-After headers.
+
+Run from the repository root:
+
+    python -m unittest discover -s test
+"""
+
+import json
+import os
+import sys
+import unittest
+import urllib.request
+from email.utils import formatdate
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'benchmark')))
+
+from PeliasGeocoding.core import retry
+from PeliasGeocoding.utils import exceptions
+from stub_server import StubServer
+
+try:
+    from PeliasGeocoding.core import client
+except ImportError:  # needs the Python interpreter of a QGIS installation
+    client = None
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_retriable_errors(self):
+        for error in (exceptions.Timeout(), exceptions.NetworkError(),
+                      exceptions.OverQueryLimit('429'), exceptions.GenericServerError('503')):
+            self.assertTrue(retry.RetryPolicy.is_retriable(error), error)
+
+    def test_permanent_errors(self):
+        for error in (exceptions.ApiError('400'), exceptions.InvalidKey('403', None),
+                      exceptions.GenericServerError('500'), exceptions.GenericServerError('404'),
+                      exceptions.ProviderUnavailable(), ValueError()):
+            self.assertFalse(retry.RetryPolicy.is_retriable(error), error)
+
+    def test_unavailable_provider_is_transient_for_batch_jobs(self):
+        self.assertTrue(retry.is_transient(exceptions.ProviderUnavailable()))
+        self.assertFalse(retry.is_transient(exceptions.ApiError('400')))
+
+    def test_delay_doubles_up_to_max_backoff(self):
+        policy = retry.RetryPolicy(backoff=0.5, max_backoff=3)
+        with mock.patch.object(retry.random, 'uniform', lambda low, high: high):
+            delays = [policy.get_delay(attempt) for attempt in range(1, 6)]
+
+        self.assertEqual(delays, [0.5, 1, 2, 3, 3])
+
+    def test_delay_is_jittered(self):
+        policy = retry.RetryPolicy(backoff=1, max_backoff=30)
+        delays = [policy.get_delay(3) for _ in range(100)]
+
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_retry_after_takes_precedence(self):
+        policy = retry.RetryPolicy(backoff=0.5, max_backoff=3)
+
+        self.assertEqual(policy.get_delay(1, retry_after=10), 10)
+
+    def test_from_provider(self):
+        policy = retry.RetryPolicy.from_provider({'retry': {'max_retries': 2, 'backoff': 0.1}})
+        self.assertEqual((policy.max_retries, policy.backoff, policy.max_backoff), (2, 0.1, 30))
+
+        policy = retry.RetryPolicy.from_provider({'retry': None})
+        self.assertEqual(policy.max_retries, 5)
+
+
+class TestRetryAfter(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(retry.parse_retry_after({'Retry-After': '120'}), 120)
+        self.assertEqual(retry.parse_retry_after({'Retry-After': '-5'}), 0)
+
+    def test_http_date(self):
+        now = 1500000000.0
+        headers = {'Retry-After': formatdate(now + 30, usegmt=True)}
+        with mock.patch.object(retry.time, 'time', lambda: now):
+            self.assertAlmostEqual(retry.parse_retry_after(headers), 30)
+
+    def test_date_in_the_past(self):
+        headers = {'Retry-After': formatdate(0, usegmt=True)}
+
+        self.assertEqual(retry.parse_retry_after(headers), 0)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(retry.parse_retry_after({}))
+        self.assertIsNone(retry.parse_retry_after({'Retry-After': ''}))
+        self.assertIsNone(retry.parse_retry_after({'Retry-After': 'soon'}))
+
+
+@unittest.skipIf(client is None, "requires QGIS")
+class TestClientRetries(unittest.TestCase):
+
+    def get_client(self, url, **provider):
+        provider = dict({'name': 'retry_test', 'base_url': url, 'key': '', 'cache_ttl': 0}, **provider)
+        clnt = client.Client(provider)
+        self.addCleanup(clnt.close)
+        return clnt
+
+    @staticmethod
+    def n_requests(server):
+        with urllib.request.urlopen(server.url + '/__stats') as response:
+            return json.load(response)['requests']
+
+    def test_server_errors_are_retried_up_to_max_retries(self):
+        with StubServer(error_rate=1) as server:
+            clnt = self.get_client(server.url, retry={'max_retries': 2, 'backoff': 0.01})
+            with self.assertRaises(exceptions.GenericServerError):
+                clnt.request('/search', {'text': 'Berlin'})
+
+            self.assertEqual(self.n_requests(server), 3)
+
+    def test_rate_limited_requests_wait_instead_of_failing(self):
+        with StubServer(rate_limit=1) as server:
+            clnt = self.get_client(server.url, retry={'max_retries': 0})
+            clnt.request('/search', {'text': 'Berlin'})
+            # HTTP 429 doesn't count as retry, the request waits for the next second
+            result = clnt.request('/search', {'text': 'Paris'})
+
+            self.assertIn('features', result)
+
+if __name__ == '__main__':
+    unittest.main()